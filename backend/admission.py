@@ -0,0 +1,311 @@
+"""
+Admission control for the expensive endpoints.
+
+Two mechanisms, both kept in Redis so every uvicorn worker shares them:
+
+- Per-user token buckets (`take`). A request spends tokens in proportion
+  to the work it causes: one per chat question, and for uploads one per
+  MiB of PDF or UPLOAD_AUDIO_COST_PER_MINUTE per minute of audio. An
+  empty bucket is a 429 with Retry-After set to when it will hold enough.
+- Global slots (`acquire`/`release`, `slot`). These cap LLM calls and
+  queued or running transcriptions across all workers. A full pool is a
+  503 with Retry-After. Slots are leases, so a crashed worker's slots
+  expire on their own; a holder that needs one for longer than the lease
+  renews it in the background (`hold`) until it gives it back.
+
+Both are single Lua scripts timed by the Redis clock. When Redis is
+unset or unreachable, every worker enforces the same limits in-process
+instead. Each worker then allows the full amount, so the cluster-wide
+ceiling is multiplied by the worker count, but no limit is ever dropped.
+"""
+import asyncio
+import math
+import time
+import uuid
+import wave
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, HTTPException, Request
+
+import metrics
+from utils import Settings, get_current_user
+
+settings = Settings()
+
+MIB = 1024 * 1024
+LOCAL_BUCKETS_MAX = 10000
+
+BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local capacity, rate, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+SLOT_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then return 0 end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])) + 1)
+return 1
+"""
+
+# Extends a lease that has not yet run out; 0 if it is gone.
+RENEW_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local expiry = redis.call('ZSCORE', KEYS[1], ARGV[2])
+if not expiry or tonumber(expiry) <= now then return 0 end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[1]), ARGV[2])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 1)
+return 1
+"""
+
+BUCKETS = {
+    # name: (size setting, refill-per-second setting)
+    "chat": ("CHAT_BUCKET_SIZE", "CHAT_REFILL_PER_SECOND"),
+    "upload": ("UPLOAD_BUCKET_SIZE", "UPLOAD_REFILL_PER_SECOND"),
+}
+
+SLOTS = {
+    # name: (limit setting, lease seconds, Retry-After seconds when full)
+    "llm": ("LLM_GLOBAL_SLOTS", 120, 5),
+    # Held from upload through queueing and transcription, renewed all along.
+    "transcription": ("TRANSCRIBE_GLOBAL_SLOTS", 600, 30),
+}
+
+
+class LocalBuckets:
+    """In-process token buckets, used while Redis is unavailable."""
+
+    def __init__(self, maxsize: int = LOCAL_BUCKETS_MAX):
+        self.maxsize = maxsize
+        self.state = OrderedDict()  # key -> (tokens, monotonic timestamp)
+
+    def take(self, key: str, capacity: float, rate: float, cost: float) -> float:
+        now = time.monotonic()
+        tokens, ts = self.state.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - ts) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self.state[key] = (tokens, now)
+        if len(self.state) > self.maxsize:
+            self.state.popitem(last=False)  # least recently used; it refills to full anyway
+        return wait
+
+
+class LocalSlots:
+    """In-process slot leases, used while Redis is unavailable."""
+
+    def __init__(self):
+        self.leases = {}  # name -> {token: expiry}
+
+    def acquire(self, name: str, limit: int, lease: float, token: str) -> bool:
+        now = time.monotonic()
+        held = self.leases.setdefault(name, {})
+        for stale in [t for t, expiry in held.items() if expiry <= now]:
+            del held[stale]
+        if len(held) >= limit:
+            return False
+        held[token] = now + lease
+        return True
+
+    def renew(self, name: str, lease: float, token: str) -> bool:
+        held = self.leases.get(name, {})
+        now = time.monotonic()
+        if held.get(token, now) <= now:
+            return False
+        held[token] = now + lease
+        return True
+
+    def release(self, name: str, token: str):
+        self.leases.get(name, {}).pop(token, None)
+
+
+local_buckets = LocalBuckets()
+local_slots = LocalSlots()
+_renewals = {}  # lease token -> task renewing it until release
+_degraded = False
+
+
+def _redis_failed(e: Exception):
+    global _degraded
+    if not _degraded:
+        print(f"Admission control: Redis unavailable ({e!r}); enforcing limits per worker")
+    _degraded = True
+
+
+def _redis_ok():
+    global _degraded
+    if _degraded:
+        print("Admission control: Redis is back")
+    _degraded = False
+
+
+async def take(redis, bucket: str, user: str, cost: float = 1):
+    """
+    Spend `cost` tokens from the user's bucket or raise 429. A cost above
+    the bucket size is clamped to it, so a large upload waits for a full
+    bucket instead of being refused forever.
+    """
+    if not settings.ADMISSION_CONTROL:
+        return
+    size_setting, rate_setting = BUCKETS[bucket]
+    capacity = float(getattr(settings, size_setting))
+    rate = float(getattr(settings, rate_setting))
+    cost = min(float(cost), capacity)
+    key = f"admission:bucket:{bucket}:{user}"
+
+    wait = None
+    if redis is not None:
+        try:
+            wait = float(await redis.register_script(BUCKET_SCRIPT)(keys=[key], args=[capacity, rate, cost]))
+            _redis_ok()
+        except Exception as e:
+            _redis_failed(e)
+    if wait is None:
+        wait = local_buckets.take(key, capacity, rate, cost)
+
+    if wait > 0:
+        metrics.rejected(bucket)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many {bucket} requests, try again in {math.ceil(wait)}s.",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+def limit(bucket: str, cost: float = 1):
+    """Route dependency spending a fixed `cost` from the caller's bucket."""
+
+    async def dependency(request: Request, user: dict = Depends(get_current_user)):
+        await take(getattr(request.app, "redis", None), bucket, user["email"], cost)
+
+    return dependency
+
+
+async def acquire(redis, name: str, wait: bool = False):
+    """
+    Take one of the global `name` slots and return its lease, or raise 503
+    when all are in use (with `wait`, poll until one frees up instead).
+    Give it back with `release`.
+    """
+    if not settings.ADMISSION_CONTROL:
+        return None
+    limit_setting, lease, retry_after = SLOTS[name]
+    while True:
+        held = await _try_acquire(redis, name, getattr(settings, limit_setting), lease)
+        if held:
+            return held
+        if not wait:
+            metrics.rejected(name)
+            raise HTTPException(
+                status_code=503,
+                detail=f"All {name} slots are busy, try again shortly.",
+                headers={"Retry-After": str(retry_after)},
+            )
+        await asyncio.sleep(settings.SLOT_POLL_SECONDS)
+
+
+async def _try_acquire(redis, name: str, limit: int, lease: float):
+    token = uuid.uuid4().hex
+    if redis is not None:
+        try:
+            granted = await redis.register_script(SLOT_SCRIPT)(
+                keys=[f"admission:slots:{name}"], args=[limit, lease, token]
+            )
+            _redis_ok()
+            return ("redis", name, token) if granted else None
+        except Exception as e:
+            _redis_failed(e)
+    return ("local", name, token) if local_slots.acquire(name, limit, lease, token) else None
+
+
+def hold(redis, lease):
+    """
+    Keep `lease` alive, renewing it every third of its term, until it is
+    released: for work that may outlast the lease (a long queue wait or
+    a multi-hour recording). If the process dies the renewals stop with
+    it, and the slot still frees up one term later. Returns the lease.
+    """
+    if lease is not None and lease[2] not in _renewals:
+        _renewals[lease[2]] = asyncio.create_task(_keep_alive(redis, lease))
+    return lease
+
+
+async def _keep_alive(redis, lease):
+    backend, name, token = lease
+    term = SLOTS[name][1]
+    while True:
+        await asyncio.sleep(term / 3)
+        if backend == "local":
+            alive = local_slots.renew(name, term, token)
+        else:
+            try:
+                alive = await redis.register_script(RENEW_SCRIPT)(keys=[f"admission:slots:{name}"], args=[term, token])
+            except Exception as e:
+                print(f"Could not renew {name} slot: {e!r}")
+                continue
+        if not alive:
+            print(f"{name} slot lease ran out before it could be renewed")
+            return
+
+
+async def release(redis, lease):
+    if lease is None:
+        return
+    backend, name, token = lease
+    renewal = _renewals.pop(token, None)
+    if renewal:
+        renewal.cancel()
+    if backend == "local":
+        local_slots.release(name, token)
+        return
+    try:
+        await redis.zrem(f"admission:slots:{name}", token)
+    except Exception as e:
+        # The lease runs out on its own.
+        print(f"Could not release {name} slot: {e!r}")
+
+
+@asynccontextmanager
+async def slot(redis, name: str, wait: bool = False):
+    """Hold one of the `name` slots for the body, however long it takes."""
+    lease = hold(redis, await acquire(redis, name, wait))
+    try:
+        yield lease
+    finally:
+        await release(redis, lease)
+
+
+def upload_cost(path: str, ext: str, size: int, audio: bool) -> float:
+    """
+    Tokens an upload costs: its size in MiB for a PDF, and for audio
+    UPLOAD_AUDIO_COST_PER_MINUTE per minute. The duration comes from the
+    header of a WAV file. Other formats are estimated at a minute per MiB,
+    which is about 128 kbit/s.
+    """
+    if not audio:
+        return max(size / MIB, 1.0)
+    minutes = size / MIB
+    if ext == ".wav":
+        try:
+            with wave.open(path, "rb") as w:
+                minutes = w.getnframes() / w.getframerate() / 60
+        except (wave.Error, EOFError, OSError, ZeroDivisionError):
+            pass
+    return max(minutes, 1 / 60) * settings.UPLOAD_AUDIO_COST_PER_MINUTE
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import re
+
+import numpy as np
+
+import keyword_index
+import retrieval
+from utils import Settings
+
+settings = Settings()
+
+PREFIX = "answers"
+STATS_KEY = f"{PREFIX}:stats"
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+# Stopwords to the keyword index, but they flip what is being asked ("n't" normalizes to "t").
+NEGATIONS = frozenset({"no", "not", "nor", "never", "without", "cannot", "t"})
+
+
+def normalize(question: str) -> str:
+    """Case, punctuation and whitespace do not change what is being asked."""
+    return " ".join(_PUNCT_RE.sub(" ", question.lower()).split())
+
+
+def _key(content: str, normalized: str) -> str:
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    return f"{PREFIX}:{content}:{digest}"
+
+
+def terms(normalized: str) -> str:
+    """
+    The words a near-duplicate must share exactly: content words, numbers
+    and negations, in any order. A high cosine alone also matches
+    "fiscal year 2020" with "2021" or a clause with and without "not".
+    """
+    words = set(keyword_index.tokenize(normalized))
+    words.update(NEGATIONS.intersection(normalized.split()))
+    return " ".join(sorted(words))
+
+
+def _vectors_key(content: str, normalized: str) -> str:
+    # Only questions with the same terms are ever compared by embedding.
+    digest = hashlib.sha1(terms(normalized).encode("utf-8")).hexdigest()
+    return f"{PREFIX}:{content}:vectors:{digest}"
+
+
+def _encode(vector: np.ndarray) -> str:
+    # The shared Redis client decodes responses as text, so store base64.
+    return base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")
+
+
+def _decode(value: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+
+
+async def get(redis, content: str, question: str):
+    """
+    Look up a cached answer for (content hash, question).
+    Returns (answer or None, "hit" | "near_hit" | "miss").
+    """
+    normalized = normalize(question)
+    key = _key(content, normalized)
+    answer = await redis.get(key)
+    if answer is not None:
+        await redis.hincrby(STATS_KEY, "hits", 1)
+        return answer, "hit"
+
+    if settings.ANSWER_CACHE_SEMANTIC and normalized:
+        stored = await redis.hgetall(_vectors_key(content, normalized))
+        if stored:
+            keys = list(stored)
+            matrix = np.stack([_decode(stored[k]) for k in keys])
+            query = retrieval.embed([normalized], settings.ANSWER_CACHE_EMBED_DIM)[0]
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= settings.ANSWER_CACHE_SIMILARITY:
+                answer = await redis.get(keys[best])
+                if answer is not None:
+                    await redis.hincrby(STATS_KEY, "near_hits", 1)
+                    return answer, "near_hit"
+                await redis.hdel(_vectors_key(content, normalized), keys[best])  # answer expired
+
+    await redis.hincrby(STATS_KEY, "misses", 1)
+    return None, "miss"
+
+
+async def put(redis, content: str, question: str, answer: str):
+    normalized = normalize(question)
+    key = _key(content, normalized)
+    ttl = settings.ANSWER_CACHE_TTL
+    await redis.set(key, answer, ex=ttl)
+
+    if settings.ANSWER_CACHE_SEMANTIC and normalized:
+        vectors = _vectors_key(content, normalized)
+        if await redis.hlen(vectors) < settings.ANSWER_CACHE_MAX_QUESTIONS:
+            vector = retrieval.embed([normalized], settings.ANSWER_CACHE_EMBED_DIM)[0]
+            await redis.hset(vectors, key, _encode(vector))
+            await redis.expire(vectors, ttl)
+
+
+async def stats(redis) -> dict:
+    counters = await redis.hgetall(STATS_KEY)
+    hits = int(counters.get("hits", 0))
+    near_hits = int(counters.get("near_hits", 0))
+    misses = int(counters.get("misses", 0))
+    total = hits + near_hits + misses
+    return {
+        "hits": hits,
+        "near_hits": near_hits,
+        "misses": misses,
+        "hit_rate": round((hits + near_hits) / total, 4) if total else 0.0,
+    }
@@ -0,0 +1,81 @@
+"""
+Archive uploads for POST /files/batch: a zip or tar (optionally gzip,
+bzip2 or xz compressed) is unpacked member by member into temp files,
+each hashed on the way like a regular upload. Nothing is extracted by
+name, so member paths cannot escape the temp directory.
+"""
+import os
+import tarfile
+import zipfile
+import zlib
+
+import ingest
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class TooLarge(ValueError):
+    """The archive unpacks to more than the batch allows."""
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _members(path: str):
+    """Yield (name, size, opener) for every regular file in the archive."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: zf.open(info)
+        return
+    try:
+        tf = tarfile.open(path)
+    except tarfile.TarError:
+        raise ValueError("not a zip or tar archive")
+    with tf:
+        for member in tf:
+            if member.isfile():
+                yield member.name, member.size, lambda member=member: tf.extractfile(member)
+
+
+def expand(path: str, supported, budget: int, max_files: int):
+    """
+    Spool the archive's members whose extension is in `supported`.
+    Returns (spooled, skipped): spooled is a list of dicts (filename, ext,
+    path, sha256, size), skipped the names of unsupported members.
+    Raises TooLarge when the members add up to more than `budget` bytes
+    or there are more than `max_files` of them (skipped ones included),
+    however small the archive itself is, and ValueError when it cannot be
+    read. Both limits are checked member by member, so an archive of a
+    million empty files stops at the first one over.
+    Blocking: run it off the event loop.
+    """
+    spooled, skipped = [], []
+    try:
+        for name, size, opener in _members(path):
+            if len(spooled) + len(skipped) >= max_files:
+                raise TooLarge(f"archive has more than {max_files} files")
+            filename = os.path.basename(name)
+            ext = os.path.splitext(filename)[1].lower()
+            if filename.startswith(".") or ext not in supported:
+                skipped.append(filename or name)
+                continue
+            if size > budget:
+                raise TooLarge("archive unpacks beyond the batch size limit")
+            with opener() as stream:
+                try:
+                    tmp_path, sha256, written = ingest.spool_stream(stream, ext, max_bytes=budget)
+                except ValueError:
+                    # The header understated the size.
+                    raise TooLarge("archive unpacks beyond the batch size limit")
+            budget -= written
+            spooled.append({"filename": filename, "ext": ext, "path": tmp_path, "sha256": sha256, "size": written})
+    except BaseException as e:
+        for item in spooled:
+            os.remove(item["path"])
+        if isinstance(e, (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError)):
+            raise ValueError(f"corrupt archive ({e})")
+        raise
+    return spooled, skipped
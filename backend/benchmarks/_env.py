@@ -0,0 +1,19 @@
+"""
+Benchmarks import app modules, which read `Settings` at import time.
+Provide harmless defaults so they run without a .env file.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+for key, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "MONGO_DB": "bench",
+    "JWT_SECRET": "bench",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "GROQ_API_KEY": "",
+}.items():
+    os.environ.setdefault(key, value)
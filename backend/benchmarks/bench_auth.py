@@ -0,0 +1,98 @@
+"""
+Login throughput and event-loop health: Argon2 verification inline in
+the async handler (the old `login_for_access_token`) vs. on the bounded
+hashing pool, plus JWT verification per request vs. the token cache.
+
+    python -m benchmarks.bench_auth
+    python -m benchmarks.bench_auth --logins 64 --concurrency 1 8 32 --hash-workers 4
+
+Loop lag is how late a 10 ms timer fires during the logins, i.e. how long
+chat requests on the same worker would wait. Argon2 releases the GIL, so
+the pool also scales with cores.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks import _env  # noqa: F401
+from benchmarks.load_test import LoopLag
+
+PASSWORD = "correct horse battery staple"
+
+
+async def inline_login(utils, hashed: str) -> bool:
+    return utils.verify_password(PASSWORD, hashed)
+
+
+async def pooled_login(utils, hashed: str) -> bool:
+    valid, _ = await utils.check_password(PASSWORD, hashed)
+    return valid
+
+
+async def run(utils, login, hashed: str, logins: int, concurrency: int) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            assert await login(utils, hashed)
+
+    lag = LoopLag()
+    lag.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    seconds = time.perf_counter() - start
+    return {"seconds": round(seconds, 2), "logins_per_s": round(logins / seconds, 1), **await lag.stop()}
+
+
+def token_checks(utils, calls: int) -> dict:
+    token = utils.create_access_token({"sub": "bench@example.com"})
+    results = {}
+    for mode, size in (("decode", 0), ("cached", 1024)):
+        utils.token_cache = utils.TokenCache(size)
+        start = time.perf_counter()
+        for _ in range(calls):
+            _check(utils, token)
+        results[mode] = round((time.perf_counter() - start) / calls * 1e6, 2)
+    return results
+
+
+def _check(utils, token: str):
+    # get_current_user never awaits: drive the coroutine without a loop per call.
+    coro = utils.get_current_user(token)
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--hash-workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--token-checks", type=int, default=20000)
+    args = parser.parse_args()
+    os.environ["HASH_WORKERS"] = str(args.hash_workers)
+
+    import utils
+
+    hashed = utils.get_password_hash(PASSWORD)
+    for concurrency in args.concurrency:
+        for mode, login in (("inline", inline_login), ("pool", pooled_login)):
+            result = asyncio.run(run(utils, login, hashed, args.logins, concurrency))
+            print(json.dumps({
+                "mode": mode,
+                "concurrency": concurrency,
+                "hash_workers": args.hash_workers if mode == "pool" else None,
+                "logins": args.logins,
+                **result,
+            }), flush=True)
+
+    per_call = token_checks(utils, args.token_checks)
+    print(json.dumps({"mode": "token_check", "calls": args.token_checks, "decode_us": per_call["decode"], "cached_us": per_call["cached"]}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
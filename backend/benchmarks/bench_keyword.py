@@ -0,0 +1,68 @@
+"""
+Offline answer latency: the old per-request sentence scorer (substring
+match of every question token against every lowercased sentence) vs. the
+per-file BM25 index built at upload time.
+
+    python -m benchmarks.bench_keyword                       # 1MB, 10MB, 100MB
+    python -m benchmarks.bench_keyword --sizes 5MB --queries 50
+
+Index build and load are reported separately; they are paid once per file
+(upload) and once per worker (first question), not per request.
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks import _env  # noqa: F401
+from benchmarks.bench_retrieval import WORDS, iter_corpus, legacy_scan, parse_size, timed
+from keyword_index import KeywordIndex
+
+
+def bench(size: int, queries: int):
+    rng = random.Random(size)
+    questions = [" ".join(rng.sample(WORDS, 3)) + f" ref{rng.randint(0, 10**6)}" for _ in range(queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = f"{tmp}/bench"
+        start = time.perf_counter()
+        KeywordIndex.build(iter_corpus(size), prefix)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = KeywordIndex.load(prefix)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        index_ms = [timed(index.search, q) for q in questions]
+        sentences = len(index)
+        del index
+
+    context = "".join(iter_corpus(size))
+    scan_ms = [timed(legacy_scan, context, q) for q in questions[:min(queries, 3)]]
+
+    return {
+        "size_bytes": size,
+        "sentences": sentences,
+        "index_build_s": round(build_s, 2),
+        "index_load_ms": round(load_ms, 1),
+        "index_query_p50_ms": round(statistics.median(index_ms), 3),
+        "index_query_max_ms": round(max(index_ms), 3),
+        "scan_query_p50_ms": round(statistics.median(scan_ms), 1),
+        "speedup": round(statistics.median(scan_ms) / statistics.median(index_ms), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[parse_size(s) for s in ("1MB", "10MB", "100MB")])
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps(bench(size, args.queries)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
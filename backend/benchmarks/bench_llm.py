@@ -0,0 +1,69 @@
+"""
+LLM call throughput with the offline stub provider: the old per-request
+blocking `chain.invoke` inside the async handler vs. the shared async
+`LLMClient` with its concurrency cap.
+
+    python -m benchmarks.bench_llm                        # 200 ms stub latency
+    python -m benchmarks.bench_llm --requests 100 --concurrency 1 8 32
+
+The stub sleeps instead of calling the network, so the numbers show how
+many calls a single worker keeps in flight, not provider speed.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import _env  # noqa: F401
+from llm import LLMClient, StubChain
+
+CONTEXT = "The warranty covers water damage for two years. Claims need a receipt."
+
+
+async def blocking_call(chain, question: str) -> str:
+    # What chat_answer did before: a fresh sync call on the event loop.
+    return chain.invoke({"context": CONTEXT, "question": question}).content
+
+
+async def pooled_call(client: LLMClient, question: str) -> str:
+    return await client.ainvoke(CONTEXT, question)
+
+
+async def run(call, target, requests: int, concurrency: int) -> float:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            await call(target, f"question {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency-ms", type=int, default=200)
+    parser.add_argument("--slots", type=int, default=8, help="LLM_CONCURRENCY for the async client")
+    args = parser.parse_args()
+
+    chain = StubChain(args.latency_ms)
+    for concurrency in args.concurrency:
+        client = LLMClient(chain, args.slots, timeout=60)
+        for mode, call, target in (("blocking", blocking_call, chain), ("async", pooled_call, client)):
+            seconds = asyncio.run(run(call, target, args.requests, concurrency))
+            print(json.dumps({
+                "mode": mode,
+                "concurrency": concurrency,
+                "slots": args.slots if mode == "async" else None,
+                "requests": args.requests,
+                "latency_ms": args.latency_ms,
+                "seconds": round(seconds, 2),
+                "rps": round(args.requests / seconds, 1),
+            }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+PDF extraction throughput: the old serial loop vs. range-parallel
+extraction on a process pool vs. a warm per-page cache.
+
+    python -m benchmarks.bench_pdf                      # 1,000 pages
+    python -m benchmarks.bench_pdf --pages 200 --workers 1 2 4 8
+
+The cache column uses an in-memory Mongo stand-in (mongomock), so it
+measures the pipeline, not network round-trips.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from benchmarks import _env  # noqa: F401
+from benchmarks.synthetic import write_pdf
+from jobs import make_executor
+from mongomock_motor import AsyncMongoMockClient
+from pypdf import PdfReader
+import pdf_extract
+
+
+def serial_baseline(path: str) -> int:
+    """The pre-change upload path: one reader, `+=` concatenation."""
+    reader = PdfReader(path)
+    full_text = ""
+    for page in reader.pages:
+        text = page.extract_text()
+        if text:
+            full_text += text + "\n"
+    return len(full_text)
+
+
+async def run_pipeline(db, path: str, sha256: str) -> int:
+    parts = [text async for text, _ in pdf_extract.iter_pages(db, path, sha256)]
+    return len("".join(parts))
+
+
+def _warm(_):
+    # Spawned workers pay their import cost once at startup (the lifespan
+    # hook in production); keep that out of the timings.
+    import pdf_extract  # noqa: F401
+    return os.getpid()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.pdf")
+        write_pdf(path, args.pages)
+        with open(path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+
+        serial_s, chars = timed(serial_baseline, path)
+        print(json.dumps({"mode": "serial", "cpus": os.cpu_count(), "pages": args.pages, "chars": chars, "seconds": round(serial_s, 2)}), flush=True)
+
+        for workers in args.workers:
+            pdf_extract.settings.PDF_WORKERS = workers
+            pdf_extract.executor = make_executor("process", workers)
+            list(pdf_extract.executor.map(_warm, range(workers * 4)))
+            db = AsyncMongoMockClient()["bench"]
+            try:
+                cold_s, chars = timed(asyncio.run, run_pipeline(db, path, sha256))
+                warm_s, _ = timed(asyncio.run, run_pipeline(db, path, sha256))
+            finally:
+                pdf_extract.executor.shutdown()
+            print(json.dumps({
+                "mode": "parallel",
+                "workers": workers,
+                "pages": args.pages,
+                "chars": chars,
+                "seconds": round(cold_s, 2),
+                "speedup": round(serial_s / cold_s, 2),
+                "cached_seconds": round(warm_s, 2),
+            }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Chat retrieval latency: prebuilt FAISS chunk index vs. the old per-request
+sentence scan.
+
+    python -m benchmarks.bench_retrieval                     # 10MB, 100MB, 1GB
+    python -m benchmarks.bench_retrieval --sizes 10MB 50MB --queries 20
+
+The 1GB corpus needs several GB of RAM (the legacy scan holds the text and
+its sentence list at once) and index construction takes a while; pass
+smaller --sizes for a quick run.
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import tempfile
+import time
+
+from benchmarks import _env  # noqa: F401
+import retrieval
+
+WORDS = (
+    "system data model process result value report market energy policy "
+    "network service customer product design quality research water health "
+    "project budget revenue growth risk security storage contract invoice "
+    "engine sensor pump valve turbine battery signal memory cache index"
+).split()
+
+
+def parse_size(text: str) -> int:
+    match = re.fullmatch(r"(\d+)\s*([KMG]?B)", text.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"bad size: {text}")
+    return int(match.group(1)) * {"B": 1, "KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}[match.group(2)]
+
+
+def iter_corpus(size: int, seed: int = 0, piece: int = 1 << 20):
+    """Yield ~1MB pieces of synthetic sentences until `size` bytes."""
+    rng = random.Random(seed)
+    produced = 0
+    while produced < size:
+        sentences = []
+        length = 0
+        while length < piece:
+            words = rng.choices(WORDS, k=rng.randint(6, 18))
+            sentence = " ".join(words).capitalize() + f" ref{rng.randint(0, 10**6)}."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        text = " ".join(sentences) + " "
+        produced += len(text)
+        yield text
+
+
+def legacy_scan(context: str, question: str):
+    """The pre-index chat path: split and substring-score every sentence."""
+    question_tokens = question.lower().split()
+    relevant = []
+    for sentence in re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', context):
+        score = sum(1 for token in question_tokens if token in sentence.lower())
+        if score > 0:
+            relevant.append((score, sentence))
+    relevant.sort(key=lambda x: x[0], reverse=True)
+    return relevant[0][1] if relevant else None
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def bench(size: int, queries: int, top_k: int):
+    rng = random.Random(size)
+    questions = [" ".join(rng.sample(WORDS, 3)) + f" ref{rng.randint(0, 10**6)}" for _ in range(queries)]
+
+    start = time.perf_counter()
+    index = retrieval.VectorIndex.build(iter_corpus(size))
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = f"{tmp}/bench"
+        index.save(prefix)
+        start = time.perf_counter()
+        index = retrieval.VectorIndex.load(prefix)
+        load_ms = (time.perf_counter() - start) * 1000
+
+    index_ms = [timed(index.search, q, top_k) for q in questions]
+    del index
+
+    context = "".join(iter_corpus(size))
+    # The legacy scan is slow on big corpora; a few queries are enough.
+    scan_ms = [timed(legacy_scan, context, q) for q in questions[:min(queries, 3)]]
+
+    return {
+        "size_bytes": size,
+        "index_build_s": round(build_s, 2),
+        "index_load_ms": round(load_ms, 1),
+        "index_query_p50_ms": round(statistics.median(index_ms), 3),
+        "index_query_max_ms": round(max(index_ms), 3),
+        "scan_query_p50_ms": round(statistics.median(scan_ms), 1),
+        "speedup": round(statistics.median(scan_ms) / statistics.median(index_ms), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[parse_size(s) for s in ("10MB", "100MB", "1GB")])
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=retrieval.settings.RETRIEVAL_TOP_K)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps(bench(size, args.queries, args.top_k)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
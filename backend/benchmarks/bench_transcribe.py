@@ -0,0 +1,88 @@
+"""
+Transcription wall time for a long recording: one Whisper call over the
+whole file vs. pause-aligned chunks spread over a pool of worker
+processes, reported as real-time factor (wall seconds per audio second).
+
+    python -m benchmarks.bench_transcribe                     # stub model, 10 min of audio
+    python -m benchmarks.bench_transcribe --minutes 30 --workers 1 2 4 8
+    python -m benchmarks.bench_transcribe --model base --audio talk.mp3
+
+The default stub model burns a fixed amount of CPU per audio second, so
+its speedup shows how well chunks spread over the cores this machine has;
+pass a real model size (and recording) to measure Whisper itself.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks import _env  # noqa: F401
+from benchmarks.synthetic import write_wav
+
+
+def run(path: str, workers: int, chunk_seconds: float) -> dict:
+    # Imported here so the settings the CLI put in the environment apply.
+    import jobs
+    import vad
+    from routers import files
+
+    files.settings.TRANSCRIBE_CHUNK_SECONDS = chunk_seconds
+    vad.settings.TRANSCRIBE_CHUNK_SECONDS = chunk_seconds
+
+    async def go():
+        queue = files.transcription_queue
+        await queue.start(jobs.make_executor("process", workers))
+        try:
+            await queue.run(files.whisper_model.warm)
+            start = time.perf_counter()
+            segments = await files.transcribe_file(path)
+            return time.perf_counter() - start, segments
+        finally:
+            await queue.stop()
+            queue.executor.shutdown()
+
+    seconds, segments = asyncio.run(go())
+    return {"seconds": seconds, "segments": len(segments)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--audio", help="recording to transcribe instead of a synthetic one")
+    parser.add_argument("--model", default="stub", help="WHISPER_MODEL for the workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-seconds", type=float, default=60)
+    args = parser.parse_args()
+
+    # Spawned workers read these when they import whisper_model.
+    os.environ["WHISPER_MODEL"] = args.model
+    os.environ.pop("WHISPER_SERVER", None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.audio
+        if not path:
+            path = os.path.join(tmp, "talk.wav")
+            write_wav(path, args.minutes * 60)
+        import vad
+        audio_seconds = len(vad.frame_levels(vad.iter_pcm(path))) * vad.FRAME_SECONDS
+
+        baseline = None
+        for mode, workers in [("single", 1)] + [("chunked", n) for n in args.workers]:
+            result = run(path, workers, args.chunk_seconds if mode == "chunked" else 0)
+            baseline = baseline or result["seconds"]
+            print(json.dumps({
+                "mode": mode,
+                "model": args.model,
+                "workers": workers,
+                "audio_seconds": round(audio_seconds, 1),
+                "seconds": round(result["seconds"], 2),
+                "rtf": round(result["seconds"] / audio_seconds, 4),
+                "speedup": round(baseline / result["seconds"], 2),
+                "segments": result["segments"],
+            }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
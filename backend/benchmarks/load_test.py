@@ -0,0 +1,351 @@
+"""
+Load test for the upload and chat endpoints: concurrent `/files/upload`
+(PDF and audio) and `/chat/` traffic against the real app with the stub
+LLM and stub Whisper model, one JSON line per phase with RPS, latency
+percentiles, peak RSS and, in-process, event-loop lag.
+
+    python -m benchmarks.load_test                          # in-process, mongomock
+    python -m benchmarks.load_test --phases chat --requests 500 --concurrency 64
+    python -m benchmarks.load_test --uvicorn --workers 2    # spawns uvicorn; needs Mongo and Redis
+    python -m benchmarks.load_test --url http://127.0.0.1:8000
+
+In-process, the app runs on this event loop with an in-memory Mongo
+stand-in. Admission control is off in every mode, so the numbers cover the handlers and the
+pipeline, not the network or the databases. Loop lag is how late a 10 ms
+timer fires while the traffic runs: a handler that blocks the loop shows
+up there first. For uvicorn or --url, start the server with
+LLM_PROVIDER=stub, WHISPER_MODEL=stub and ADMISSION_CONTROL=false.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import _env  # noqa: F401
+from benchmarks.bench_retrieval import WORDS
+from benchmarks.synthetic import write_pdf, write_wav
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * q / 100), len(values) - 1)]
+
+
+def peak_rss(pid: int) -> int:
+    """Peak RSS in bytes of a process and all its descendants (Linux), else of this process."""
+    try:
+        total = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        return total
+    except (OSError, StopIteration):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=_env.BACKEND_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LoopLag:
+    """Measures how late a periodic 10 ms sleep wakes up on the running loop."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        self.due = None
+        self.task = None
+
+    async def _probe(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.samples.append(max(now - self.due, 0.0))
+            self.due = now + self.interval
+
+    def start(self):
+        self.samples = []
+        self.due = time.perf_counter() + self.interval
+        self.task = asyncio.create_task(self._probe())
+
+    async def stop(self) -> dict:
+        # A loop blocked until now never woke the probe: count that wait too.
+        late = time.perf_counter() - self.due
+        if late > 0:
+            self.samples.append(late)
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        lags = sorted(self.samples)
+        return {"loop_lag_p99_ms": round(percentile(lags, 99) * 1000, 1), "loop_lag_max_ms": round((lags[-1] if lags else 0) * 1000, 1)}
+
+
+async def in_process_app(tmp: str, mongo_uri: str = None):
+    """The app wired up the way the lifespan hook does, minus external services."""
+    from mongomock_motor import AsyncMongoMockClient
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    import jobs
+    import llm
+    import main
+    import pdf_extract
+    import retrieval
+    from routers import files
+
+    # retrieval is already imported (for WORDS), so its settings are set directly.
+    retrieval.settings.INDEX_DIR = os.path.join(tmp, "indexes")
+    app = main.app
+    client = AsyncIOMotorClient(mongo_uri) if mongo_uri else AsyncMongoMockClient()
+    app.database = client["load_test"]
+    app.redis = None
+    app.llm = llm.create_client(main.settings)
+
+    pdf_extract.executor = jobs.make_executor("process", main.settings.PDF_WORKERS)
+    executor = jobs.make_executor(main.settings.TRANSCRIBE_EXECUTOR, main.settings.TRANSCRIBE_WORKERS)
+    await files.transcription_queue.start(executor)
+    await files.warm_transcriber()
+
+    async def close():
+        await files.transcription_queue.stop()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        pdf_extract.executor.shutdown(cancel_futures=True)
+        if app.llm:
+            await app.llm.aclose()
+
+    return app, files.transcription_queue, close
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_uvicorn(workers: int, env: dict):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        cwd=_env.BACKEND_DIR, env={**os.environ, **env},
+    )
+    return proc, f"http://127.0.0.1:{port}"
+
+
+async def wait_until_up(client, proc, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc and proc.poll() is not None:
+            raise SystemExit(f"uvicorn exited with {proc.returncode}")
+        try:
+            await client.get("/")
+            return
+        except Exception:
+            await asyncio.sleep(0.2)
+    raise SystemExit("server did not come up")
+
+
+class Payloads:
+    """Distinct synthetic files, so the content cache does not turn uploads into lookups."""
+
+    def __init__(self, tmp: str, pdf_pages: int, audio_seconds: float):
+        self.tmp = tmp
+        self.pdf_pages = pdf_pages
+        self.audio_seconds = audio_seconds
+        self.seeds = itertools.count()
+
+    def _read(self, write, name: str, *args) -> bytes:
+        path = os.path.join(self.tmp, name)
+        write(path, *args)
+        with open(path, "rb") as f:
+            data = f.read()
+        os.remove(path)
+        return data
+
+    def pdf(self):
+        seed = next(self.seeds)
+        return ("doc.pdf", self._read(write_pdf, f"{seed}.pdf", self.pdf_pages, 40, seed), "application/pdf")
+
+    def audio(self):
+        seed = next(self.seeds)
+        return ("talk.wav", self._read(write_wav, f"{seed}.wav", self.audio_seconds, 16000, seed), "audio/wav")
+
+
+async def register_users(client, count: int) -> list:
+    """Bearer headers for `count` newly registered load-test users."""
+    run = random.Random().randrange(1 << 30)
+    headers = []
+    for i in range(count):
+        credentials = {"email": f"load{run}-{i}@example.com", "password": "load-test-password"}
+        response = await client.post("/auth/register", json=credentials)
+        response.raise_for_status()
+        headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+    return headers
+
+
+async def run_phase(client, requests: int, concurrency: int, make_request) -> dict:
+    latencies = []
+    statuses = {}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            start = time.perf_counter()
+            try:
+                response = await make_request(i)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(seconds, 2),
+        "rps": round(requests / seconds, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "status": statuses,
+    }
+
+
+def question(rng: random.Random) -> str:
+    return "What does the file say about " + " ".join(rng.choices(WORDS, k=3)) + "?"
+
+
+async def drive(args, client, payloads: Payloads, server_pid: int, queue=None, lag: LoopLag = None):
+    users = await register_users(client, args.users)
+    rng = random.Random(0)
+
+    # Every user gets one PDF to chat about before anything is measured.
+    file_ids = []
+    for headers in users:
+        response = await client.post("/files/upload", files={"file": payloads.pdf()}, headers=headers)
+        response.raise_for_status()
+        file_ids.append(response.json()["file_id"])
+
+    async def upload(kind):
+        # Files are generated outside the timed request.
+        bodies = [getattr(payloads, kind)() for _ in range(args.requests)]
+
+        async def request(i):
+            return await client.post("/files/upload", files={"file": bodies[i]}, headers=users[i % len(users)])
+        return request
+
+    async def chat(i):
+        user = i % len(users)
+        body = {"question": question(rng), "file_id": file_ids[user]}
+        return await client.post("/chat/", json=body, headers=users[user])
+
+    for phase in args.phases:
+        make_request = chat if phase == "chat" else await upload(phase)
+        if lag:
+            lag.start()
+        result = {"phase": phase, "mode": args.mode, "commit": args.commit}
+        result.update(await run_phase(client, args.requests, args.concurrency, make_request))
+        if phase == "audio" and queue is not None:
+            # Uploads only enqueue; include the time to finish transcribing them.
+            start = time.perf_counter()
+            await queue.join()
+            result["drain_seconds"] = round(time.perf_counter() - start, 2)
+        if lag:
+            result.update(await lag.stop())
+        result["peak_rss_mb"] = round(peak_rss(server_pid) / 2**20, 1)
+        print(json.dumps(result), flush=True)
+
+
+async def main_async(args):
+    import httpx
+
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    with tempfile.TemporaryDirectory() as tmp:
+        payloads = Payloads(tmp, args.pdf_pages, args.audio_seconds)
+
+        if args.mode == "in-process":
+            app, queue, close = await in_process_app(tmp, args.mongo_uri)
+            transport = httpx.ASGITransport(app=app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=timeout) as client:
+                    await drive(args, client, payloads, os.getpid(), queue=queue, lag=LoopLag())
+            finally:
+                await close()
+            return
+
+        proc = None
+        url = args.url
+        if args.mode == "uvicorn":
+            proc, url = start_uvicorn(args.workers, {
+                "LLM_PROVIDER": "stub",
+                "WHISPER_MODEL": "stub",
+                "INDEX_DIR": os.path.join(tmp, "indexes"),
+            })
+        try:
+            async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+                await wait_until_up(client, proc)
+                await drive(args, client, payloads, proc.pid if proc else os.getpid())
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--uvicorn", action="store_true", help="spawn uvicorn (uses MONGO_URI and REDIS_URL)")
+    where.add_argument("--url", help="drive an already running server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --uvicorn")
+    parser.add_argument("--mongo-uri", help="real MongoDB for the in-process app instead of mongomock")
+    parser.add_argument("--phases", nargs="+", choices=["pdf", "audio", "chat"], default=["pdf", "audio", "chat"])
+    parser.add_argument("--requests", type=int, default=100, help="requests per phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--pdf-pages", type=int, default=10)
+    parser.add_argument("--audio-seconds", type=float, default=20)
+    parser.add_argument("--llm-latency-ms", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+    args.mode = "uvicorn" if args.uvicorn else "url" if args.url else "in-process"
+    args.commit = git_commit()
+
+    # Read by Settings when the app modules are imported (here or in uvicorn).
+    os.environ.update({
+        "LLM_PROVIDER": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms),
+        "WHISPER_MODEL": "stub",
+        "WHISPER_WARMUP": "false",
+        "ADMISSION_CONTROL": "false",
+        "TRANSCRIBE_QUEUE_SIZE": str(max(args.requests, 16)),
+    })
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
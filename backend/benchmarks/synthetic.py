@@ -0,0 +1,76 @@
+"""
+Synthetic inputs for benchmarks: multi-page text PDFs and WAV audio.
+No third-party writers needed, so fixtures of any size can be generated
+on a bare CI box.
+"""
+import random
+import wave
+
+import numpy as np
+
+from benchmarks.bench_retrieval import WORDS
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 40, seed: int = 0):
+    """Write a valid PDF with `pages` pages of Helvetica text lines."""
+    rng = random.Random(seed)
+    offsets = []
+    body = bytearray(b"%PDF-1.4\n")
+
+    def add(obj: bytes):
+        offsets.append(len(body))
+        body.extend(f"{len(offsets)} 0 obj\n".encode() + obj + b"\nendobj\n")
+
+    # 1: catalog, 2: page tree, 3: font, then a (page, content) pair per page.
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    add(b"<< /Type /Catalog /Pages 2 0 R >>")
+    add(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for number in range(1, pages + 1):
+        lines = [f"Page {number}."] + [
+            " ".join(rng.choices(WORDS, k=10)).capitalize() + "." for _ in range(lines_per_page)
+        ]
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        ops += [f"({_pdf_escape(line)}) '" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+
+        add(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * (number - 1)} 0 R >>".encode())
+        add(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    xref = len(body)
+    body.extend(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        body.extend(f"{offset:010d} 00000 n \n".encode())
+    body.extend(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+    with open(path, "wb") as f:
+        f.write(body)
+
+
+def write_wav(path: str, seconds: float, rate: int = 16000, seed: int = 0):
+    """
+    Write a 16-bit mono WAV of speech-like bursts: tones of 1-8 s with
+    pauses of 0.2-1.2 s between them, plus a little noise throughout.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * rate)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        written = 0
+        while written < total:
+            burst = min(int(rng.uniform(1, 8) * rate), total - written)
+            t = np.arange(burst) / rate
+            tone = 0.3 * np.sin(2 * np.pi * rng.uniform(120, 300) * t)
+            pause = min(int(rng.uniform(0.2, 1.2) * rate), total - written - burst)
+            block = np.concatenate([tone, np.zeros(pause)]) + rng.normal(0, 0.002, burst + pause)
+            w.writeframes((np.clip(block, -1, 1) * 32767).astype("<i2").tobytes())
+            written += burst + pause
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+from utils import Settings
+
+settings = Settings()
+
+ENTRIES = "content_cache"
+STATS = "cache_stats"
+
+# Fields copied from the processed file onto files that reuse its content.
+SHARED_FIELDS = ("type", "summary", "char_count", "chunk_count", "segment_count")
+
+
+async def lookup(db, sha256: str):
+    """
+    Return the cache entry for this content hash, or None. Hits and misses
+    are counted in `cache_stats` so every worker reports the same numbers.
+    """
+    now = datetime.utcnow()
+    entry = await db[ENTRIES].find_one_and_update(
+        {"_id": sha256},
+        {"$set": {"last_used_at": now}, "$inc": {"hits": 1}},
+    )
+    await db[STATS].update_one(
+        {"_id": "content"},
+        {"$inc": {"hits" if entry else "misses": 1}},
+        upsert=True,
+    )
+    return entry
+
+
+async def lookup_many(db, hashes) -> dict:
+    """`lookup` for many hashes in one round trip: {sha256: entry} for the hits."""
+    hashes = list(set(hashes))
+    if not hashes:
+        return {}
+    now = datetime.utcnow()
+    found = {}
+    async for entry in db[ENTRIES].find({"_id": {"$in": hashes}}):
+        found[entry["_id"]] = entry
+    if found:
+        await db[ENTRIES].update_many(
+            {"_id": {"$in": list(found)}},
+            {"$set": {"last_used_at": now}, "$inc": {"hits": 1}},
+        )
+    await db[STATS].update_one(
+        {"_id": "content"},
+        {"$inc": {"hits": len(found), "misses": len(hashes) - len(found)}},
+        upsert=True,
+    )
+    return found
+
+
+async def remember(db, sha256: str, file_id, size: int, fields: dict):
+    """Record a freshly processed file as the canonical content for its hash."""
+    now = datetime.utcnow()
+    entry = {"content_id": file_id, "size": size, "created_at": now, "last_used_at": now, "hits": 0}
+    entry.update({k: fields[k] for k in SHARED_FIELDS if k in fields})
+    # A concurrent upload of the same bytes may have got here first; keep theirs.
+    await db[ENTRIES].update_one({"_id": sha256}, {"$setOnInsert": entry}, upsert=True)
+    await evict(db)
+
+
+def file_doc_for(entry: dict, filename: str, sha256: str, owner: str) -> dict:
+    """A new `files` document, owned by the uploader, that points at the cached content."""
+    doc = {
+        "owner": owner,
+        "filename": filename,
+        "sha256": sha256,
+        "size": entry["size"],
+        "content_id": entry["content_id"],
+        "status": "done",
+        "cached": True,
+    }
+    doc.update({k: entry[k] for k in SHARED_FIELDS if k in entry})
+    return doc
+
+
+async def evict(db, max_entries: int = None, max_bytes: int = None, max_age_days: int = None):
+    """
+    Drop cache entries by age, then least-recently-used first until the
+    entry count and total source size fit the configured limits (0 means
+    no limit). Evicting an entry also drops the hash's per-page PDF cache;
+    chunks and indexes stay, since existing files still point at them.
+    Returns the evicted hashes.
+    """
+    max_entries = settings.CONTENT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = settings.CONTENT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_days = settings.CONTENT_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    evicted = []
+    if max_age_days:
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        async for entry in db[ENTRIES].find({"last_used_at": {"$lt": cutoff}}, {"_id": 1}):
+            evicted.append(entry["_id"])
+
+    if (max_entries or max_bytes) and await _over_limits(db, max_entries, max_bytes):
+        count = 0
+        total = 0
+        # Newest first: everything past the limits is the LRU tail.
+        async for entry in db[ENTRIES].find({}, {"size": 1}).sort("last_used_at", -1):
+            if entry["_id"] in evicted:
+                continue
+            count += 1
+            total += entry.get("size", 0)
+            if (max_entries and count > max_entries) or (max_bytes and total > max_bytes):
+                evicted.append(entry["_id"])
+
+    if evicted:
+        await db[ENTRIES].delete_many({"_id": {"$in": evicted}})
+        await db["pdf_pages"].delete_many({"sha256": {"$in": evicted}})
+    return evicted
+
+
+async def _totals(db):
+    pipeline = [{"$group": {"_id": None, "entries": {"$sum": 1}, "bytes": {"$sum": "$size"}}}]
+    async for row in db[ENTRIES].aggregate(pipeline):
+        return row["entries"], row["bytes"]
+    return 0, 0
+
+
+async def _over_limits(db, max_entries: int, max_bytes: int) -> bool:
+    entries, total_bytes = await _totals(db)
+    return bool((max_entries and entries > max_entries) or (max_bytes and total_bytes > max_bytes))
+
+
+async def stats(db) -> dict:
+    counters = await db[STATS].find_one({"_id": "content"}) or {}
+    hits = counters.get("hits", 0)
+    misses = counters.get("misses", 0)
+    entries, total_bytes = await _totals(db)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "entries": entries,
+        "bytes": total_bytes,
+    }
@@ -0,0 +1,126 @@
+import asyncio
+import re
+
+from starlette.concurrency import run_in_threadpool
+
+from utils import Settings
+
+settings = Settings()
+
+# Rough stand-in for a BPE tokenizer: words and single punctuation marks.
+_APPROX_RE = re.compile(r"\w+|[^\w\s]")
+
+
+# The LLM_TOKENIZER encoding once `load_encoding` has it. Until then, and
+# if it cannot be loaded, token counts are approximated.
+_encoder = None
+
+
+def _load():
+    global _encoder
+    import tiktoken
+    _encoder = tiktoken.get_encoding(settings.LLM_TOKENIZER)
+    return _encoder
+
+
+async def load_encoding():
+    """
+    Load the LLM_TOKENIZER encoding on a worker thread; run from the
+    lifespan hook, never from a request. tiktoken downloads the vocabulary
+    on first use with no timeout of its own, so this stops waiting after
+    TOKENIZER_LOAD_TIMEOUT (a download that finishes later is still used).
+    """
+    if not settings.LLM_TOKENIZER:
+        return None
+    try:
+        return await asyncio.wait_for(run_in_threadpool(_load), settings.TOKENIZER_LOAD_TIMEOUT)
+    except Exception as e:
+        print(f"Tokenizer {settings.LLM_TOKENIZER!r} unavailable, approximating token counts: {e!r}")
+        return None
+
+
+def _encoding():
+    return _encoder if settings.LLM_TOKENIZER else None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(_APPROX_RE.findall(text))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate(text: str, budget: int) -> str:
+    """The longest prefix of `text` that fits in `budget` tokens."""
+    encoding = _encoding()
+    if encoding is None:
+        tokens = list(_APPROX_RE.finditer(text))
+        if len(tokens) <= budget:
+            return text
+        return text[:tokens[budget].start()] if budget > 0 else ""
+    ids = encoding.encode(text, disallowed_special=())
+    return text if len(ids) <= budget else encoding.decode(ids[:budget])
+
+
+def _trim(hit: dict, chosen: list):
+    """
+    Cut the parts of `hit` already covered by chosen spans. Chunks overlap
+    their neighbours, so usually only a head or tail goes; returns None
+    when nothing new is left.
+    """
+    start, end, text = hit["start"], hit["end"], hit["text"]
+    for other in chosen:
+        if other.get("source") != hit.get("source"):
+            continue
+        if other["start"] <= start and end <= other["end"]:
+            return None
+        if other["start"] <= start < other["end"]:
+            text = text[other["end"] - start:]
+            start = other["end"]
+        elif other["start"] < end <= other["end"]:
+            text = text[:other["start"] - start]
+            end = other["start"]
+    return {**hit, "start": start, "end": end, "text": text}
+
+
+def pack(hits, budget: int = None):
+    """
+    Fill a token budget with the best-scoring chunks. Overlap between
+    chunks is only counted (and sent) once, and the chosen spans are
+    returned in document order, adjacent spans joined back together.
+    Hits from several files carry a `source`; offsets are only compared
+    within a source, and sources keep the order they first appear in.
+    Returns (context, spans, tokens).
+    """
+    budget = budget or settings.CONTEXT_TOKEN_BUDGET
+    rank = {}
+    for hit in hits:
+        rank.setdefault(hit.get("source"), len(rank))
+    chosen = []
+    used = 0
+    for hit in sorted(hits, key=lambda h: h["score"], reverse=True):
+        piece = _trim(hit, chosen)
+        if piece is None or not piece["text"].strip():
+            continue
+        tokens = count_tokens(piece["text"])
+        if used + tokens > budget:
+            if chosen:
+                continue  # a smaller, lower-ranked chunk may still fit
+            piece["text"] = truncate(piece["text"], budget)
+            piece["end"] = piece["start"] + len(piece["text"])
+            tokens = count_tokens(piece["text"])
+        chosen.append(piece)
+        used += tokens
+
+    spans = []
+    for piece in sorted(chosen, key=lambda p: (rank[p.get("source")], p["start"])):
+        same = spans and spans[-1].get("source") == piece.get("source")
+        if same and piece["end"] <= spans[-1]["end"]:
+            continue  # contained in a span already sent
+        if same and piece["start"] <= spans[-1]["end"]:
+            spans[-1]["text"] += piece["text"][spans[-1]["end"] - piece["start"]:]
+            spans[-1]["end"] = max(spans[-1]["end"], piece["end"])
+            spans[-1]["score"] = max(spans[-1]["score"], piece["score"])
+        else:
+            spans.append(dict(piece))
+    return "\n\n".join(span["text"] for span in spans), spans, used
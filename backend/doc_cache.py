@@ -0,0 +1,126 @@
+"""
+Per-worker cache of prepared document state.
+
+Answering a question needs a file's retrieval index, its keyword index
+(the split sentences), its segment map and its PDF page marks. All of
+them are built once and kept here, so a repeat question about a file
+needs no Mongo reads beyond the file's metadata lookup.
+
+Entries are keyed by (kind, content key, version), where the version is
+the content's SHA-256: a key can never return state built from other
+bytes. The cache is LRU and bounded by an estimate of its size in bytes
+(DOC_CACHE_MAX_BYTES). When a file's stored content is rewritten or
+discarded, `invalidate` publishes the content key on Redis, and every
+worker's `listen` task drops what it holds for that key.
+"""
+import asyncio
+import sys
+import threading
+from collections import OrderedDict
+
+from utils import Settings
+
+settings = Settings()
+
+CHANNEL = "documind:doc-cache"
+
+
+def version_of(file_doc) -> str:
+    # Files from before upload hashing have no sha256; their content never changes.
+    return file_doc.get("sha256") or ""
+
+
+def nbytes(value) -> int:
+    """Estimated memory held by a cached value."""
+    size = getattr(value, "nbytes", None)
+    if size is not None:
+        return int(size)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class DocCache:
+    """LRU of prepared per-file state, bounded by total estimated bytes and entry count."""
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (kind, key, version) -> (value, size)
+        self.bytes = 0
+        # Indexes are also built and remembered from worker threads.
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, key, version: str = ""):
+        with self._lock:
+            entry = self.entries.get((kind, str(key), version))
+            if entry is None:
+                return None
+            self.entries.move_to_end((kind, str(key), version))
+            return entry[0]
+
+    def put(self, kind: str, key, value, version: str = ""):
+        size = nbytes(value)
+        with self._lock:
+            old = self.entries.pop((kind, str(key), version), None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[(kind, str(key), version)] = (value, size)
+            self.bytes += size
+            # Always keep the newest entry, even one larger than the budget.
+            while len(self.entries) > 1 and (self.bytes > self.max_bytes or len(self.entries) > self.max_entries):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+        return value
+
+    def drop(self, key):
+        """Forget every kind and version of a content key."""
+        key = str(key)
+        with self._lock:
+            for entry in [entry for entry in self.entries if entry[1] == key]:
+                self.bytes -= self.entries.pop(entry)[1]
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+cache = DocCache(settings.DOC_CACHE_MAX_BYTES, settings.INDEX_CACHE_SIZE)
+
+
+async def invalidate(redis, key):
+    """Drop a content key here and, through Redis, on every other worker."""
+    cache.drop(key)
+    if redis is None:
+        return
+    try:
+        await redis.publish(CHANNEL, str(key))
+    except Exception as e:
+        print(f"Could not publish doc cache invalidation: {e!r}")
+
+
+async def listen(redis):
+    """
+    Drop entries as other workers invalidate them. Run as a background
+    task for the life of the app. After a lost connection the whole cache
+    is cleared, because messages sent in the meantime were missed.
+    """
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    cache.drop(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Doc cache invalidation feed lost ({e!r}); clearing the cache")
+            cache.clear()
+            await asyncio.sleep(settings.DOC_CACHE_RESUBSCRIBE_SECONDS)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
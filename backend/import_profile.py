@@ -0,0 +1,99 @@
+"""
+Import cost of the app, per module, as a worker pays it at startup.
+
+    python -m import_profile [--module main] [--top 25]
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and
+prints the slowest modules by cumulative time, the time per top-level
+package, and the total against IMPORT_TIME_BUDGET_SECONDS. Heavy
+dependencies are imported on first use by the code path that needs them,
+so none of LAZY should show up; any that do are flagged.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from utils import Settings
+
+settings = Settings()
+
+# Loaded only when first needed: indexing, PDF extraction, transcription, the LLM.
+LAZY = ("faiss", "pypdf", "whisper", "torch", "langchain_core", "langchain_groq", "tiktoken", "httpx")
+
+
+def parse(output: str) -> list:
+    """
+    Rows of `-X importtime` output as dicts (module, self_us,
+    cumulative_us, depth), in the order imports completed.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header
+        module = name.strip()
+        rows.append({
+            "module": module,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+        })
+    return rows
+
+
+def profile(module: str = "main") -> dict:
+    """Import `module` in a fresh interpreter and report what it cost."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = parse(result.stderr)
+    # Interpreter startup (site, encodings) is not the app's doing.
+    total = next(row["cumulative_us"] for row in rows if row["module"] == module and row["depth"] == 0)
+    packages = defaultdict(int)
+    for row in rows:
+        packages[row["module"].split(".")[0]] += row["self_us"]
+    loaded = {row["module"].split(".")[0] for row in rows}
+    return {
+        "module": module,
+        "seconds": total / 1e6,
+        "modules": rows,
+        "packages": dict(packages),
+        "eager": [name for name in LAZY if name in loaded],
+    }
+
+
+def report(result: dict, top: int = 25) -> str:
+    lines = [f"import {result['module']}: {result['seconds']:.3f}s (budget {settings.IMPORT_TIME_BUDGET_SECONDS}s)"]
+    lines.append(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for row in sorted(result["modules"], key=lambda r: r["cumulative_us"], reverse=True)[:top]:
+        lines.append(f"{row['cumulative_us'] / 1000:14.1f} {row['self_us'] / 1000:9.1f}  {'  ' * row['depth']}{row['module']}")
+    lines.append(f"\n{'self ms':>14}  package")
+    for name, us in sorted(result["packages"].items(), key=lambda item: item[1], reverse=True)[:top]:
+        lines.append(f"{us / 1000:14.1f}  {name}")
+    if result["eager"]:
+        lines.append(f"\nImported at startup but meant to be lazy: {', '.join(result['eager'])}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    result = profile(args.module)
+    print(report(result, args.top))
+    if result["seconds"] > settings.IMPORT_TIME_BUDGET_SECONDS or result["eager"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
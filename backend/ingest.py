@@ -0,0 +1,331 @@
+import hashlib
+import os
+from array import array
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+from bson import Binary
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+import doc_cache
+import keyword_index
+import metrics
+import retrieval
+from utils import Settings
+
+settings = Settings()
+
+CHUNKS = "file_chunks"
+
+
+async def spool_upload(upload, suffix: str):
+    """
+    Copy an UploadFile to a temp file in fixed-size chunks, hashing as we go.
+    Returns (path, sha256 hex digest, size in bytes).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        while True:
+            chunk = await upload.read(settings.SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            tmp.write(chunk)
+            size += len(chunk)
+    return tmp.name, digest.hexdigest(), size
+
+
+def spool_stream(stream, suffix: str, max_bytes: int = None):
+    """
+    Blocking `spool_upload` for a file object (e.g. an archive member).
+    Raises ValueError once more than `max_bytes` have been read.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        try:
+            while True:
+                chunk = stream.read(settings.SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"more than {max_bytes} bytes")
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    return tmp.name, digest.hexdigest(), size
+
+
+def iter_segments(segments):
+    """Yield (text, marks) per Whisper segment; the transcript is their concatenation."""
+    first = True
+    for seg in segments:
+        text = seg["text"].lstrip() if first else seg["text"]
+        first = False
+        yield text, {"segment": {"start": seg["start"], "end": seg["end"], "text": seg["text"]}}
+
+
+def pack_segments(bounds, starts, stops) -> dict:
+    """
+    Columnar segment marks as BSON binaries: n + 1 char offsets (segment i
+    is [bounds[i], bounds[i + 1]) of the transcript) as little-endian
+    int64, and n start and n stop times in seconds as float32. About 16
+    bytes a segment, against a few hundred for a list of dicts.
+    """
+    return {
+        "bounds": Binary(np.asarray(bounds, dtype="<i8").tobytes()),
+        "starts": Binary(np.asarray(starts, dtype="<f4").tobytes()),
+        "stops": Binary(np.asarray(stops, dtype="<f4").tobytes()),
+    }
+
+
+def unpack_segments(doc):
+    """(bounds, starts, stops) arrays viewing the buffers of a `pack_segments` doc, without copying."""
+    return (
+        np.frombuffer(doc["bounds"], dtype="<i8"),
+        np.frombuffer(doc["starts"], dtype="<f4"),
+        np.frombuffer(doc["stops"], dtype="<f4"),
+    )
+
+
+def mark_columns(marks):
+    """(bounds, starts, stops) of legacy segment marks: dicts with an `offset`, in transcript order."""
+    if not marks:
+        return np.zeros(0, dtype="<i8"), np.zeros(0, dtype="<f4"), np.zeros(0, dtype="<f4")
+    bounds = [seg["offset"] for seg in marks] + [marks[-1]["offset"] + len(marks[-1]["text"])]
+    return (
+        np.asarray(bounds, dtype="<i8"),
+        np.asarray([seg["start"] for seg in marks], dtype="<f4"),
+        np.asarray([seg["end"] for seg in marks], dtype="<f4"),
+    )
+
+
+class ChunkWriter:
+    """
+    Accumulates extracted text into fixed-size blocks and writes them as
+    `file_chunks` documents ({file_id, seq, start, end, text, pages,
+    segments}) with batched insert_many, keeping every document far below
+    the 16 MB BSON limit however long the source is. The segments starting
+    in a chunk are stored columnar, see `pack_segments`.
+    """
+
+    def __init__(self, db, file_id, block_chars: int = None, batch_size: int = None):
+        self.collection = db[CHUNKS]
+        self.file_id = file_id
+        self.block_chars = block_chars or settings.STORE_BLOCK_CHARS
+        self.batch_size = batch_size or settings.STORE_BATCH_SIZE
+        self.char_count = 0
+        self.chunk_count = 0
+        self.preview = ""
+        self._parts = []
+        self._size = 0
+        self._start = 0
+        self._pages = []
+        self._bounds, self._starts, self._stops = array("q"), array("f"), array("f")
+        self._segment_end = 0
+        self._pending = []
+
+    async def write(self, text: str, page: int = None, segment: dict = None):
+        if page is not None:
+            self._pages.append({"page": page, "offset": self.char_count})
+        if segment is not None:
+            self._bounds.append(self.char_count)
+            self._starts.append(segment["start"])
+            self._stops.append(segment["end"])
+            # Known now: the segment may run on past the chunk being sealed.
+            self._segment_end = self.char_count + len(text)
+        if len(self.preview) < settings.PREVIEW_CHARS:
+            self.preview += text[:settings.PREVIEW_CHARS - len(self.preview)]
+
+        while text:
+            room = self.block_chars - self._size
+            part, text = text[:room], text[room:]
+            self._parts.append(part)
+            self._size += len(part)
+            self.char_count += len(part)
+            if self._size >= self.block_chars:
+                await self._seal()
+
+    async def _seal(self):
+        self._pending.append({
+            "file_id": self.file_id,
+            "seq": self.chunk_count,
+            "start": self._start,
+            "end": self.char_count,
+            "text": "".join(self._parts),
+            "pages": self._pages,
+            "segments": self._packed_segments(),
+        })
+        self.chunk_count += 1
+        self._start = self.char_count
+        self._parts, self._size, self._pages = [], 0, []
+        self._bounds, self._starts, self._stops = array("q"), array("f"), array("f")
+        if len(self._pending) >= self.batch_size:
+            await self._flush()
+
+    def _packed_segments(self):
+        if not self._starts:
+            return []
+        return pack_segments(self._bounds + array("q", [self._segment_end]), self._starts, self._stops)
+
+    async def _flush(self):
+        if self._pending:
+            with metrics.timer("mongo_insert"):
+                await self.collection.insert_many(self._pending)
+            self._pending = []
+
+    async def close(self):
+        if self._size or self._pages or self._starts:
+            await self._seal()
+        await self._flush()
+
+
+async def ingest_pieces(db, file_id, pieces) -> ChunkWriter:
+    """
+    Drain a (text, marks) generator, writing chunk documents and feeding the
+    retrieval and keyword indexes as text arrives. Blocking generators are
+    iterated off the event loop; async ones are consumed directly.
+    An indexing failure only costs that index, never the upload.
+    """
+    writer = ChunkWriter(db, file_id)
+    prefix = retrieval.index_prefix(file_id)
+    builders = [retrieval.IndexBuilder(prefix), keyword_index.KeywordIndexBuilder(prefix)]
+    if not hasattr(pieces, "__aiter__"):
+        pieces = iterate_in_threadpool(pieces)
+
+    try:
+        async for text, marks in pieces:
+            await writer.write(text, **marks)
+            if builders:
+                builders = await run_in_threadpool(_each_builder, builders, "feed", text)
+        await writer.close()
+    except BaseException:
+        for builder in builders:
+            builder.abort()
+        raise
+
+    if builders:
+        await run_in_threadpool(_each_builder, builders, "finish")
+    return writer
+
+
+def _each_builder(builders, method: str, *args):
+    """Call `method` on every index builder, dropping (and aborting) any that fail."""
+    alive = []
+    for builder in builders:
+        try:
+            getattr(builder, method)(*args)
+            alive.append(builder)
+        except Exception as e:
+            print(f"{type(builder).__name__} failed, chat will fall back to a full scan: {e}")
+            builder.abort()
+    return alive
+
+
+async def discard(db, file_id):
+    """Drop the chunks a failed ingest managed to write; a retry starts its text over."""
+    await db[CHUNKS].delete_many({"file_id": file_id})
+
+
+def content_key(file_doc):
+    """
+    Id under which a file's chunks and index are stored. Deduplicated
+    uploads point at the first upload of the same bytes via `content_id`.
+    """
+    return file_doc.get("content_id", file_doc["_id"])
+
+
+def is_chunked(file_doc) -> bool:
+    # Files ingested before chunk storage keep everything on the file document.
+    return "chunk_count" in file_doc
+
+
+async def load_text(db, file_doc, limit: int = None) -> str:
+    """Reassemble a file's text, stopping early once `limit` chars are read."""
+    if not is_chunked(file_doc):
+        doc = await db["files"].find_one({"_id": file_doc["_id"]}, {"text": 1})
+        text = (doc or {}).get("text", "")
+        return text[:limit] if limit else text
+
+    parts = []
+    size = 0
+    cursor = db[CHUNKS].find({"file_id": content_key(file_doc)}, {"text": 1}).sort("seq", 1)
+    with metrics.timer("mongo_find"):
+        async for chunk in cursor:
+            parts.append(chunk["text"])
+            size += len(chunk["text"])
+            if limit and size >= limit:
+                break
+    text = "".join(parts)
+    return text[:limit] if limit else text
+
+
+async def load_segments(db, file_doc, start: int = 0, end: int = None):
+    """
+    Segment columns (bounds, starts, stops), as in `pack_segments`, of the
+    chunks overlapping the [start, end) char range.
+    """
+    if not is_chunked(file_doc):
+        doc = await db["files"].find_one({"_id": file_doc["_id"]}, {"segments": 1})
+        marks, offset = [], 0
+        for text, mark in iter_segments((doc or {}).get("segments", [])):
+            marks.append({**mark["segment"], "text": text, "offset": offset})
+            offset += len(text)
+        return mark_columns(marks)
+
+    query = {"file_id": content_key(file_doc), "end": {"$gt": start}}
+    if end is not None:
+        query["start"] = {"$lt": end}
+    columns = []
+    async for chunk in db[CHUNKS].find(query, {"segments": 1}).sort("seq", 1):
+        segments = chunk["segments"]
+        # Chunks written before columnar storage hold a list of dicts.
+        columns.append(mark_columns(segments) if isinstance(segments, list) else unpack_segments(segments))
+    columns = [c for c in columns if len(c[1])]
+    if not columns:
+        return mark_columns([])
+    if len(columns) == 1:
+        return columns[0]
+    # Each chunk's last bound is the next chunk's first offset.
+    return (
+        np.concatenate([bounds[:-1] for bounds, _, _ in columns] + [columns[-1][0][-1:]]),
+        np.concatenate([starts for _, starts, _ in columns]),
+        np.concatenate([stops for _, _, stops in columns]),
+    )
+
+
+async def page_at(db, file_doc, offset: int):
+    """PDF page number containing the given char offset, if pages were recorded."""
+    if not is_chunked(file_doc):
+        return None
+    offsets, pages = await page_marks(db, file_doc)
+    i = int(np.searchsorted(offsets, offset, side="right")) - 1
+    return int(pages[i]) if i >= 0 else None
+
+
+async def page_marks(db, file_doc):
+    """
+    (offsets, page numbers) of every page start in a PDF's text, as
+    arrays. Read once per worker (only the `pages` field of the chunks
+    that have any) and then served from the doc cache.
+    """
+    key = content_key(file_doc)
+    version = doc_cache.version_of(file_doc)
+    marks = doc_cache.cache.get("pages", key, version)
+    if marks is not None:
+        return marks
+
+    offsets, pages = [], []
+    query = {"file_id": key, "pages.0": {"$exists": True}}
+    with metrics.timer("mongo_find"):
+        async for chunk in db[CHUNKS].find(query, {"pages": 1, "_id": 0}).sort("seq", 1):
+            for mark in chunk["pages"]:
+                offsets.append(mark["offset"])
+                pages.append(mark["page"])
+    marks = (np.array(offsets, dtype=np.int64), np.array(pages, dtype=np.int32))
+    return doc_cache.cache.put("pages", key, marks, version)
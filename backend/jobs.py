@@ -0,0 +1,93 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when the queue is at capacity."""
+
+
+def make_executor(kind: str, workers: int):
+    """
+    Executor that blocking job work runs in. "process" gives each worker its
+    own interpreter (and model copy); "thread" uses the loop's default pool.
+    """
+    if kind == "process":
+        # spawn, not fork: torch and forked threads do not mix.
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return None
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue drained by a fixed number of asyncio
+    workers. Handlers push their blocking work through `run()` so the event
+    loop stays free; `submit()` fails fast when the queue is full so callers
+    can shed load instead of piling up work. On `stop()` running handlers
+    are cancelled and every job still queued is passed to `abandon`, so
+    nothing is dropped without its owner hearing of it.
+    """
+
+    def __init__(self, name: str, handler, concurrency: int, maxsize: int, abandon=None):
+        self.name = name
+        self.handler = handler
+        self.abandon = abandon
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self.executor = None
+        self.queue = None
+        self.workers = []
+
+    @property
+    def running(self) -> bool:
+        return self.queue is not None
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    async def start(self, executor=None):
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        queue, self.queue = self.queue, None
+        while queue is not None and not queue.empty():
+            job = queue.get_nowait()
+            queue.task_done()
+            if self.abandon:
+                try:
+                    await self.abandon(job)
+                except Exception as e:
+                    print(f"{self.name} job could not be abandoned cleanly: {e}")
+
+    def submit(self, job):
+        if not self.running:
+            raise RuntimeError(f"{self.name} queue is not running")
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"{self.name} queue is full ({self.maxsize} jobs)")
+
+    async def run(self, fn, *args):
+        """Run a blocking callable in the queue's executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def join(self):
+        await self.queue.join()
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.handler(job)
+            except Exception as e:
+                print(f"{self.name} job failed: {e}")
+            finally:
+                self.queue.task_done()
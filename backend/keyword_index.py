@@ -0,0 +1,289 @@
+import io
+import math
+import mmap
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+import doc_cache
+import retrieval
+from utils import Settings
+
+settings = Settings()
+
+_TOKEN_RE = re.compile(r"\w+")
+_SENTENCE_END_RE = re.compile(r"(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=[.?!])\s")
+
+MAX_TERM_CHARS = 40        # longer "words" are URLs, hashes and OCR noise
+MAX_SENTENCE_CHARS = 1000  # unpunctuated text is cut at a space past this
+
+# BM25 parameters (the usual Okapi defaults)
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been
+before being below between both but by can could did do does doing down during
+each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no
+nor not now of off on once only or other our ours ourselves out over own same
+she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when
+where which while who whom why will with would you your yours yourself
+yourselves
+""".split())
+
+
+def tokenize(text: str):
+    """Lowercased word tokens without stopwords; matches are whole words."""
+    return [
+        token for token in _TOKEN_RE.findall(text.lower())
+        if token not in STOPWORDS and len(token) <= MAX_TERM_CHARS
+    ]
+
+
+class SentenceSplitter:
+    """
+    Incremental sentence splitter yielding (start, end, text) with absolute
+    offsets (surrounding whitespace stripped), so sentences line up with
+    the chunk and page offsets of the same document.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.base = 0
+
+    def _emit(self, start: int, end: int):
+        text = self.buf[start:end]
+        stripped = text.strip()
+        if not stripped:
+            return []
+        lead = len(text) - len(text.lstrip())
+        begin = self.base + start + lead
+        return [(begin, begin + len(stripped), stripped)]
+
+    def feed(self, piece: str):
+        self.buf += piece
+        out = []
+        start = 0
+        for match in _SENTENCE_END_RE.finditer(self.buf):
+            out.extend(self._emit(start, match.start()))
+            start = match.end()
+        while len(self.buf) - start > MAX_SENTENCE_CHARS:
+            cut = self.buf.rfind(" ", start + MAX_SENTENCE_CHARS // 2, start + MAX_SENTENCE_CHARS)
+            cut = cut if cut != -1 else start + MAX_SENTENCE_CHARS
+            out.extend(self._emit(start, cut))
+            start = cut
+        self.buf = self.buf[start:]
+        self.base += start
+        return out
+
+    def flush(self):
+        out = self._emit(0, len(self.buf))
+        self.base += len(self.buf)
+        self.buf = ""
+        return out
+
+
+class KeywordIndexBuilder:
+    """
+    Builds a BM25 index over a document's sentences while its text streams
+    in. Sentence text goes straight to a sidecar file; only the posting
+    lists (compact `array`s of sentence ids and term frequencies) stay in
+    memory until `finish()` writes them out as NumPy arrays.
+    Without a prefix the index is built in memory and not persisted.
+    """
+
+    def __init__(self, prefix: str = None):
+        self.prefix = prefix
+        self.splitter = SentenceSplitter()
+        self.postings = {}
+        self.starts = array("q")
+        self.ends = array("q")
+        self.lengths = array("i")
+        self.text_offsets = array("q", [0])
+        if prefix is None:
+            self.sidecar = io.BytesIO()
+        else:
+            os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+            self.sidecar = open(prefix + ".bm25.txt.tmp", "wb")
+
+    def feed(self, piece: str):
+        for sentence in self.splitter.feed(piece):
+            self._add(*sentence)
+
+    def _add(self, start: int, end: int, text: str):
+        sid = len(self.starts)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            ids, tfs = self.postings.get(term) or self.postings.setdefault(term, (array("i"), array("H")))
+            ids.append(sid)
+            tfs.append(min(tf, 0xFFFF))
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lengths.append(len(tokens))
+        data = text.encode("utf-8")
+        self.sidecar.write(data)
+        self.text_offsets.append(self.text_offsets[-1] + len(data))
+
+    def finish(self):
+        for sentence in self.splitter.flush():
+            self._add(*sentence)
+
+        terms = sorted(self.postings)
+        df = np.fromiter((len(self.postings[t][0]) for t in terms), dtype=np.int64, count=len(terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+        ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            term_ids, term_tfs = self.postings[term]
+            ids[offsets[i]:offsets[i + 1]] = term_ids
+            tfs[offsets[i]:offsets[i + 1]] = term_tfs
+
+        arrays = {
+            "terms": np.array(terms, dtype=f"<U{MAX_TERM_CHARS}"),
+            "offsets": offsets,
+            "ids": ids,
+            "tfs": tfs,
+            "starts": np.frombuffer(self.starts, dtype=np.int64),
+            "ends": np.frombuffer(self.ends, dtype=np.int64),
+            "lengths": np.frombuffer(self.lengths, dtype=np.int32),
+            "text_offsets": np.frombuffer(self.text_offsets, dtype=np.int64),
+        }
+        if self.prefix is None:
+            return KeywordIndex(arrays, self.sidecar.getvalue())
+
+        self.sidecar.close()
+        with open(self.prefix + ".bm25.npz.tmp", "wb") as f:
+            np.savez(f, **arrays)
+        # The .npz appears last, so a reader never pairs it with a partial sidecar.
+        os.replace(self.prefix + ".bm25.txt.tmp", self.prefix + ".bm25.txt")
+        os.replace(self.prefix + ".bm25.npz.tmp", self.prefix + ".bm25.npz")
+        return KeywordIndex.load(self.prefix)
+
+    def abort(self):
+        self.sidecar.close()
+        if self.prefix is None:
+            return
+        for suffix in (".bm25.txt.tmp", ".bm25.npz.tmp"):
+            if os.path.exists(self.prefix + suffix):
+                os.remove(self.prefix + suffix)
+
+
+class KeywordIndex:
+    """
+    Sentence-level BM25 index: sorted term array, CSR-style posting lists
+    and sentence offsets in memory, sentence text memory-mapped from the
+    sidecar and only decoded for the hits returned.
+    """
+
+    def __init__(self, arrays: dict, text):
+        self.terms = arrays["terms"]
+        self.offsets = arrays["offsets"]
+        self.ids = arrays["ids"]
+        self.tfs = arrays["tfs"]
+        self.starts = arrays["starts"]
+        self.ends = arrays["ends"]
+        self.lengths = arrays["lengths"]
+        self.text_offsets = arrays["text_offsets"]
+        self.text = text
+        self.avg_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.terms, self.offsets, self.ids, self.tfs, self.starts, self.ends, self.lengths, self.text_offsets)
+        size = sum(a.nbytes for a in arrays)
+        # Mapped sidecar text lives in the page cache, not in this process's heap.
+        return size if isinstance(self.text, mmap.mmap) else size + len(self.text)
+
+    @classmethod
+    def load(cls, prefix: str):
+        with np.load(prefix + ".bm25.npz", allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        with open(prefix + ".bm25.txt", "rb") as f:
+            # mmap refuses empty files; an empty document has no text to map.
+            text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        return cls(arrays, text)
+
+    @classmethod
+    def build(cls, pieces, prefix: str = None):
+        """Index `pieces` (a string or iterable of strings), persisted at `prefix` if given."""
+        builder = KeywordIndexBuilder(prefix)
+        try:
+            if isinstance(pieces, str):
+                pieces = (pieces,)
+            for piece in pieces:
+                builder.feed(piece)
+            return builder.finish()
+        except BaseException:
+            builder.abort()
+            raise
+
+    def sentence(self, sid: int) -> str:
+        return bytes(self.text[self.text_offsets[sid]:self.text_offsets[sid + 1]]).decode("utf-8")
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self), dtype=np.float32)
+        terms = sorted(set(tokenize(query)))
+        if not terms or not len(self):
+            return scores
+        n = len(self)
+        slots = np.searchsorted(self.terms, terms)
+        for term, slot in zip(terms, slots):
+            if slot >= len(self.terms) or self.terms[slot] != term:
+                continue
+            lo, hi = self.offsets[slot], self.offsets[slot + 1]
+            ids = self.ids[lo:hi]
+            tf = self.tfs[lo:hi].astype(np.float32)
+            idf = math.log(1 + (n - (hi - lo) + 0.5) / ((hi - lo) + 0.5))
+            norm = K1 * (1 - B + B * self.lengths[ids] / self.avg_length)
+            scores[ids] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 1):
+        """
+        Return up to k sentences as dicts (score, start, end, text), best
+        first; ties go to the earlier sentence. Sentences sharing no term
+        with the query are dropped.
+        """
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.lexsort((top, -scores[top]))]
+        return [
+            {"score": float(scores[sid]), "start": int(self.starts[sid]), "end": int(self.ends[sid]), "text": self.sentence(sid)}
+            for sid in top if scores[sid] > 0
+        ]
+
+
+def build_file_index(file_id: str, pieces, version: str = "") -> KeywordIndex:
+    """
+    Build and persist the keyword index for a file's text.
+    CPU bound: call it from a worker thread, not the event loop.
+    """
+    index = KeywordIndex.build(pieces, retrieval.index_prefix(file_id))
+    return doc_cache.cache.put("sentences", file_id, index, version)
+
+
+def load_file_index(file_id: str, version: str = ""):
+    """
+    Load a file's keyword index on first use, keeping the most recently
+    used ones in memory. Returns None when the file has none yet.
+    """
+    index = doc_cache.cache.get("sentences", file_id, version)
+    if index is not None:
+        return index
+
+    prefix = retrieval.index_prefix(file_id)
+    if not os.path.exists(prefix + ".bm25.npz"):
+        return None
+    return doc_cache.cache.put("sentences", file_id, KeywordIndex.load(prefix), version)
@@ -0,0 +1,119 @@
+import asyncio
+import re
+import time
+
+from utils import Settings
+
+settings = Settings()
+
+PROMPT = "You are a helpful assistant. Use the following context to answer the question briefly.\n\nContext:\n{context}\n\nQuestion: {question}\nAnswer:"
+
+
+class StubMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubChain:
+    """
+    Offline stand-in for `prompt | ChatGroq`: answers with the first
+    sentence of the context after a fixed delay, so concurrency and
+    throughput can be measured without network access or an API key.
+    """
+
+    def __init__(self, latency_ms: int):
+        self.latency = latency_ms / 1000
+
+    def _answer(self, inputs: dict) -> str:
+        first = re.split(r"(?<=[.?!])\s", inputs["context"].strip(), maxsplit=1)[0]
+        return f"According to the file, {first}" if first else "The file does not say."
+
+    def invoke(self, inputs: dict):
+        time.sleep(self.latency)
+        return StubMessage(self._answer(inputs))
+
+    async def ainvoke(self, inputs: dict):
+        await asyncio.sleep(self.latency)
+        return StubMessage(self._answer(inputs))
+
+    async def astream(self, inputs: dict):
+        words = self._answer(inputs).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield StubMessage(word if i == 0 else " " + word)
+
+
+class LLMClient:
+    """
+    Long-lived LLM handle shared by all requests on a worker: one chain,
+    one keep-alive HTTP pool, a semaphore capping in-flight calls and a
+    timeout on every call (for streams: on each wait for the next token).
+    """
+
+    def __init__(self, chain, concurrency: int, timeout: float, http_client=None):
+        self.chain = chain
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.http_client = http_client
+
+    async def ainvoke(self, context: str, question: str) -> str:
+        # Waiting for a free slot counts against the timeout too.
+        return await asyncio.wait_for(self._invoke(context, question), self.timeout)
+
+    async def _invoke(self, context: str, question: str) -> str:
+        async with self.semaphore:
+            response = await self.chain.ainvoke({"context": context, "question": question})
+        return response.content
+
+    async def astream(self, context: str, question: str):
+        async with self.semaphore:
+            chunks = self.chain.astream({"context": context, "question": question}).__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                if chunk.content:
+                    yield chunk.content
+
+    async def aclose(self):
+        if self.http_client:
+            await self.http_client.aclose()
+
+
+def create_client(config: Settings = None):
+    """
+    Build the LLM client for LLM_PROVIDER ("groq", "stub" or "none").
+    Without an explicit provider, Groq is used when GROQ_API_KEY is set.
+    Returns None for offline mode.
+    """
+    config = config or settings
+    provider = config.LLM_PROVIDER or ("groq" if config.GROQ_API_KEY else "none")
+
+    if provider == "stub":
+        return LLMClient(StubChain(config.LLM_STUB_LATENCY_MS), config.LLM_CONCURRENCY, config.LLM_TIMEOUT)
+
+    if provider == "groq":
+        import httpx
+        from langchain_groq import ChatGroq
+        from langchain_core.prompts import PromptTemplate
+
+        http_client = httpx.AsyncClient(
+            timeout=config.LLM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_CONNECTIONS,
+            ),
+        )
+        llm = ChatGroq(
+            temperature=0,
+            model_name=config.LLM_MODEL,
+            groq_api_key=config.GROQ_API_KEY,
+            request_timeout=config.LLM_TIMEOUT,
+            max_retries=1,
+            http_async_client=http_client,
+        )
+        prompt = PromptTemplate(input_variables=["context","question"], template=PROMPT)
+        return LLMClient(prompt | llm, config.LLM_CONCURRENCY, config.LLM_TIMEOUT, http_client)
+
+    return None
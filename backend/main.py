@@ -1,31 +1,87 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routers import auth, files, chat
 from motor.motor_asyncio import AsyncIOMotorClient
 from utils import Settings
 from contextlib import asynccontextmanager
 import redis.asyncio as redis
-from fastapi_limiter import FastAPILimiter
+from jobs import make_executor
+import pdf_extract
+import llm
+import metrics
+import doc_cache
+import context_pack
+import whisper_model
 import os
+import asyncio
 settings = Settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    whisper_model.check_config()
 
     app.mongodb_client = AsyncIOMotorClient(settings.MONGO_URI)
     app.database = app.mongodb_client[settings.MONGO_DB]
     print(f" Connected to MongoDB at {settings.MONGO_URI}")
 
+    try:
+        await app.database["files"].create_index([("owner", 1), ("_id", -1)])
+        await app.database["files"].create_index([("batch_id", 1)], sparse=True)
+        await app.database["file_chunks"].create_index([("file_id", 1), ("seq", 1)], unique=True)
+        await app.database["pdf_pages"].create_index([("sha256", 1), ("page", 1)], unique=True)
+        await app.database["audio_chunks"].create_index([("sha256", 1), ("start", 1), ("end", 1)], unique=True)
+        # Checkpoints of failed uploads that are never retried expire on their own.
+        for checkpoints in ("pdf_pages", "audio_chunks"):
+            await app.database[checkpoints].create_index(
+                [("created_at", 1)], expireAfterSeconds=settings.CHECKPOINT_MAX_AGE_DAYS * 86400
+            )
+        await app.database["content_cache"].create_index([("last_used_at", 1)])
+    except Exception as e:
+        print(f"Could not ensure MongoDB indexes: {e}")
+
+    app.redis = None
     try:
         redis_url = settings.REDIS_URL 
         r = redis.from_url(redis_url, encoding="utf-8", decode_responses=True)
-        await FastAPILimiter.init(r)
-        print(f"Rate Limiter Initialized (Redis: {redis_url})")
+        await r.ping()
+        app.redis = r
+        print(f"Admission control and answer cache on Redis ({redis_url})")
     except Exception as e:
-        print(f"Redis Connection Failed: {e}. Rate limiting will not work.")
+        print(f"Redis Connection Failed: {e}. Rate limits are enforced per worker; answer caching is off.")
+
+    invalidations = asyncio.create_task(doc_cache.listen(app.redis)) if app.redis else None
+
+    app.llm = llm.create_client(settings)
+    print(f"LLM client: {type(app.llm.chain).__name__ if app.llm else 'offline mode'}")
+
+    pdf_extract.executor = make_executor("process", settings.PDF_WORKERS)
+
+    # A shared Whisper server holds the model; jobs only need threads to wait on it.
+    executor_kind = "thread" if settings.WHISPER_SERVER else settings.TRANSCRIBE_EXECUTOR
+    executor = make_executor(executor_kind, settings.TRANSCRIBE_WORKERS)
+    await files.transcription_queue.start(executor)
+    print(f"Transcription queue started ({settings.TRANSCRIBE_WORKERS} workers, {executor_kind} executor)")
+    # Exact token counts once the vocabulary is in; approximate until then.
+    tokenizer = asyncio.create_task(context_pack.load_encoding())
+    warmup = None
+    if settings.WHISPER_WARMUP and not settings.WHISPER_SERVER:
+        warmup = asyncio.create_task(files.warm_transcriber())
     
     yield
    
+    tokenizer.cancel()
+    if warmup:
+        warmup.cancel()
+    if invalidations:
+        invalidations.cancel()
+    await files.cancel_batches()
+    await files.transcription_queue.stop()
+    if app.llm:
+        await app.llm.aclose()
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    pdf_extract.executor.shutdown(wait=False, cancel_futures=True)
     app.mongodb_client.close()
     try:
         await r.close()
@@ -38,6 +94,7 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(metrics.LatencyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -52,4 +109,10 @@ app.include_router(chat.router, prefix="/chat", tags=["chat"])
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to KnowFlow API"}
\ No newline at end of file
+    return {"message": "Welcome to KnowFlow API"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Request latencies, stage timings and fallback counts of this worker, for Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
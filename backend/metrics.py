@@ -0,0 +1,181 @@
+"""
+Process-local metrics in the Prometheus text format, served at /metrics.
+
+Code records through a few calls: `timer(stage)` around an expensive step,
+`observe(stage, seconds)` when the duration is already known,
+`fallback(reason)` when an answer is produced offline instead of by the
+LLM, and `rejected(limit)` when admission control turns a request away.
+Each is a dict lookup and a few additions under a lock, cheap enough
+for every request. Every uvicorn worker keeps its own numbers.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; wide enough for a 5 ms Mongo find and a 10 minute transcription.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = []
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram; `observe` is one bisect and three adds."""
+
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, seconds: float, *labels):
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += seconds
+
+    def count(self, *labels) -> int:
+        series = self.series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self.series.items()):
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                le = bound if bound == "+Inf" else _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), labels + (le,))} {running}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {running}"
+
+
+REQUESTS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency, until the last byte of the response is sent.",
+    ("method", "route", "status"),
+)
+STAGES = Histogram(
+    "documind_stage_duration_seconds",
+    "Time spent in an expensive stage of a request or job.",
+    ("stage",),
+)
+FALLBACKS = Counter(
+    "documind_llm_fallbacks_total",
+    "Answers produced offline instead of by the LLM.",
+    ("reason",),
+)
+REJECTIONS = Counter(
+    "documind_admission_rejections_total",
+    "Requests turned away by a rate limit (429) or a full slot pool (503).",
+    ("limit",),
+)
+
+
+class timer:
+    """Context manager recording the block's wall time under `stage`, even if it raises."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGES.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+def observe(stage: str, seconds: float):
+    STAGES.observe(seconds, stage)
+
+
+def fallback(reason: str):
+    FALLBACKS.inc(reason)
+
+
+def rejected(limit: str):
+    REJECTIONS.inc(limit)
+
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+class LatencyMiddleware:
+    """
+    ASGI middleware timing every HTTP request by route template (not raw
+    path, so ids do not explode the label set). Streaming responses are
+    timed to their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            REQUESTS.observe(
+                time.perf_counter() - start,
+                scope["method"], getattr(route, "path", "unmatched"), status,
+            )
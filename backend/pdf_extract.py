@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+from utils import Settings
+
+settings = Settings()
+
+PAGES = "pdf_pages"
+
+# Set from the lifespan hook; None means the loop's default thread pool.
+executor = None
+
+# pypdf is imported on first use, in whichever process extracts.
+PdfReader = None
+
+
+def _reader(path: str):
+    global PdfReader
+    if PdfReader is None:
+        from pypdf import PdfReader
+    return PdfReader(path)
+
+
+def page_count(path: str) -> int:
+    return len(_reader(path).pages)
+
+
+def extract_range(path: str, start: int, stop: int) -> list:
+    """
+    Extract pages [start, stop) (0-based). Runs in a worker process; each
+    call opens its own reader so ranges can be spread across processes.
+    """
+    reader = _reader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _timed_extract(path: str, start: int, stop: int):
+    # Timed in the worker, so the metric is extraction time, not queueing.
+    began = time.perf_counter()
+    texts = extract_range(path, start, stop)
+    return time.perf_counter() - began, texts
+
+
+async def _read_cached(db, sha256: str, start: int, stop: int) -> list:
+    texts = [""] * (stop - start)
+    query = {"sha256": sha256, "page": {"$gt": start, "$lte": stop}}
+    async for doc in db[PAGES].find(query, {"page": 1, "text": 1}):
+        texts[doc["page"] - start - 1] = doc["text"]
+    return texts
+
+
+async def _store(db, sha256: str, start: int, texts: list):
+    now = datetime.utcnow()
+    docs = [{"sha256": sha256, "page": start + i + 1, "text": text, "created_at": now} for i, text in enumerate(texts)]
+    try:
+        with metrics.timer("mongo_insert"):
+            await db[PAGES].insert_many(docs, ordered=False)
+    except BulkWriteError:
+        pass  # another upload of the same file cached these pages first
+
+
+async def iter_pages(db, path: str, sha256: str, on_progress=None):
+    """
+    Async generator of (text, {"page": n}) for every non-empty page, in
+    page order. `on_progress(pages_done, total)` is awaited after each range.
+
+    Pages are extracted in PDF_PAGES_PER_TASK ranges on the extraction
+    executor, with a bounded window of ranges in flight so memory does not
+    grow with page count. Each page's text is cached in `pdf_pages` under
+    the file's SHA-256, and ranges already in the cache are read back
+    instead of re-extracted, which is also how a failed upload resumes.
+    """
+    loop = asyncio.get_running_loop()
+    total = await run_in_threadpool(page_count, path)
+    if on_progress:
+        await on_progress(0, total)
+    step = max(settings.PDF_PAGES_PER_TASK, 1)
+    window = max(settings.PDF_WORKERS, 1) * 2
+
+    cached = set()
+    async for doc in db[PAGES].find({"sha256": sha256}, {"page": 1}):
+        cached.add(doc["page"])
+
+    def schedule(start, stop):
+        if all(p in cached for p in range(start + 1, stop + 1)):
+            return asyncio.ensure_future(_read_cached(db, sha256, start, stop)), True
+        return loop.run_in_executor(executor, _timed_extract, path, start, stop), False
+
+    ranges = iter([(a, min(a + step, total)) for a in range(0, total, step)])
+    pending = deque()
+    for start, stop in ranges:
+        pending.append((start, *schedule(start, stop)))
+        if len(pending) >= window:
+            break
+
+    try:
+        while pending:
+            start, future, from_cache = pending.popleft()
+            texts = await future
+            if not from_cache:
+                seconds, texts = texts
+                metrics.observe("pdf_extract", seconds)
+            nxt = next(ranges, None)
+            if nxt:
+                pending.append((nxt[0], *schedule(*nxt)))
+            if not from_cache:
+                await _store(db, sha256, start, texts)
+            for number, text in enumerate(texts, start=start + 1):
+                if text:
+                    yield text + "\n", {"page": number}
+            if on_progress:
+                await on_progress(start + len(texts), total)
+    finally:
+        for _, future, _ in pending:
+            future.cancel()
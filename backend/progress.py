@@ -0,0 +1,94 @@
+"""
+Processing progress and audio checkpoints.
+
+Progress lives on the file document (`progress: {stage, done, total}`),
+so any worker can report on a job running anywhere. Transcribed audio
+chunks are checkpointed under the recording's SHA-256, like PDF pages in
+`pdf_pages`: a failed job loses only the chunks still in flight, and
+uploading the same recording again picks up from there. Checkpoints of
+an upload that is never retried expire after CHECKPOINT_MAX_AGE_DAYS (a
+TTL index on `created_at`).
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from utils import Settings, sse
+
+settings = Settings()
+
+AUDIO_CHUNKS = "audio_chunks"
+
+FINAL = ("done", "failed")
+
+
+async def report(db, file_id, stage: str, done: int, total: int):
+    await db["files"].update_one(
+        {"_id": file_id},
+        {"$set": {"progress": {"stage": stage, "done": done, "total": total}}},
+    )
+
+
+def _chunk_key(chunk: dict):
+    return (round(chunk["start"], 3), round(chunk["end"], 3))
+
+
+async def load_chunks(db, sha256: str) -> dict:
+    """Checkpointed chunk transcripts of a recording, keyed by (start, end) seconds."""
+    done = {}
+    async for doc in db[AUDIO_CHUNKS].find({"sha256": sha256}, {"start": 1, "end": 1, "segments": 1}):
+        done[(doc["start"], doc["end"])] = doc["segments"]
+    return done
+
+
+async def save_chunk(db, sha256: str, chunk: dict, segments: list):
+    start, end = _chunk_key(chunk)
+    await db[AUDIO_CHUNKS].update_one(
+        {"sha256": sha256, "start": start, "end": end},
+        {"$set": {"segments": segments}, "$setOnInsert": {"created_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+def find_chunk(done: dict, chunk: dict):
+    return done.get(_chunk_key(chunk))
+
+
+async def drop_chunks(db, sha256: str):
+    # The finished transcript is in `file_chunks`; the checkpoints only matter until then.
+    await db[AUDIO_CHUNKS].delete_many({"sha256": sha256})
+
+
+async def events(db, file_id):
+    """
+    SSE stream of a file's processing: a `progress` event whenever the
+    stage or count changes, then one `done` or `failed` event. Polls the
+    file document, so it works whichever worker runs the job. A job whose
+    worker died never finishes, so the stream also ends, with an `error`
+    event, when nothing changes for PROGRESS_IDLE_SECONDS or it has run
+    PROGRESS_MAX_SECONDS; the client may reconnect.
+    """
+    last = None
+    began = changed = time.monotonic()
+    while True:
+        doc = await db["files"].find_one({"_id": file_id}, {"status": 1, "progress": 1, "summary": 1, "error": 1})
+        if doc is None:
+            yield sse("failed", {"error": "File not found"})
+            return
+        status = doc.get("status", "done")
+        state = {"status": status, **(doc.get("progress") or {})}
+        now = time.monotonic()
+        if state != last:
+            yield sse("progress", state)
+            last, changed = state, now
+        if status in FINAL:
+            final = {"summary": doc.get("summary")} if status == "done" else {"error": doc.get("error")}
+            yield sse(status, {"file_id": str(file_id), **final})
+            return
+        if now - changed >= settings.PROGRESS_IDLE_SECONDS:
+            yield sse("error", {"file_id": str(file_id), "error": f"No progress for {settings.PROGRESS_IDLE_SECONDS:g}s"})
+            return
+        if now - began >= settings.PROGRESS_MAX_SECONDS:
+            yield sse("error", {"file_id": str(file_id), "error": f"Still processing after {settings.PROGRESS_MAX_SECONDS:g}s"})
+            return
+        await asyncio.sleep(settings.PROGRESS_POLL_SECONDS)
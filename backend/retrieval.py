@@ -0,0 +1,370 @@
+import json
+import math
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+import doc_cache
+import keyword_index
+from utils import Settings
+
+settings = Settings()
+
+_BREAKS = (" ", "\n")
+
+# Bumped whenever `embed` changes; indexes built by an older one are rebuilt.
+EMBEDDING_VERSION = 2
+
+# How faiss writes an IndexFlatIP: b"IxFI", dim, ntotal, two unused fields,
+# is_trained, metric (0 = inner product), then the vectors as a float
+# count and the raw float32s. IndexBuilder streams files in this layout.
+FLAT_HEADER = struct.Struct("<4siqqqBiQ")
+
+
+class Chunker:
+    """
+    Incremental splitter producing overlapping (start, end, text) chunks.
+
+    Text is pushed in with `feed()` as it is produced (pages, segments, ...),
+    so a document never has to be held in memory at once. Offsets are
+    absolute character positions in the concatenation of everything fed.
+    """
+
+    def __init__(self, size: int = None, overlap: int = None):
+        self.size = size or settings.CHUNK_SIZE
+        overlap = settings.CHUNK_OVERLAP if overlap is None else overlap
+        self.overlap = min(overlap, self.size // 2)
+        self.buf = ""
+        self.pos = 0        # read position inside buf
+        self.base = 0       # absolute offset of buf[0]
+        self.emitted = 0    # absolute end of the last chunk returned
+
+    def feed(self, piece: str):
+        """Add text and return the chunks it completes."""
+        size = self.size
+        buf = self.buf[self.pos:] + piece
+        self.base += self.pos
+        pos = 0
+        out = []
+        while len(buf) - pos >= size:
+            window = buf[pos:pos + size]
+            cut = max(window.rfind(b, size // 2) for b in _BREAKS)
+            if cut <= 0:
+                cut = size
+            out.append((self.base + pos, self.base + pos + cut, window[:cut]))
+            self.emitted = self.base + pos + cut
+
+            nxt = pos + max(cut - self.overlap, 1)
+            space = buf.find(" ", nxt, pos + cut)
+            pos = space + 1 if space != -1 else nxt
+        self.buf, self.pos = buf, pos
+        return out
+
+    def flush(self):
+        """Return the final partial chunk, if it holds anything new."""
+        tail = self.buf[self.pos:]
+        end = self.base + len(self.buf)
+        if end > self.emitted and tail.strip():
+            self.emitted = end
+            return [(self.base + self.pos, end, tail)]
+        return []
+
+
+def iter_chunks(pieces, size: int = None, overlap: int = None):
+    """
+    Split text into overlapping chunks, yielding (start, end, text).
+    `pieces` may be a single string or any iterable of strings.
+    """
+    chunker = Chunker(size, overlap)
+    if isinstance(pieces, str):
+        pieces = (pieces,)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
+
+
+@lru_cache(maxsize=65536)
+def _token_slot(token: str, dim: int):
+    h = zlib.crc32(token.encode("utf-8"))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+
+def embed(texts, dim: int = None) -> np.ndarray:
+    """
+    Hashing-trick embedding: stable across processes and needs no model
+    download, so indexes built by one worker can be queried by another.
+    Words are the keyword index's (no stopwords, which would otherwise
+    decide most scores on prose), weighted 1 + log(tf) so repetition does
+    not drown out rarer terms. Rows are L2-normalised, so inner product ==
+    cosine similarity.
+    """
+    dim = dim or settings.EMBED_DIM
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token, tf in Counter(keyword_index.tokenize(text)).items():
+            slot, sign = _token_slot(token, dim)
+            out[row, slot] += sign * (1.0 + math.log(tf))
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    out /= norms
+    return out
+
+
+class ChunkFile:
+    """
+    The chunks of a saved index, read on demand from its memory-mapped
+    `.chunks` sidecar (one JSON [start, end, text] line per vector id).
+    Only each line's byte offset is held, like the keyword index's sentence
+    offsets, so a loaded index costs 8 bytes a chunk however long the text.
+    """
+
+    def __init__(self, f):
+        # `f` is the sidecar opened in binary, positioned after the header.
+        offsets = array("q", [f.tell()])
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+        self.offsets = np.frombuffer(offsets, dtype=np.int64)
+        self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return json.loads(self.data[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes
+
+
+class VectorIndex:
+    """
+    FAISS inner-product index over text chunks, plus the chunk offsets and
+    text needed to turn a hit back into context.
+    """
+
+    def __init__(self, dim: int = None):
+        import faiss  # imported on first use, keeping it out of worker startup
+
+        self.dim = dim or settings.EMBED_DIM
+        self.index = faiss.IndexFlatIP(self.dim)
+        self.chunks = []  # [start, end, text] per vector id; a ChunkFile once loaded
+        self.mapped = False  # vectors and chunks read from disk on demand (see `load`)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def nbytes(self) -> int:
+        # Mapped from disk: only the chunk offsets. Otherwise float32 vectors
+        # plus the chunk text and list overhead.
+        if self.mapped:
+            return self.chunks.nbytes
+        return self.index.ntotal * self.dim * 4 + sum(len(c[2]) + 120 for c in self.chunks)
+
+    def add(self, chunks):
+        chunks = list(chunks)
+        if not chunks:
+            return
+        self.index.add(embed([c[2] for c in chunks], self.dim))
+        self.chunks.extend([list(c) for c in chunks])
+
+    @classmethod
+    def build(cls, pieces, batch_size: int = 256, dim: int = None):
+        index = cls(dim)
+        batch = []
+        for chunk in iter_chunks(pieces):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                index.add(batch)
+                batch = []
+        index.add(batch)
+        return index
+
+    def search(self, query: str, k: int = None):
+        """
+        Return up to k chunks as dicts (score, start, end, text), best first.
+        Chunks sharing no terms with the query are dropped.
+        """
+        k = min(k or settings.RETRIEVAL_TOP_K, len(self.chunks))
+        if k == 0:
+            return []
+        scores, ids = self.index.search(embed([query], self.dim), k)
+        hits = []
+        for score, idx in zip(scores[0], ids[0]):
+            if idx < 0 or score <= 0:
+                continue
+            start, end, text = self.chunks[idx]
+            hits.append({"score": float(score), "start": start, "end": end, "text": text})
+        return hits
+
+    def save(self, prefix: str):
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        with open(prefix + ".chunks.tmp", "w", encoding="utf-8") as f:
+            f.write(json.dumps({"dim": self.dim, "embedding": EMBEDDING_VERSION}) + "\n")
+            for chunk in self.chunks:
+                f.write(json.dumps(chunk) + "\n")
+        _commit(self.index, prefix)
+
+    @classmethod
+    def load(cls, prefix: str):
+        """
+        The index saved under `prefix`, or None if an older `embed` built
+        it. Vectors and chunk text are memory-mapped, not read: the OS
+        pages in what a search touches and can drop it again.
+        """
+        import faiss
+
+        index = cls.__new__(cls)
+        with open(prefix + ".chunks", "rb") as f:
+            header = json.loads(f.readline())
+            if header.get("embedding", 1) != EMBEDDING_VERSION:
+                return None
+            index.dim = header["dim"]
+            index.chunks = ChunkFile(f)
+        index.index = faiss.read_index(prefix + ".faiss", faiss.IO_FLAG_MMAP_IFC)
+        index.mapped = True
+        return index
+
+
+def _commit(index, prefix: str):
+    import faiss
+
+    faiss.write_index(index, prefix + ".faiss.tmp")
+    _publish(prefix)
+
+
+def _publish(prefix: str):
+    # Write-then-rename so a concurrent reader never sees a partial index.
+    os.replace(prefix + ".chunks.tmp", prefix + ".chunks")
+    os.replace(prefix + ".faiss.tmp", prefix + ".faiss")
+
+
+class IndexBuilder:
+    """
+    Streaming counterpart of VectorIndex.build for ingestion: text is fed
+    piece by piece and chunks are embedded in batches. Their text goes
+    straight to the on-disk sidecar and their vectors straight into the
+    index file (FLAT_HEADER, counts filled in by `finish`), so memory
+    holds one batch however long the document is.
+    """
+
+    def __init__(self, prefix: str, batch_size: int = 256, dim: int = None):
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.dim = dim or settings.EMBED_DIM
+        self.count = 0
+        self.chunker = Chunker()
+        self.batch = []
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        self.sidecar = open(prefix + ".chunks.tmp", "w", encoding="utf-8")
+        self.sidecar.write(json.dumps({"dim": self.dim, "embedding": EMBEDDING_VERSION}) + "\n")
+        self.vectors = open(prefix + ".faiss.tmp", "wb")
+        self._write_header()
+
+    def _write_header(self):
+        self.vectors.seek(0)
+        self.vectors.write(FLAT_HEADER.pack(b"IxFI", self.dim, self.count, 1 << 20, 1 << 20, 1, 0, self.count * self.dim))
+
+    def feed(self, piece: str):
+        self.batch.extend(self.chunker.feed(piece))
+        if len(self.batch) >= self.batch_size:
+            self._add()
+
+    def _add(self):
+        if not self.batch:
+            return
+        embed([c[2] for c in self.batch], self.dim).tofile(self.vectors)
+        self.count += len(self.batch)
+        for chunk in self.batch:
+            self.sidecar.write(json.dumps(chunk) + "\n")
+        self.batch = []
+
+    def finish(self):
+        """Flush the last chunks and atomically publish the index."""
+        self.batch.extend(self.chunker.flush())
+        self._add()
+        self._write_header()
+        self.vectors.close()
+        self.sidecar.close()
+        _publish(self.prefix)
+
+    def abort(self):
+        self.vectors.close()
+        self.sidecar.close()
+        for suffix in (".chunks.tmp", ".faiss.tmp"):
+            if os.path.exists(self.prefix + suffix):
+                os.remove(self.prefix + suffix)
+
+
+def index_prefix(file_id: str) -> str:
+    return os.path.join(settings.INDEX_DIR, str(file_id))
+
+
+def build_file_index(file_id: str, pieces, version: str = "") -> VectorIndex:
+    """
+    Build and persist the retrieval index for a file's text, replacing any
+    index an older `embed` left on disk, and return it loaded (mapped).
+    CPU bound: call it from a worker thread, not the event loop.
+    """
+    prefix = index_prefix(file_id)
+    builder = IndexBuilder(prefix)
+    try:
+        if isinstance(pieces, str):
+            pieces = (pieces,)
+        for piece in pieces:
+            builder.feed(piece)
+        builder.finish()
+    except BaseException:
+        builder.abort()
+        raise
+    return doc_cache.cache.put("vectors", file_id, VectorIndex.load(prefix), version)
+
+
+def load_file_index(file_id: str, version: str = ""):
+    """
+    Load a file's index, keeping the most recently used ones in memory.
+    Returns None when the file has no index (e.g. uploaded before indexing
+    existed, or still being processed).
+    """
+    index = doc_cache.cache.get("vectors", file_id, version)
+    if index is not None:
+        return index
+
+    prefix = index_prefix(file_id)
+    if not os.path.exists(prefix + ".faiss"):
+        return None
+    index = VectorIndex.load(prefix)
+    if index is None:
+        return None
+    return doc_cache.cache.put("vectors", file_id, index, version)
+
+
+def fuse(vector_hits, keyword_hits, k: int = None):
+    """
+    Reciprocal rank fusion of chunk hits from the vector index and sentence
+    hits from the keyword index (BM25, which weighs rare terms up), as
+    candidates for `context_pack.pack`. A hit scores 1 / (k + rank) per
+    list it appears in; a chunk also collects the score of every keyword
+    hit it contains, and keyword hits no chunk contains are candidates of
+    their own.
+    """
+    k = k or settings.RETRIEVAL_RRF_K
+    chunks = [{**hit, "score": 1.0 / (k + rank)} for rank, hit in enumerate(vector_hits, 1)]
+    sentences = []
+    for rank, hit in enumerate(keyword_hits, 1):
+        score = 1.0 / (k + rank)
+        containing = [c for c in chunks if c["start"] <= hit["start"] and hit["end"] <= c["end"]]
+        for chunk in containing:
+            chunk["score"] += score
+        if not containing:
+            sentences.append({**hit, "score": score})
+    return sorted(chunks + sentences, key=lambda hit: hit["score"], reverse=True)
@@ -3,7 +3,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
 from utils import (
-    Settings, get_password_hash, verify_password,
+    Settings, hash_password, check_password,
     oauth2_scheme, create_access_token
 )
 
@@ -26,7 +26,7 @@ class Token(BaseModel):
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(user: UserIn, request: Request):
     db = request.app.database
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = await hash_password(user.password)
     try:
         await db["users"].insert_one({"email": user.email, "password": hashed_pw})
     except DuplicateKeyError:
@@ -43,8 +43,14 @@ async def register(user: UserIn, request: Request):
 async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     db = request.app.database
     user = await db["users"].find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user["password"]):
+    if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    valid, new_hash = await check_password(form_data.password, user["password"])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if new_hash:
+        # Stored with older Argon2 parameters: upgrade while we have the password.
+        await db["users"].update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
     access_token = create_access_token(data={"sub": user["email"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
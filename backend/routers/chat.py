@@ -1,98 +1,409 @@
-from fastapi import APIRouter, Depends
-from utils import get_current_user
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from utils import get_current_user, sse
 from pydantic import  BaseModel
+from typing import List, Optional
 
 router = APIRouter (dependencies=[Depends(get_current_user)])
 
 class ChatQuery(BaseModel):
     question :str
+    # Files to answer from; neither means the user's latest upload.
+    file_id: Optional[str] = None
+    file_ids: Optional[List[str]] = None
 
-from state import global_state
+import asyncio
+import hashlib
 import re
+from bson import ObjectId
+from bson.errors import InvalidId
+import retrieval
+import ingest
+import answer_cache
+import context_pack
+import keyword_index
+import timeline
+import metrics
+import admission
+import doc_cache
 
 from utils import Settings
 
 settings = Settings()
 
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
 
-from fastapi_limiter.depends import RateLimiter
 import traceback
 
-@router.post("/",dependencies=[Depends(RateLimiter(times=5, seconds=60))])
-async def chat_answer(query:ChatQuery, request:Request):
+NO_ANSWER = "I couldn't find a specific answer in the uploaded file, but I've processed its content. Try asking about specific keywords found in the document."
+NO_FILES = "I don't have any file context yet. Please upload a PDF, Audio, or Video file first."
+
+# Only the metadata a turn needs: text, segments and indexes come from the
+# doc cache (or `file_chunks`) and are only fetched when it misses.
+FILE_FIELDS = {"filename": 1, "type": 1, "status": 1, "error": 1, "sha256": 1, "content_id": 1, "chunk_count": 1}
+
+
+class ChatTurn:
+    """Everything one question needs once the files and context are resolved."""
+
+    def __init__(self, question: str):
+        self.question = question
+        self.files = []
+        self.llm_context = ""
+        self.context_tokens = 0
+        self.redis = None
+        self.content_hash = None
+        self.cache_status = "off"
+        self.early_answer = None
+
+    @property
+    def ready(self) -> bool:
+        # Files from before status tracking are done.
+        return all(doc.get("status", "done") == "done" for doc in self.files)
+
+    @property
+    def has_audio(self) -> bool:
+        return any(doc.get("type") == "audio" for doc in self.files)
+
+
+async def resolve_files(db, owner: str, query: ChatQuery) -> list:
+    """
+    The caller's files named by the query, in the order given, or their
+    latest upload. Both lookups are served by the (owner, _id) index;
+    naming a file that is missing or belongs to someone else is a 404.
+    """
+    names = list(query.file_ids or [])
+    if query.file_id:
+        names.insert(0, query.file_id)
+    if not names:
+        with metrics.timer("mongo_find"):
+            latest = await db["files"].find_one({"owner": owner}, FILE_FIELDS, sort=[("_id", -1)])
+        return [latest] if latest else []
+
+    names = list(dict.fromkeys(names))
+    if len(names) > settings.CHAT_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.CHAT_MAX_FILES} files per question")
+    try:
+        oids = [ObjectId(name) for name in names]
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    found = {}
+    with metrics.timer("mongo_find"):
+        async for doc in db["files"].find({"owner": owner, "_id": {"$in": oids}}, FILE_FIELDS):
+            found[doc["_id"]] = doc
+    if len(found) != len(oids):
+        raise HTTPException(status_code=404, detail="File not found")
+    return [found[oid] for oid in oids]
+
+
+# Offline answers name the file they quote, but the answer cache is keyed
+# by content: answers are cached with a marker per source and get the
+# asker's own file names when served.
+SOURCE_MARK = "\x1fsource:{}\x1f"
+_SOURCE_RE = re.compile("\x1fsource:([^\x1f]*)\x1f")
+
+
+def source_key(doc) -> str:
+    return doc.get("sha256") or str(ingest.content_key(doc))
+
+
+def name_sources(files: list, answer: str) -> str:
+    """The answer with each source marker replaced by that file's name."""
+    names = {}
+    for doc in files:
+        names.setdefault(source_key(doc), doc.get("filename"))
+    return _SOURCE_RE.sub(lambda m: f"\"{names.get(m.group(1)) or 'the file'}\"", answer)
+
+
+def content_hash(files: list) -> str:
+    """Answer-cache key for a set of files: their content, not their names."""
+    hashes = sorted(source_key(doc) for doc in files)
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha256("\n".join(hashes).encode("utf-8")).hexdigest()
+
+
+async def chunk_index(db, doc):
+    """
+    The file's retrieval index. Files uploaded before indexing, or indexed
+    by an older `embed`, get theirs built (and persisted) on first use.
+    """
+    key, version = ingest.content_key(doc), doc_cache.version_of(doc)
+    # Reading a large index takes long enough to stall every other request on the loop.
+    index = await run_in_threadpool(retrieval.load_file_index, key, version)
+    if index is None:
+        text = await ingest.load_text(db, doc)
+        index = await run_in_threadpool(retrieval.build_file_index, key, text, version)
+    return index
+
+
+async def prepare_turn(request: Request, query: ChatQuery, user: dict) -> ChatTurn:
+    """
+    Resolve the files, consult the answer cache and assemble the context.
+    Sets `early_answer` when the request can be answered without the LLM.
+    """
     db = request.app.database
-    latest_file = await db["files"].find_one(sort =[("_id",-1)])
-    context = ""
-    timestamp_segments = []
-    file_type ="unknwown"
-
-    if latest_file:
-        context = latest_file.get("text","")
-        timestamp_segments = latest_file.get("segments", [])
-        file_type = latest_file.get("type","pdf")
-    else:
-        context= global_state.last_uploaded_text
+    question = query.question
+    turn = ChatTurn(question)
+    turn.files = await resolve_files(db, user["email"], query)
 
-    if not context:
-        return {"answer": "I don't have any file context yet. Please upload a PDF, Audio, or Video file first."}
-    
-    answer=""
-    timestamp_str = ""
+    if not turn.files:
+        turn.early_answer = NO_FILES
+        return turn
+    busy = next((doc for doc in turn.files if doc.get("status") in ("queued", "processing")), None)
+    if busy:
+        turn.early_answer = f"\"{busy['filename']}\" is still being processed. Please try again in a moment."
+        return turn
+    # A failed file has no text to answer from; nothing about it is indexed or cached.
+    failed = next((doc for doc in turn.files if doc.get("status") == "failed"), None)
+    if failed:
+        turn.early_answer = f"\"{failed['filename']}\" could not be processed, so I can't answer from it. Please upload it again."
+        return turn
 
-    if settings.GROQ_API_KEY:
+    # Same question about the same content: skip retrieval and the LLM.
+    turn.redis = getattr(request.app, "redis", None)
+    turn.content_hash = content_hash(turn.files)
+    if turn.redis:
         try:
-            print("ATTEMPTING GROQ LLM (Llama 3)...")
-            from langchain_groq import ChatGroq
-            from langchain_core.prompts import PromptTemplate
+            cached, turn.cache_status = await answer_cache.get(turn.redis, turn.content_hash, question)
+            if cached is not None:
+                turn.early_answer = name_sources(turn.files, cached)
+                return turn
+        except Exception as e:
+            print(f"Answer cache unavailable: {e}")
+            turn.cache_status = "off"
+
+    # Offline answers come from the keyword index alone; no prompt to build.
+    if get_llm(request) is None:
+        return turn
+
+    # Rank chunks across the files' indexes, fused with the keyword index's
+    # BM25 sentences, and pack the best into the prompt's token budget.
+    # Offsets are per file, so hits carry their source.
+    candidates = []
+    with metrics.timer("retrieval"):
+        for doc in turn.files:
+            vectors, keywords = await chunk_index(db, doc), await sentence_index(db, doc)
+            chunks = await run_in_threadpool(vectors.search, question, settings.CONTEXT_CANDIDATES)
+            sentences = await run_in_threadpool(keywords.search, question, settings.CONTEXT_CANDIDATES)
+            source = str(ingest.content_key(doc))
+            candidates.extend({**hit, "source": source} for hit in retrieval.fuse(chunks, sentences))
+
+    if candidates:
+        turn.llm_context, _, turn.context_tokens = context_pack.pack(candidates)
+    else:
+        # Nothing matched lexically (e.g. "summarise this"): give the LLM the openings instead.
+        budget = settings.CONTEXT_TOKEN_BUDGET
+        share = budget // len(turn.files)
+        openings = [
+            context_pack.truncate(await ingest.load_text(db, doc, limit=share * 8), share)
+            for doc in turn.files
+        ]
+        turn.llm_context = "\n\n".join(opening for opening in openings if opening)
+        turn.context_tokens = context_pack.count_tokens(turn.llm_context)
+
+    if not turn.llm_context.strip():
+        turn.early_answer = NO_FILES
+    return turn
 
-            llm = ChatGroq(temperature=0, model_name="llama-3.3-70b-versatile", groq_api_key=settings.GROQ_API_KEY)
 
-            prompt = PromptTemplate(
-                input_variables=["context","question"],
-                template="You are a helpful assistant. Use the following context to answer the question briefly.\n\nContext:\n{context}\n\nQuestion: {question}\nAnswer:"
-            )
+def get_llm(request: Request):
+    # Created once in the lifespan hook; None means offline mode.
+    return getattr(request.app, "llm", None)
 
-            chain = prompt | llm
-            safe_context = context[:25000]
 
-            response = chain.invoke({"context": safe_context, "question": query.question})
-            answer = response.content
-            print("GROQ SUCCESS")
+async def sentence_index(db, doc):
+    """
+    The file's keyword index. Files uploaded before keyword indexing get
+    theirs built (and persisted) on first use.
+    """
+    key = ingest.content_key(doc)
+    version = doc_cache.version_of(doc)
+    index = await run_in_threadpool(keyword_index.load_file_index, key, version)
+    if index is None:
+        text = await ingest.load_text(db, doc)
+        index = await run_in_threadpool(keyword_index.build_file_index, key, text, version)
+    return index
 
+
+async def best_sentence(db, turn: ChatTurn):
+    """
+    The sentence that best matches the question across the turn's files,
+    as a dict (score, start, end, text, file) with offsets into that
+    file's text, or None.
+    """
+    hits = []
+    with metrics.timer("offline_scoring"):
+        for doc in turn.files:
+            index = await sentence_index(db, doc)
+            found = await run_in_threadpool(index.search, turn.question, settings.TIMESTAMP_MAX_MATCHES)
+            hits.extend({**hit, "file": doc} for hit in found)
+    if not hits:
+        return None
+    # Stable sort: on equal scores the earlier file and sentence win.
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    best = hits[0]
+    # The same sentence said again elsewhere in a recording gets its own timestamp.
+    best["matches"] = [hit for hit in hits if hit["text"] == best["text"]]
+    return best
+
+
+async def offline_answer(db, turn: ChatTurn, sentence: dict) -> str:
+    doc = sentence["file"]
+    source = SOURCE_MARK.format(source_key(doc)) if len(turn.files) > 1 else "the file"
+    answer = f"Based on {source}: \"{sentence['text']}\""
+    if doc.get("type", "pdf") == 'pdf':
+        page = await ingest.page_at(db, doc, sentence["start"])
+        if page:
+            answer += f" (page {page})"
+    return answer
+
+
+def clock(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 60:02}:{seconds % 60:02}"
+
+
+async def timestamp_for(db, sentence: dict) -> str:
+    stamps = []
+    for match in sentence["matches"]:
+        if match["file"].get("type") != 'audio':
+            continue
+        segmap = await timeline.load(db, match["file"])
+        span = segmap.span(match["start"], match["end"])
+        if span and clock(span[0]) not in stamps:
+            stamps.append(clock(span[0]))
+    # One bracket per stamp: the client turns each `[mm:ss]` into a seek button.
+    return "".join(f" [{stamp}]" for stamp in stamps)
+
+
+async def remember_answer(turn: ChatTurn, answer: str, llm_failed: bool):
+    # An offline fallback after an LLM error should not be pinned for the TTL,
+    # nor an answer from files that were not done: the cache key is their content.
+    if turn.cache_status == "miss" and not llm_failed and turn.ready:
+        try:
+            await answer_cache.put(turn.redis, turn.content_hash, turn.question, answer)
         except Exception as e:
-            print(f"GROQ FAILED. SWITCHING TO OFFLINE MODE. Error: {e}")
-            pass
+            print(f"Answer cache unavailable: {e}")
+
+
+@router.post("/",dependencies=[Depends(admission.limit("chat"))])
+async def chat_answer(query:ChatQuery, request:Request, user: dict = Depends(get_current_user)):
+    db = request.app.database
+    turn = await prepare_turn(request, query, user)
+    if turn.early_answer is not None:
+        response = {"answer": turn.early_answer}
+        if turn.cache_status != "off":
+            response["cache"] = turn.cache_status
+        return response
+
+    answer=""
+    llm_failed = False
+
+    llm = get_llm(request)
+    if llm:
+        # A full slot pool is a 503, not an offline answer: the client should retry.
+        async with admission.slot(getattr(request.app, "redis", None), "llm"):
+            try:
+                with metrics.timer("llm"):
+                    answer = await llm.ainvoke(turn.llm_context, query.question)
+            except Exception as e:
+                print(f"LLM FAILED. SWITCHING TO OFFLINE MODE. Error: {e!r}")
+                llm_failed = True
+                metrics.fallback("timeout" if isinstance(e, asyncio.TimeoutError) else "error")
     else:
-        print("USING OFFLINE MODE (No Groq API Key Found)")
-
-    question_tokens = query.question.lower().split()
-    relevant_sentences = []
-    sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', context)
-    
-    for sentence in sentences:
-        score = sum(1 for token in question_tokens if token in sentence.lower())
-        if score > 0:
-            relevant_sentences.append((score, sentence))
-    relevant_sentences.sort(key=lambda x: x[0], reverse=True)
-
-    if relevant_sentences:
-        best_sentence = relevant_sentences[0][1].strip() 
-       
+        print("USING OFFLINE MODE (No LLM configured)")
+        metrics.fallback("no_llm")
+
+    timestamp_str = ""
+    sentence = await best_sentence(db, turn) if not answer or turn.has_audio else None
+    if sentence:
         if not answer:
-            answer = f"Based on the file: \"{best_sentence}\""
+            answer = await offline_answer(db, turn, sentence)
+        timestamp_str = await timestamp_for(db, sentence)
+
+    if not answer:
+        answer = NO_ANSWER
 
-        if file_type == 'audio' and timestamp_segments:
-            for seg in timestamp_segments:
+    answer = f"{answer}{timestamp_str}"
+    await remember_answer(turn, answer, llm_failed)
+    return {"answer": name_sources(turn.files, answer), "cache": turn.cache_status}
 
-                if best_sentence[:20] in seg['text']: 
-                    start_time = int(seg['start'])
-                    minutes = start_time // 60
-                    seconds = start_time % 60
-                    timestamp_str = f" [{minutes:02}:{seconds:02}]"
-                    break
 
-    if not answer:
-        answer = "I couldn't find a specific answer in the uploaded file, but I've processed its content. Try asking about specific keywords found in the document."
+@router.post("/stream",dependencies=[Depends(admission.limit("chat"))])
+async def chat_stream(query:ChatQuery, request:Request, user: dict = Depends(get_current_user)):
+    """
+    Same answer as POST /chat/, streamed as Server-Sent Events: `token`
+    events carry text as the LLM produces it (the audio timestamp is the
+    last token) and a final `done` event carries the full answer.
+    """
+    db = request.app.database
+    redis = getattr(request.app, "redis", None)
+    turn = await prepare_turn(request, query, user)
+    llm = get_llm(request) if turn.early_answer is None else None
+    # Taken before the response starts, so a full pool can still be a 503.
+    lease = await admission.acquire(redis, "llm") if llm else None
+
+    async def events():
+        try:
+            async for event in answer_events():
+                yield event
+        finally:
+            await admission.release(redis, lease)
+
+    async def answer_events():
+        if turn.early_answer is not None:
+            yield sse("token", turn.early_answer)
+            yield sse("done", {"answer": turn.early_answer, "cache": turn.cache_status})
+            return
+
+        parts = []
+        llm_failed = False
+        if llm:
+            try:
+                with metrics.timer("llm_stream"):
+                    async for token in llm.astream(turn.llm_context, query.question):
+                        parts.append(token)
+                        yield sse("token", token)
+            except Exception as e:
+                print(f"LLM STREAM FAILED. SWITCHING TO OFFLINE MODE. Error: {e!r}")
+                llm_failed = True
+                if parts:
+                    # The client already shows a partial answer; do not mix in another.
+                    yield sse("error", "The answer was interrupted.")
+                    yield sse("done", {"answer": "".join(parts), "cache": turn.cache_status})
+                    return
+                metrics.fallback("timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+        else:
+            metrics.fallback("no_llm")
+
+        sentence = await best_sentence(db, turn) if not parts or turn.has_audio else None
+        if not parts:
+            answer = await offline_answer(db, turn, sentence) if sentence else NO_ANSWER
+            parts.append(answer)
+            yield sse("token", name_sources(turn.files, answer))
+        if sentence:
+            timestamp_str = await timestamp_for(db, sentence)
+            if timestamp_str:
+                parts.append(timestamp_str)
+                yield sse("token", timestamp_str)
+
+        answer = "".join(parts)
+        await remember_answer(turn, answer, llm_failed)
+        yield sse("done", {"answer": name_sources(turn.files, answer), "cache": turn.cache_status})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-    return {"answer": f"{answer}{timestamp_str}"}
+@router.get("/cache/stats")
+async def chat_cache_stats(request: Request):
+    redis = getattr(request.app, "redis", None)
+    if not redis:
+        return {"hits": 0, "near_hits": 0, "misses": 0, "hit_rate": 0.0}
+    return await answer_cache.stats(redis)
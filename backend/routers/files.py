@@ -1,90 +1,632 @@
 from fastapi import APIRouter, Depends, UploadFile, File,HTTPException, Request
+from typing import List
+from datetime import datetime
+from fastapi.responses import JSONResponse, StreamingResponse
 from utils import get_current_user, Settings
-import shutil
 import os
-import whisper
-from tempfile import NamedTemporaryFile
-from pypdf import PdfReader
-from state import global_state
+import asyncio
+from bson import ObjectId
+from bson.errors import InvalidId
+from jobs import JobQueue, QueueFull
+import ingest
+import pdf_extract
+import content_cache
+import archive
+import timeline
+import whisper_model
+import vad
+import metrics
+import progress
+import admission
+import doc_cache
+from fastapi.concurrency import run_in_threadpool
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 settings = Settings()
 
-ffmpeg_dir = r"C:\Users\Devesh Kesharwani\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0.1-full_build\bin"
+AUDIO_EXTS = ['.mp3', '.wav', '.mp4', '.m4a']
 
-if os.path.exists(ffmpeg_dir):
-    os.environ["Path"] +=os.pathsep + ffmpeg_dir
-    print(f"Injected FFmpeg path: {ffmpeg_dir}")
+# Set on files whose processing a shutdown cut short; checkpoints make the retry cheap.
+INTERRUPTED = "Processing was interrupted by a server restart. Upload the file again to resume."
+
+def transcribe_audio(path: str, start: float = None, end: float = None) -> list:
+    """
+    Blocking Whisper call on a recording or one [start, end) range of it.
+    Runs inside the transcription executor, whose worker process holds the
+    resident model (or streams the audio to the shared Whisper server when
+    one is configured).
+    """
+    return whisper_model.transcribe(path, start, end)
+
+
+async def transcribe_file(path: str, db=None, file_id=None, sha256: str = None) -> list:
+    """
+    Transcribe a recording. Long ones are split at pauses and the chunks
+    run concurrently across the transcription executor; the merged
+    segments carry timestamps on the whole recording's timeline.
+    Given the file's db, id and hash, progress is reported on the file
+    and every finished chunk is checkpointed, so a retry of the same
+    recording only transcribes what is missing.
+    """
+    with metrics.timer("transcription"):
+        return await _transcribe_file(path, db, file_id, sha256)
+
+
+async def _transcribe_file(path: str, db, file_id, sha256: str) -> list:
+    tracked = db is not None and sha256 is not None
+    chunks = None
+    if settings.TRANSCRIBE_CHUNK_SECONDS:
+        try:
+            chunks = await run_in_threadpool(vad.plan_file, path)
+        except Exception as e:
+            print(f"Could not split {path} ({e}); transcribing it in one pass")
+    if not chunks:
+        if tracked:
+            await progress.report(db, file_id, "transcribing", 0, 1)
+        return await transcription_queue.run(transcribe_audio, path)
+
+    checkpoints = await progress.load_chunks(db, sha256) if tracked else {}
+    results = [progress.find_chunk(checkpoints, chunk) for chunk in chunks]
+    done = sum(result is not None for result in results)
+    if tracked:
+        await progress.report(db, file_id, "transcribing", done, len(chunks))
+    print(f"Transcribing {path} as {len(chunks)} chunks ({done} already done)")
+
+    async def run(i, chunk):
+        nonlocal done
+        results[i] = await transcription_queue.run(transcribe_audio, path, chunk["start"], chunk["end"])
+        if tracked:
+            await progress.save_chunk(db, sha256, chunk, results[i])
+            done += 1
+            await progress.report(db, file_id, "transcribing", done, len(chunks))
+
+    # Let every chunk finish (and checkpoint) before giving up on the file.
+    outcomes = await asyncio.gather(
+        *(run(i, chunk) for i, chunk in enumerate(chunks) if results[i] is None),
+        return_exceptions=True,
+    )
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+    return vad.merge(chunks, results)
+
+
+async def warm_transcriber():
+    """Load the model in every transcription worker ahead of the first upload."""
+    try:
+        loaded = await asyncio.gather(*(
+            transcription_queue.run(whisper_model.warm) for _ in range(settings.TRANSCRIBE_WORKERS)
+        ))
+        for info in {i["pid"]: i for i in loaded}.values():
+            print(f"Whisper warm-up: {info}")
+    except Exception as e:
+        print(f"Whisper warm-up failed, loading on first use instead: {e}")
+
+
+async def process_audio_job(job: dict):
+    db = job["db"]
+    file_id = job["file_id"]
+    path = job["path"]
+    files = db["files"]
+
+    await files.update_one({"_id": file_id}, {"$set": {"status": "processing"}})
+    try:
+        print(f"Transcribing file: {path}")
+        segments = await transcribe_file(path, db, file_id, job["sha256"])
+        await progress.report(db, file_id, "indexing", 0, 1)
+        stored = await ingest.ingest_pieces(db, file_id, ingest.iter_segments(segments))
+        await timeline.save(db, file_id, timeline.SegmentMap.from_pieces(ingest.iter_segments(segments)), job["sha256"])
+        print(f"Transcription Result Length: {stored.char_count}")
+
+        if stored.preview.strip():
+            summary = f"Transcription Preview: {stored.preview[:200]}..."
+        else:
+            summary = "Processed successfully, but no speech was detected."
+
+        fields = {
+            "type": "audio",
+            "summary": summary,
+            "char_count": stored.char_count,
+            "chunk_count": stored.chunk_count,
+            "segment_count": len(segments),
+        }
+        await files.update_one({"_id": file_id}, {"$set": {**fields, "status": "done", "progress": {"stage": "done", "done": 1, "total": 1}}})
+        await content_cache.remember(db, job["sha256"], file_id, job["size"], fields)
+        await progress.drop_chunks(db, job["sha256"])
+        return fields
+    except asyncio.CancelledError:
+        await fail(db, file_id, INTERRUPTED, job.get("redis"))
+        raise
+    except Exception as e:
+        await fail(db, file_id, e, job.get("redis"))
+        raise
+    finally:
+        await admission.release(job.get("redis"), job.get("lease"))
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def process_pdf(db, file_id, path: str, sha256: str, size: int, redis=None) -> dict:
+    """
+    Extract, index and store a PDF whose `files` document already exists.
+    Returns the fields set on it; on failure the file is marked failed and
+    the error re-raised.
+    """
+    await db["files"].update_one({"_id": file_id}, {"$set": {"status": "processing"}})
+    try:
+        async def on_progress(done, total):
+            await progress.report(db, file_id, "extracting", done, total)
+
+        pages = pdf_extract.iter_pages(db, path, sha256, on_progress)
+        stored = await ingest.ingest_pieces(db, file_id, pages)
+        fields = {
+            "type": "pdf",
+            "summary": f"PDF Content Preview: {stored.preview}...",
+            "char_count": stored.char_count,
+            "chunk_count": stored.chunk_count,
+        }
+        await db["files"].update_one({"_id": file_id}, {"$set": {**fields, "status": "done"}})
+        await content_cache.remember(db, sha256, file_id, size, fields)
+        return fields
+    except asyncio.CancelledError:
+        await fail(db, file_id, INTERRUPTED, redis)
+        raise
+    except Exception as e:
+        await fail(db, file_id, e, redis)
+        raise
+
+
+async def fail(db, file_id, error: Exception, redis=None):
+    # Extracted pages and transcribed chunks stay checkpointed: uploading
+    # the file again resumes from them.
+    await ingest.discard(db, file_id)
+    # Nothing derived from the discarded text may outlive it on any worker.
+    await doc_cache.invalidate(redis, file_id)
+    await db["files"].update_one({"_id": file_id}, {"$set": {"status": "failed", "error": str(error)}})
+
+
+async def abandon_audio_job(job: dict):
+    """A queued job that will not run: fail its file and free what it holds."""
+    try:
+        await fail(job["db"], job["file_id"], INTERRUPTED, job.get("redis"))
+    finally:
+        await admission.release(job.get("redis"), job.get("lease"))
+        if os.path.exists(job["path"]):
+            os.remove(job["path"])
+
+
+transcription_queue = JobQueue(
+    "transcription",
+    process_audio_job,
+    concurrency=settings.TRANSCRIBE_WORKERS,
+    maxsize=settings.TRANSCRIBE_QUEUE_SIZE,
+    abandon=abandon_audio_job,
+)
 
-try:
-    model = whisper.load_model("base")
-except Exception as e:
-    print(f"Warning: Could not load Whisper model: {e}")
-    model = None
 
 @router.post("/upload")
-async def upload_file(request : Request, file: UploadFile = File(...)):
+async def upload_file(request : Request, file: UploadFile = File(...), user: dict = Depends(get_current_user)):
+    """
+    Spool the upload to disk (hashing it on the way), then ingest it
+    incrementally: extracted text goes to `file_chunks` as it is produced
+    and only the summary and file id come back.
+    """
     db= request.app.database
+    redis = getattr(request.app, "redis", None)
+    owner = user["email"]
     filename = file.filename
     ext = os.path.splitext(filename)[1].lower()
 
-    with NamedTemporaryFile(delete = False, suffix=ext) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+    with metrics.timer("upload_spool"):
+        tmp_path, sha256, size = await ingest.spool_upload(file, ext)
+    file_id = None
+    handed_off = False
 
     try:
-        summary = "Summary generation pending..."
-        transcription_text = ""
-        segments = []
-        
-        if ext in ['.mp3', '.wav', '.mp4', '.m4a']:
-            if model:
-                print(f"Transcribing file: {tmp_path}")
-                result = model.transcribe(tmp_path, fp16=False)
-                transcription_text = result["text"].strip()
-                segments = result.get("segments", [])
-                
-                print(f"Transcription Result Length: {len(transcription_text)}")
-                
-                if transcription_text:
-                     summary = f"Transcription Preview: {transcription_text[:200]}..."
-                else:
-                     summary = "Processed successfully, but no speech was detected."
-            else:
-                summary = "Whisper model not loaded. Transcription failed."
-        elif ext == '.pdf':
-            reader = PdfReader(tmp_path)
-            full_text = ""
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n"
-            
-            transcription_text = full_text
-            summary = f"PDF Content Preview: {full_text[:300]}..."
-        else:
-             summary = "Unsupported file type for auto-processing."
+        cached = await content_cache.lookup(db, sha256)
+        if cached:
+            # Same bytes were processed before: point at that content instead
+            # of re-running Whisper/pypdf.
+            file_doc = content_cache.file_doc_for(cached, filename, sha256, owner)
+            inserted = await db["files"].insert_one(file_doc)
+            return {
+                "file_id": str(inserted.inserted_id),
+                "filename": filename,
+                "status": "done",
+                "cached": True,
+                "detail": "File uploaded; reused previously processed content.",
+                "summary": file_doc.get("summary"),
+            }
+
+        # Only work that has to be done is charged; cache hits are free.
+        cost = admission.upload_cost(tmp_path, ext, size, ext in AUDIO_EXTS)
+        if ext in AUDIO_EXTS:
+            # Renewed until the job releases it, however long it queues and runs.
+            lease = admission.hold(redis, await admission.acquire(redis, "transcription"))
+            try:
+                await admission.take(redis, "upload", owner, cost)
+            except HTTPException:
+                await admission.release(redis, lease)
+                raise
+            # From here the transcription job owns (and deletes) the temp file.
+            handed_off = True
+            return await enqueue_audio(db, owner, filename, tmp_path, sha256, size, redis, lease)
+
+        await admission.take(redis, "upload", owner, cost)
 
         file_doc = {
+            "owner": owner,
             "filename": filename,
-            "type": 'audio' if ext in ['.mp3', '.wav', '.mp4', '.m4a'] else 'pdf',
-            "text": transcription_text,
-            "segments": segments, 
+            "type": 'pdf',
+            "sha256": sha256,
+            "size": size,
+            "status": "processing",
         }
-        await db["files"].insert_one(file_doc)
-        
-        global_state.last_uploaded_text = transcription_text
-        global_state.transcription_segments = segments
-        global_state.last_uploaded_type = file_doc["type"]
-        
+        inserted = await db["files"].insert_one(file_doc)
+        file_id = inserted.inserted_id
+
+        if ext == '.pdf':
+            summary = (await process_pdf(db, file_id, tmp_path, sha256, size, redis))["summary"]
+        else:
+            summary = "Unsupported file type for auto-processing."
+            counts = {"char_count": 0, "chunk_count": 0}
+            await db["files"].update_one({"_id": file_id}, {"$set": {"summary": summary, "status": "done", **counts}})
+
         return {
+            "file_id": str(file_id),
             "filename": filename,
+            "status": "done",
             "detail": "File uploaded and processed.",
             "summary": summary,
-            "transcription": transcription_text
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        if os.path.exists(tmp_path):
+        if not handed_off and os.path.exists(tmp_path):
             os.remove(tmp_path)
+
+
+async def enqueue_audio(db, owner: str, filename: str, tmp_path: str, sha256: str, size: int, redis=None, lease=None):
+    """
+    Record the file as queued and hand it to the transcription workers.
+    The temp file and the transcription slot `lease` now belong to the
+    job, which gives both back when done.
+    """
+    file_doc = {
+        "owner": owner,
+        "filename": filename,
+        "type": 'audio',
+        "sha256": sha256,
+        "size": size,
+        "summary": "Transcription queued.",
+        "status": "queued",
+    }
+    inserted = await db["files"].insert_one(file_doc)
+    file_id = inserted.inserted_id
+
+    try:
+        transcription_queue.submit({
+            "db": db, "file_id": file_id, "path": tmp_path, "sha256": sha256, "size": size,
+            "redis": redis, "lease": lease,
+        })
+    except QueueFull:
+        await db["files"].delete_one({"_id": file_id})
+        await admission.release(redis, lease)
+        os.remove(tmp_path)
+        raise HTTPException(
+            status_code=503,
+            detail="Transcription queue is full, try again shortly.",
+            headers={"Retry-After": "30"},
+        )
+    except Exception:
+        await db["files"].delete_one({"_id": file_id})
+        await admission.release(redis, lease)
+        os.remove(tmp_path)
+        raise
+
+    return JSONResponse(status_code=202, content={
+        "file_id": str(file_id),
+        "job_id": str(file_id),
+        "filename": filename,
+        "status": "queued",
+        "detail": "File uploaded, transcription queued.",
+        "summary": file_doc["summary"],
+    })
+
+
+BATCHES = "batches"
+
+# Pipelines of accepted batches; held here so they are not garbage collected mid-run.
+batch_tasks = set()
+
+
+@router.post("/batch", status_code=202)
+async def upload_batch(request: Request, files: List[UploadFile] = File(...), user: dict = Depends(get_current_user)):
+    """
+    Upload many files at once, as separate parts and/or zip/tar archives.
+    Everything is spooled, checked against the content cache in one query
+    and recorded with one insert_many; then a background pipeline
+    extracts, indexes and stores the files with bounded concurrency.
+    Returns a batch id and each file's id and status; follow progress on
+    GET /files/batch/{batch_id}.
+    """
+    db = request.app.database
+    redis = getattr(request.app, "redis", None)
+    owner = user["email"]
+    supported = set(AUDIO_EXTS) | {".pdf"}
+    items, skipped = [], []
+    budget = settings.BATCH_MAX_BYTES
+
+    try:
+        for upload in files:
+            ext = os.path.splitext(upload.filename)[1].lower()
+            if archive.is_archive(upload.filename):
+                with metrics.timer("upload_spool"):
+                    tmp_path, _, _ = await ingest.spool_upload(upload, ext)
+                try:
+                    spooled, names = await run_in_threadpool(
+                        archive.expand, tmp_path, supported, budget, settings.BATCH_MAX_FILES - len(items)
+                    )
+                except archive.TooLarge as e:
+                    raise HTTPException(status_code=413, detail=f"{upload.filename}: {e}")
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=f"{upload.filename}: {e}")
+                finally:
+                    os.remove(tmp_path)
+                items.extend(spooled)
+                skipped.extend(names)
+                budget -= sum(item["size"] for item in spooled)
+            elif ext in supported:
+                with metrics.timer("upload_spool"):
+                    tmp_path, sha256, size = await ingest.spool_upload(upload, ext)
+                items.append({"filename": upload.filename, "ext": ext, "path": tmp_path, "sha256": sha256, "size": size})
+                budget -= size
+            else:
+                skipped.append(upload.filename)
+            if budget < 0:
+                raise HTTPException(status_code=413, detail=f"Batch is larger than {settings.BATCH_MAX_BYTES} bytes")
+            if len(items) > settings.BATCH_MAX_FILES:
+                raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_FILES} files per batch")
+        if not items:
+            raise HTTPException(status_code=400, detail="No PDF or audio files in the batch")
+
+        batch_id = ObjectId()
+        cached = await content_cache.lookup_many(db, [item["sha256"] for item in items])
+        # The whole batch is admitted or refused at once, charged for what is not cached.
+        cost = sum(
+            admission.upload_cost(item["path"], item["ext"], item["size"], item["ext"] in AUDIO_EXTS)
+            for item in items if item["sha256"] not in cached
+        )
+        if cost:
+            await admission.take(redis, "upload", owner, cost)
+        docs = []
+        for item in items:
+            entry = cached.get(item["sha256"])
+            if entry:
+                doc = content_cache.file_doc_for(entry, item["filename"], item["sha256"], owner)
+            else:
+                doc = {
+                    "owner": owner,
+                    "filename": item["filename"],
+                    "type": "audio" if item["ext"] in AUDIO_EXTS else "pdf",
+                    "sha256": item["sha256"],
+                    "size": item["size"],
+                    "summary": "Queued.",
+                    "status": "queued",
+                }
+            docs.append({**doc, "batch_id": batch_id})
+        inserted = await db["files"].insert_many(docs)
+        for item, doc, file_id in zip(items, docs, inserted.inserted_ids):
+            item.update(file_id=file_id, type=doc["type"], status=doc["status"])
+        await db[BATCHES].insert_one({
+            "_id": batch_id,
+            "owner": owner,
+            "created_at": datetime.utcnow(),
+            "total": len(items),
+            "skipped": skipped,
+        })
+    except BaseException:
+        for item in items:
+            if os.path.exists(item["path"]):
+                os.remove(item["path"])
+        raise
+
+    work = [item for item in items if item["status"] == "queued"]
+    for item in items:
+        if item["status"] != "queued":
+            os.remove(item["path"])
+    task = asyncio.create_task(run_batch(db, work, redis))
+    batch_tasks.add(task)
+    task.add_done_callback(batch_tasks.discard)
+
+    return {
+        "batch_id": str(batch_id),
+        "total": len(items),
+        "files": [{"file_id": str(item["file_id"]), "filename": item["filename"], "status": item["status"]} for item in items],
+        "skipped": skipped,
+    }
+
+
+async def run_batch(db, items: list, redis=None):
+    """
+    Process a batch's files concurrently: PDFs up to BATCH_PDF_CONCURRENCY
+    at a time (each one's extraction spread over the PDF process pool and
+    overlapped with its indexing and chunk writes), audio up to
+    TRANSCRIBE_WORKERS, each waiting for a global transcription slot.
+    Files with the same bytes are processed once and the copies pointed
+    at the result.
+    """
+    slots = {
+        "pdf": asyncio.Semaphore(max(settings.BATCH_PDF_CONCURRENCY, 1)),
+        "audio": asyncio.Semaphore(max(settings.TRANSCRIBE_WORKERS, 1)),
+    }
+    groups = {}
+    for item in items:
+        groups.setdefault(item["sha256"], []).append(item)
+
+    async def one(group):
+        first, copies = group[0], group[1:]
+        for copy in copies:
+            os.remove(copy["path"])
+        copy_ids = [copy["file_id"] for copy in copies]
+        try:
+            async with slots[first["type"]]:
+                if first["type"] == "pdf":
+                    try:
+                        fields = await process_pdf(db, first["file_id"], first["path"], first["sha256"], first["size"], redis)
+                    finally:
+                        os.remove(first["path"])
+                else:
+                    async with admission.slot(redis, "transcription", wait=True):
+                        fields = await process_audio_job({
+                            "db": db, "file_id": first["file_id"], "path": first["path"],
+                            "sha256": first["sha256"], "size": first["size"], "redis": redis,
+                        })
+        except asyncio.CancelledError:
+            # Files not started yet are still queued; one being processed is already failed.
+            await db["files"].update_many(
+                {"_id": {"$in": [first["file_id"], *copy_ids]}, "status": {"$in": ["queued", "processing"]}},
+                {"$set": {"status": "failed", "error": INTERRUPTED}},
+            )
+            if os.path.exists(first["path"]):
+                os.remove(first["path"])
+            raise
+        except Exception as e:
+            print(f"Batch file {first['filename']} failed: {e}")
+            if copy_ids:
+                await db["files"].update_many({"_id": {"$in": copy_ids}}, {"$set": {"status": "failed", "error": str(e)}})
+            return
+        if copy_ids:
+            await db["files"].update_many(
+                {"_id": {"$in": copy_ids}},
+                {"$set": {**fields, "content_id": first["file_id"], "cached": True, "status": "done"}},
+            )
+
+    await asyncio.gather(*(one(group) for group in groups.values()))
+
+
+async def cancel_batches():
+    for task in list(batch_tasks):
+        task.cancel()
+    await asyncio.gather(*batch_tasks, return_exceptions=True)
+
+
+@router.get("/batch/{batch_id}")
+async def batch_status(batch_id: str, request: Request, user: dict = Depends(get_current_user)):
+    """Per-file status of a batch and counts by status."""
+    db = request.app.database
+    try:
+        oid = ObjectId(batch_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch = await db[BATCHES].find_one({"_id": oid, "owner": user["email"]})
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    files, counts = [], {}
+    cursor = db["files"].find({"batch_id": oid}, {"filename": 1, "status": 1, "error": 1, "progress": 1}).sort("_id", 1)
+    async for doc in cursor:
+        entry = {"file_id": str(doc["_id"]), "filename": doc.get("filename"), "status": doc.get("status", "done")}
+        for field in ("error", "progress"):
+            if doc.get(field):
+                entry[field] = doc[field]
+        files.append(entry)
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    return {
+        "batch_id": batch_id,
+        "total": batch["total"],
+        "counts": counts,
+        "finished": counts.get("done", 0) + counts.get("failed", 0) == batch["total"],
+        "files": files,
+        "skipped": batch.get("skipped", []),
+    }
+
+
+@router.get("/cache/stats")
+async def cache_stats(request: Request):
+    return await content_cache.stats(request.app.database)
+
+
+@router.get("/transcriber")
+async def transcriber_info():
+    """Whisper model size, load time and memory, as seen by a transcription worker."""
+    info = await transcription_queue.run(whisper_model.info)
+    info["queue_depth"] = transcription_queue.depth
+    return info
+
+
+@router.get("/")
+async def list_files(request: Request, limit: int = 50, before: str = None, user: dict = Depends(get_current_user)):
+    """
+    The caller's files, newest first. Pass the last `file_id` of a page as
+    `before` to get the next one; served by the (owner, _id) index.
+    """
+    db = request.app.database
+    query = {"owner": user["email"]}
+    if before:
+        try:
+            query["_id"] = {"$lt": ObjectId(before)}
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    cursor = db["files"].find(query, {"filename": 1, "type": 1, "status": 1}).sort("_id", -1).limit(min(max(limit, 1), 200))
+    return [
+        {"file_id": str(doc["_id"]), "filename": doc.get("filename"), "type": doc.get("type"), "status": doc.get("status", "done")}
+        async for doc in cursor
+    ]
+
+
+@router.get("/{file_id}/status")
+async def file_status(file_id: str, request: Request, user: dict = Depends(get_current_user)):
+    db = request.app.database
+    try:
+        oid = ObjectId(file_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    doc = await db["files"].find_one(
+        {"_id": oid, "owner": user["email"]},
+        {"filename": 1, "type": 1, "status": 1, "summary": 1, "error": 1, "progress": 1},
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    status = doc.get("status", "done")
+    response = {
+        "file_id": file_id,
+        "filename": doc.get("filename"),
+        "type": doc.get("type"),
+        "status": status,
+        "summary": doc.get("summary"),
+    }
+    if doc.get("progress"):
+        response["progress"] = doc["progress"]
+    if status == "failed":
+        response["error"] = doc.get("error")
+    if status == "queued":
+        response["queue_depth"] = transcription_queue.depth
+    return response
+
+
+@router.get("/{file_id}/progress")
+async def file_progress(file_id: str, request: Request, user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events for a file being processed: `progress` events with
+    {status, stage, done, total} as pages are extracted or audio chunks
+    transcribed, then a final `done` or `failed` event.
+    """
+    db = request.app.database
+    try:
+        oid = ObjectId(file_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not await db["files"].find_one({"_id": oid, "owner": user["email"]}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return StreamingResponse(
+        progress.events(db, oid),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
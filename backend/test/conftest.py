@@ -1,18 +1,17 @@
 import pytest
 import asyncio
-import sys
-from unittest.mock import MagicMock
-
-# Ensure any import-time usage of `whisper` in app modules is mocked
-mock_whisper = MagicMock()
-mock_whisper.load_model.return_value = MagicMock()
-sys.modules["whisper"] = mock_whisper
+import os
 
 from httpx import AsyncClient, ASGITransport
 from main import app
 from mongomock_motor import AsyncMongoMockClient
 from utils import Settings
 
+# A database of its own: each test flushes it, and must never touch the
+# data of an app using the same Redis (docker-compose's uses database 0).
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+
 def get_test_settings():
     return Settings(
         MONGO_URI="mongodb://mock_test",
@@ -20,7 +19,7 @@ def get_test_settings():
         JWT_SECRET="test_secret",
         ACCESS_TOKEN_EXPIRE_MINUTES=30,
         GROQ_API_KEY="mock_groq_key",
-        REDIS_URL="redis://localhost:6379"
+        REDIS_URL=TEST_REDIS_URL
     )
 
 
@@ -33,32 +32,58 @@ async def mock_db():
 
 @pytest.fixture
 async def client(mock_db):
+    from routers.files import transcription_queue
     app.database = mock_db
     app.mongodb_client = None  
+    app.llm = None  # offline mode unless a test installs a client
+    # Lifespan does not run under ASGITransport; jobs run on the default thread pool.
+    await transcription_queue.start(executor=None)
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
+    await transcription_queue.stop()
 
 @pytest.fixture
 def override_auth():
     from utils import get_current_user
-    app.dependency_overrides[get_current_user] = lambda: {"sub": "test@example.com"}
+    app.dependency_overrides[get_current_user] = lambda: {"email": "test@example.com"}
     yield
     app.dependency_overrides = {}
 
 import redis.asyncio as redis
-from fastapi_limiter import FastAPILimiter
 
 @pytest.fixture(autouse=True)
 async def init_limiter():
-    redis_url = "redis://localhost:6379"
+    import admission
+    # Rate-limit state must not leak between tests, in Redis or in-process.
+    admission.local_buckets.state.clear()
+    admission.local_slots.leases.clear()
+    admission._renewals.clear()
     try:
-        r = redis.from_url(redis_url, encoding="utf-8", decode_responses=True)
-        await FastAPILimiter.init(r)
+        r = redis.from_url(TEST_REDIS_URL, encoding="utf-8", decode_responses=True)
+        await r.flushdb()
+        app.redis = r
         yield
-        await FastAPILimiter.close()
+        app.redis = None
         await r.close()
     except Exception as e:
         print(f"Test Redis Init Failed: {e}")
+        app.redis = None
         yield
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    import doc_cache
+    import retrieval
+    monkeypatch.setattr(retrieval.settings, "INDEX_DIR", str(tmp_path / "indexes"))
+    doc_cache.cache.clear()
+    yield tmp_path / "indexes"
+    doc_cache.cache.clear()
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    # tiktoken downloads its vocabulary on first use; keep tests offline.
+    import context_pack
+    monkeypatch.setattr(context_pack.settings, "LLM_TOKENIZER", "")
+    monkeypatch.setattr(context_pack, "_encoder", None)
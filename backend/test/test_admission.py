@@ -0,0 +1,140 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+import redis.asyncio as redis
+from fastapi import HTTPException
+from httpx import AsyncClient
+
+import admission
+import routers.files
+from llm import LLMClient, StubChain
+from main import app
+from test.test_chat import add_text_file
+from test.test_pdf_extract import fake_reader
+from test.test_vad import speech, write_wav
+
+
+@pytest.fixture(params=["redis", "local", "redis-down"])
+def backend(request):
+    """Run a test against Redis, without it, and with Redis unreachable."""
+    if request.param == "redis" and not app.redis:
+        pytest.skip("Redis is not available")
+    if request.param == "local":
+        app.redis = None
+    if request.param == "redis-down":
+        app.redis = redis.from_url("redis://127.0.0.1:1", socket_connect_timeout=0.2)
+    return request.param
+
+
+@pytest.mark.asyncio
+async def test_chat_bucket(client: AsyncClient, override_auth, backend):
+    await add_text_file("The launch is on Monday.")
+    for _ in range(5):
+        assert (await client.post("/chat/", json={"question": "When is the launch?"})).status_code == 200
+
+    # Both chat endpoints draw from the same per-user bucket.
+    response = await client.post("/chat/stream", json={"question": "When is the launch?"})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 12
+
+
+@pytest.mark.asyncio
+async def test_upload_cost(client: AsyncClient, mock_db, override_auth, monkeypatch, backend):
+    monkeypatch.setattr(admission.settings, "UPLOAD_BUCKET_SIZE", 2)
+    monkeypatch.setattr(admission.settings, "UPLOAD_REFILL_PER_SECOND", 0.01)
+
+    def pdf(name, body):
+        return {"file": (name, b"%PDF-1.4 " + body, "application/pdf")}
+
+    with patch("pdf_extract.PdfReader", return_value=fake_reader(["Page one."])):
+        assert (await client.post("/files/upload", files=pdf("a.pdf", b"first"))).status_code == 200
+        assert (await client.post("/files/upload", files=pdf("b.pdf", b"second"))).status_code == 200
+        response = await client.post("/files/upload", files=pdf("c.pdf", b"third"))
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 60
+
+        # Known content costs nothing.
+        assert (await client.post("/files/upload", files=pdf("copy.pdf", b"first"))).status_code == 200
+    assert await mock_db["files"].count_documents({}) == 3
+
+
+def test_upload_cost_weights(tmp_path):
+    recording = tmp_path / "talk.wav"
+    write_wav(recording, speech(90))
+    size = recording.stat().st_size
+    per_minute = admission.settings.UPLOAD_AUDIO_COST_PER_MINUTE
+
+    assert admission.upload_cost(str(recording), ".wav", size, audio=True) == pytest.approx(1.5 * per_minute)
+    assert admission.upload_cost("talk.mp3", ".mp3", 3 * admission.MIB, audio=True) == pytest.approx(3 * per_minute)
+    assert admission.upload_cost("a.pdf", ".pdf", 5 * admission.MIB, audio=False) == 5
+    assert admission.upload_cost("a.pdf", ".pdf", 100, audio=False) == 1
+
+
+@pytest.mark.asyncio
+async def test_llm_slots_full(client: AsyncClient, override_auth, monkeypatch, backend):
+    await add_text_file("The launch is on Monday.")
+    app.llm = LLMClient(StubChain(latency_ms=1), concurrency=2, timeout=5)
+    monkeypatch.setattr(admission.settings, "LLM_GLOBAL_SLOTS", 0)
+
+    for path in ("/chat/", "/chat/stream"):
+        response = await client.post(path, json={"question": "When is the launch?"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+
+
+@pytest.mark.asyncio
+async def test_transcription_slots(client: AsyncClient, mock_db, override_auth, monkeypatch, backend):
+    monkeypatch.setattr(admission.settings, "TRANSCRIBE_GLOBAL_SLOTS", 1)
+    gate = asyncio.Event()
+
+    async def held_job(job):
+        await gate.wait()
+        await admission.release(job["redis"], job["lease"])
+
+    monkeypatch.setattr(routers.files.transcription_queue, "handler", held_job)
+    await routers.files.transcription_queue.stop()
+    await routers.files.transcription_queue.start(executor=None)
+
+    assert (await client.post("/files/upload", files={"file": ("a.mp3", b"one", "audio/mpeg")})).status_code == 202
+    response = await client.post("/files/upload", files={"file": ("b.mp3", b"two", "audio/mpeg")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert await mock_db["files"].count_documents({}) == 1
+
+    gate.set()
+    await routers.files.transcription_queue.join()
+    assert (await client.post("/files/upload", files={"file": ("b.mp3", b"two", "audio/mpeg")})).status_code == 202
+    await routers.files.transcription_queue.join()
+
+
+@pytest.mark.asyncio
+async def test_slot_leases_expire(monkeypatch, backend):
+    monkeypatch.setitem(admission.SLOTS, "llm", ("LLM_GLOBAL_SLOTS", 0.2, 5))
+    monkeypatch.setattr(admission.settings, "LLM_GLOBAL_SLOTS", 1)
+    monkeypatch.setattr(admission.settings, "SLOT_POLL_SECONDS", 0.05)
+
+    await admission.acquire(app.redis, "llm")  # never released
+    with pytest.raises(HTTPException) as e:
+        await admission.acquire(app.redis, "llm")
+    assert e.value.status_code == 503
+
+    lease = await asyncio.wait_for(admission.acquire(app.redis, "llm", wait=True), 5)
+    await admission.release(app.redis, lease)
+    await admission.release(app.redis, await admission.acquire(app.redis, "llm"))
+
+
+@pytest.mark.asyncio
+async def test_held_leases_outlive_their_term(monkeypatch, backend):
+    monkeypatch.setitem(admission.SLOTS, "transcription", ("TRANSCRIBE_GLOBAL_SLOTS", 0.3, 30))
+    monkeypatch.setattr(admission.settings, "TRANSCRIBE_GLOBAL_SLOTS", 1)
+
+    lease = admission.hold(app.redis, await admission.acquire(app.redis, "transcription"))
+    await asyncio.sleep(1)
+    with pytest.raises(HTTPException) as e:
+        await admission.acquire(app.redis, "transcription")
+    assert e.value.status_code == 503
+
+    await admission.release(app.redis, lease)
+    assert not admission._renewals
+    await admission.release(app.redis, await admission.acquire(app.redis, "transcription"))
@@ -0,0 +1,126 @@
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch, MagicMock, AsyncMock
+
+import answer_cache
+from main import app
+from llm import LLMClient
+
+
+def test_normalize():
+    assert answer_cache.normalize("  What is   the Warranty?! ") == "what is the warranty"
+
+
+async def upload_manual(client):
+    page = MagicMock()
+    page.extract_text.return_value = "Filler text. " * 50 + "The warranty covers water damage for two years. "
+    with patch("pdf_extract.PdfReader") as MockPdfReader:
+        MockPdfReader.return_value.pages = [page]
+        response = await client.post("/files/upload", files={"file": ("manual.pdf", b"%PDF manual", "application/pdf")})
+    assert response.status_code == 200
+
+
+def test_near_duplicates_share_terms():
+    terms = answer_cache.terms
+    assert terms("how long does the warranty cover water damage") == terms("how long does warranty cover water damage")
+    assert terms("what was revenue in fiscal year 2020") != terms("what was revenue in fiscal year 2021")
+    assert terms("does the clause apply") != terms("does the clause not apply")
+    assert terms("does the clause apply") != terms("doesn t the clause apply")
+
+
+@pytest.mark.asyncio
+async def test_repeated_question_served_from_cache(client: AsyncClient, override_auth, monkeypatch):
+    if not app.redis:
+        pytest.skip("Redis not available")
+    monkeypatch.setattr(answer_cache.settings, "ANSWER_CACHE_SEMANTIC", True)
+    await upload_manual(client)
+
+    app.llm = None  # offline mode
+    first = (await client.post("/chat/", json={"question": "How long does the warranty cover water damage?"})).json()
+    with patch("routers.chat.retrieval.load_file_index") as load_index:
+        exact = (await client.post("/chat/", json={"question": "how long does the WARRANTY cover water damage"})).json()
+        near = (await client.post("/chat/", json={"question": "how long does warranty cover water damage"})).json()
+        load_index.assert_not_called()
+
+    assert first["cache"] == "miss"
+    assert exact["cache"] == "hit"
+    assert near["cache"] == "near_hit"
+    assert exact["answer"] == near["answer"] == first["answer"]
+
+    stats = (await client.get("/chat/cache/stats")).json()
+    assert stats == {"hits": 1, "near_hits": 1, "misses": 1, "hit_rate": round(2 / 3, 4)}
+
+
+@pytest.mark.asyncio
+async def test_different_year_is_not_a_near_hit(override_auth, monkeypatch):
+    if not app.redis:
+        pytest.skip("Redis not available")
+    monkeypatch.setattr(answer_cache.settings, "ANSWER_CACHE_SEMANTIC", True)
+    await answer_cache.put(app.redis, "c1", "What was the total revenue in fiscal year 2020?", "5 million")
+
+    assert await answer_cache.get(app.redis, "c1", "What was the total revenue in fiscal year 2021?") == (None, "miss")
+    assert await answer_cache.get(app.redis, "c1", "what was total revenue in fiscal year 2020") == ("5 million", "near_hit")
+
+
+@pytest.mark.asyncio
+async def test_llm_failure_not_cached(client: AsyncClient, override_auth):
+    if not app.redis:
+        pytest.skip("Redis not available")
+    await upload_manual(client)
+
+    failing = MagicMock()
+    failing.ainvoke = AsyncMock(side_effect=RuntimeError("groq down"))
+    app.llm = LLMClient(failing, concurrency=1, timeout=5)
+
+    first = (await client.post("/chat/", json={"question": "warranty water damage"})).json()
+    second = (await client.post("/chat/", json={"question": "warranty water damage"})).json()
+
+    assert "warranty covers water damage" in first["answer"]
+    assert first["cache"] == second["cache"] == "miss"
+
+
+@pytest.mark.asyncio
+async def test_failed_file_is_not_answered_or_cached(client: AsyncClient, override_auth, index_dir):
+    if not app.redis:
+        pytest.skip("Redis not available")
+    files = app.database["files"]
+    failed = await files.insert_one(
+        {"owner": "test@example.com", "filename": "manual.pdf", "type": "pdf", "status": "failed", "error": "boom", "sha256": "s1"}
+    )
+    response = (await client.post("/chat/", json={"question": "warranty water damage", "file_id": str(failed.inserted_id)})).json()
+    assert "could not be processed" in response["answer"]
+    assert "cache" not in response
+    assert not index_dir.exists() or not any(index_dir.iterdir())
+
+    # The same bytes uploaded again successfully are answered from their text.
+    done = await files.insert_one(
+        {"owner": "test@example.com", "filename": "manual.pdf", "type": "pdf", "status": "done", "sha256": "s1",
+         "text": "The warranty covers water damage for two years."}
+    )
+    response = (await client.post("/chat/", json={"question": "warranty water damage", "file_id": str(done.inserted_id)})).json()
+    assert response["cache"] == "miss"
+    assert "two years" in response["answer"]
+
+
+@pytest.mark.asyncio
+async def test_cached_answer_names_the_askers_files(client: AsyncClient, override_auth):
+    if not app.redis:
+        pytest.skip("Redis not available")
+    from utils import get_current_user
+
+    async def upload_pair(owner, manual, memo):
+        ids = []
+        for name, sha, text in ((manual, "m1", "The pump runs on three phase power."), (memo, "m2", "Lunch is served at noon.")):
+            doc = {"owner": owner, "filename": name, "type": "pdf", "status": "done", "sha256": sha, "text": text}
+            ids.append(str((await app.database["files"].insert_one(doc)).inserted_id))
+        return ids
+
+    question = {"question": "when is lunch served"}
+    first = (await client.post("/chat/", json={**question, "file_ids": await upload_pair("test@example.com", "manual.pdf", "memo.pdf")})).json()
+    assert first == {"answer": 'Based on "memo.pdf": "Lunch is served at noon."', "cache": "miss"}
+
+    # Another user with the same bytes under other names gets their own names.
+    app.dependency_overrides[get_current_user] = lambda: {"email": "other@example.com"}
+    ids = await upload_pair("other@example.com", "pump.pdf", "canteen.pdf")
+    second = (await client.post("/chat/", json={**question, "file_ids": ids})).json()
+    assert second == {"answer": 'Based on "canteen.pdf": "Lunch is served at noon."', "cache": "hit"}
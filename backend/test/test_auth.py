@@ -45,3 +45,55 @@ async def test_guest_login(client: AsyncClient):
     assert response.status_code == 200
     data = response.json()
     assert "access_token" in data
+
+
+@pytest.mark.asyncio
+async def test_login_upgrades_outdated_hash(client: AsyncClient, mock_db):
+    from passlib.context import CryptContext
+    weak = CryptContext(schemes=["argon2"], argon2__time_cost=1, argon2__memory_cost=1024, argon2__parallelism=1)
+    await mock_db["users"].insert_one({"email": "old@example.com", "password": weak.hash("password123")})
+
+    response = await client.post("/auth/token", data={"username": "old@example.com", "password": "password123"})
+    assert response.status_code == 200
+    stored = (await mock_db["users"].find_one({"email": "old@example.com"}))["password"]
+    assert "m=65536,t=3,p=4" in stored
+
+    response = await client.post("/auth/token", data={"username": "old@example.com", "password": "password123"})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_verified_token_is_cached(client: AsyncClient):
+    from unittest.mock import patch
+    import utils
+    utils.token_cache.clear()
+    token = (await client.post("/auth/guest")).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch("utils.jwt.decode", wraps=utils.jwt.decode) as decode:
+        assert (await client.get("/files/", headers=headers)).status_code == 200
+        assert (await client.get("/files/", headers=headers)).status_code == 200
+        assert decode.call_count == 1
+
+        # Tokens that fail verification are never cached.
+        for _ in range(2):
+            response = await client.get("/files/", headers={"Authorization": f"Bearer {token}x"})
+            assert response.status_code == 401
+        assert decode.call_count == 3
+
+
+def test_token_cache_expires_and_evicts():
+    import time
+    from utils import TokenCache
+    cache = TokenCache(size=2)
+    cache.put("stale", "a@example.com", time.time() - 1)
+    assert cache.get("stale") is None
+    assert "stale" not in cache.entries
+
+    later = time.time() + 60
+    cache.put("one", "a@example.com", later)
+    cache.put("two", "b@example.com", later)
+    cache.get("one")
+    cache.put("three", "c@example.com", later)
+    assert cache.get("two") is None
+    assert cache.get("one") == "a@example.com"
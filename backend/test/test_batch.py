@@ -0,0 +1,146 @@
+import asyncio
+import io
+import os
+import tarfile
+import zipfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+from httpx import AsyncClient
+
+import archive
+import routers.files
+import whisper_model
+from test.test_pdf_extract import fake_reader
+
+
+def zip_of(members: dict) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def tar_of(members: dict) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+async def finish_batches():
+    await asyncio.gather(*routers.files.batch_tasks)
+    await routers.files.transcription_queue.join()
+
+
+@pytest.mark.asyncio
+async def test_batch_of_files_and_archives(client: AsyncClient, mock_db, override_auth):
+    parts = [
+        ("files", ("a.pdf", b"%PDF-1.4 a", "application/pdf")),
+        ("files", ("copy-of-a.pdf", b"%PDF-1.4 a", "application/pdf")),
+        ("files", ("notes.txt", b"plain text", "text/plain")),
+        ("files", ("more.zip", zip_of({"docs/b.pdf": b"%PDF-1.4 b", "docs/readme.md": b"#"}), "application/zip")),
+        ("files", ("audio.tar.gz", tar_of({"talk.mp3": b"fake audio"}), "application/gzip")),
+    ]
+    whisper = MagicMock()
+    whisper.transcribe.return_value = {"segments": [{"start": 0.0, "end": 1.0, "text": " Hello."}]}
+    reader = fake_reader(["Page one.", "Page two."])
+    with patch("pdf_extract.PdfReader", return_value=reader), patch.object(whisper_model.manager, "model", whisper):
+        response = await client.post("/files/batch", files=parts)
+        assert response.status_code == 202
+        batch = response.json()
+        await finish_batches()
+
+    assert batch["total"] == 4
+    assert [f["filename"] for f in batch["files"]] == ["a.pdf", "copy-of-a.pdf", "b.pdf", "talk.mp3"]
+    assert sorted(batch["skipped"]) == ["notes.txt", "readme.md"]
+    # The two identical PDFs were extracted once.
+    assert reader.pages[0].extract_text.call_count == 2
+
+    status = (await client.get(f"/files/batch/{batch['batch_id']}")).json()
+    assert status["finished"] is True
+    assert status["counts"] == {"done": 4}
+
+    first, copy = batch["files"][0]["file_id"], batch["files"][1]["file_id"]
+    copy_doc = await mock_db["files"].find_one({"filename": "copy-of-a.pdf"})
+    assert str(copy_doc["content_id"]) == first and copy_doc["cached"] is True
+    assert (await client.get(f"/files/{copy}/status")).json()["summary"].startswith("PDF Content Preview")
+
+    # A second batch of known content is answered from the content cache.
+    with patch("pdf_extract.PdfReader", return_value=reader):
+        again = (await client.post("/files/batch", files=parts[:1])).json()
+        await finish_batches()
+    assert again["files"][0]["status"] == "done"
+    assert reader.pages[0].extract_text.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_failures_are_per_file(client: AsyncClient, mock_db, override_auth):
+    parts = [
+        ("files", ("good.pdf", b"%PDF-1.4 good", "application/pdf")),
+        ("files", ("bad.pdf", b"%PDF-1.4 bad", "application/pdf")),
+    ]
+
+    def reader_for(path):
+        if open(path, "rb").read().endswith(b"bad"):
+            raise ValueError("not a PDF")
+        return fake_reader(["Fine."])
+
+    with patch("pdf_extract.PdfReader", side_effect=reader_for):
+        batch = (await client.post("/files/batch", files=parts)).json()
+        await finish_batches()
+
+    status = (await client.get(f"/files/batch/{batch['batch_id']}")).json()
+    assert status["counts"] == {"done": 1, "failed": 1}
+    failed = next(f for f in status["files"] if f["status"] == "failed")
+    assert failed["filename"] == "bad.pdf" and "not a PDF" in failed["error"]
+
+
+@pytest.mark.asyncio
+async def test_batch_limits(client: AsyncClient, mock_db, override_auth, monkeypatch):
+    response = await client.post("/files/batch", files=[("files", ("x.txt", b"x", "text/plain"))])
+    assert response.status_code == 400
+
+    response = await client.post("/files/batch", files=[("files", ("x.zip", b"not a zip", "application/zip"))])
+    assert response.status_code == 400
+
+    monkeypatch.setattr(routers.files.settings, "BATCH_MAX_BYTES", 100)
+    bomb = zip_of({"big.pdf": b"%PDF" + b"0" * 1000})
+    response = await client.post("/files/batch", files=[("files", ("bomb.zip", bomb, "application/zip"))])
+    assert response.status_code == 413
+    assert await mock_db["files"].count_documents({}) == 0
+
+    other = await mock_db["batches"].insert_one({"owner": "someone@example.com", "total": 0})
+    assert (await client.get(f"/files/batch/{other.inserted_id}")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_batch_file_count_includes_archive_members(client: AsyncClient, mock_db, override_auth, monkeypatch, tmp_path):
+    monkeypatch.setattr(routers.files.settings, "BATCH_MAX_FILES", 3)
+    members = {f"{i}.pdf": b"%PDF-1.4" for i in range(5)}
+    parts = [
+        ("files", ("a.pdf", b"%PDF-1.4 a", "application/pdf")),
+        ("files", ("many.zip", zip_of(members), "application/zip")),
+    ]
+    response = await client.post("/files/batch", files=parts)
+    assert response.status_code == 413
+    assert await mock_db["files"].count_documents({}) == 0
+
+    # Unpacking stops at the first member over the limit, and what was spooled is removed.
+    path = tmp_path / "many.zip"
+    path.write_bytes(zip_of(members))
+    spool, spooled = archive.ingest.spool_stream, []
+
+    def counting_spool(*args, **kwargs):
+        spooled.append(spool(*args, **kwargs)[0])
+        return spooled[-1], "", 0
+
+    monkeypatch.setattr(archive.ingest, "spool_stream", counting_spool)
+    with pytest.raises(archive.TooLarge):
+        archive.expand(str(path), {".pdf"}, 10**6, 2)
+    assert len(spooled) == 2
+    assert not any(os.path.exists(p) for p in spooled)
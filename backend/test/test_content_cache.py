@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch, MagicMock
+
+import content_cache
+import routers.files
+import whisper_model
+from main import app
+
+
+def pdf_reader_with(text):
+    page = MagicMock()
+    page.extract_text.return_value = text
+    reader = MagicMock()
+    reader.pages = [page]
+    return reader
+
+
+@pytest.mark.asyncio
+async def test_reupload_reuses_content(client: AsyncClient, mock_db, override_auth):
+    upload = {"file": ("report.pdf", b"%PDF-1.4 same bytes", "application/pdf")}
+
+    reader = pdf_reader_with("Quarterly revenue grew by nine percent. ")
+    with patch("pdf_extract.PdfReader", return_value=reader):
+        first = (await client.post("/files/upload", files=upload)).json()
+    calls = reader.pages[0].extract_text.call_count
+
+    renamed = {"file": ("copy.pdf", b"%PDF-1.4 same bytes", "application/pdf")}
+    with patch("pdf_extract.PdfReader", return_value=reader):
+        second = (await client.post("/files/upload", files=renamed)).json()
+
+    assert reader.pages[0].extract_text.call_count == calls
+    assert second["cached"] is True
+    assert second["summary"] == first["summary"]
+    assert second["file_id"] != first["file_id"]
+
+    doc = await mock_db["files"].find_one({"filename": "copy.pdf"})
+    assert str(doc["content_id"]) == first["file_id"]
+    assert await mock_db["file_chunks"].count_documents({}) == 1
+
+    # The deduplicated file answers from the shared chunks and index.
+    app.llm = None  # offline mode
+    response = await client.post("/chat/", json={"question": "revenue grew"})
+    assert "revenue grew" in response.json()["answer"]
+
+    stats = (await client.get("/files/cache/stats")).json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reupload_audio_skips_transcription(client: AsyncClient, override_auth):
+    model = MagicMock()
+    model.transcribe.return_value = {"segments": [{"start": 0.0, "end": 1.0, "text": " Hello world."}]}
+    upload = {"file": ("talk.mp3", b"same audio", "audio/mpeg")}
+
+    with patch.object(whisper_model.manager, "model", model):
+        first = await client.post("/files/upload", files=upload)
+        assert first.status_code == 202
+        await routers.files.transcription_queue.join()
+        second = await client.post("/files/upload", files=upload)
+
+    assert second.status_code == 200
+    assert second.json()["cached"] is True
+    model.transcribe.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_evict_by_age_and_lru(mock_db):
+    now = datetime.utcnow()
+    for i, age in enumerate([0, 1, 2, 40]):
+        await mock_db["content_cache"].insert_one({
+            "_id": f"h{i}", "content_id": i, "size": 100, "last_used_at": now - timedelta(days=age),
+        })
+        await mock_db["pdf_pages"].insert_one({"sha256": f"h{i}", "page": 1, "text": "x"})
+
+    evicted = await content_cache.evict(mock_db, max_entries=2, max_bytes=0, max_age_days=30)
+
+    assert sorted(evicted) == ["h2", "h3"]
+    assert await mock_db["content_cache"].count_documents({}) == 2
+    assert await mock_db["pdf_pages"].count_documents({"sha256": {"$in": ["h2", "h3"]}}) == 0
+
+    assert await content_cache.evict(mock_db, max_entries=0, max_bytes=150, max_age_days=0) == ["h1"]
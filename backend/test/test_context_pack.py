@@ -0,0 +1,71 @@
+import asyncio
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+import context_pack
+from context_pack import count_tokens, pack, truncate
+from retrieval import VectorIndex
+
+
+def hit(score, start, text):
+    return {"score": score, "start": start, "end": start + len(text), "text": text}
+
+
+def test_count_and_truncate():
+    assert count_tokens("Hello, world!") == 4
+    assert truncate("one two three four", 2) == "one two "
+    assert truncate("one two", 5) == "one two"
+
+
+def test_pack_keeps_best_within_budget():
+    hits = [hit(0.2, 0, "low " * 10), hit(0.9, 100, "best " * 10), hit(0.5, 200, "mid " * 10)]
+    context, spans, tokens = pack(hits, budget=20)
+    assert tokens == 20
+    # best and mid fit; results come back in document order
+    assert [s["start"] for s in spans] == [100, 200]
+    assert context.startswith("best")
+
+
+def test_pack_counts_overlap_once():
+    text = "alpha beta gamma delta epsilon zeta eta theta"
+    first = hit(0.9, 0, text[:22])     # "alpha beta gamma delta"
+    second = hit(0.8, 11, text[11:])   # "gamma delta ... theta"
+    context, spans, tokens = pack([first, second], budget=100)
+    assert context == text
+    assert len(spans) == 1
+    assert tokens == count_tokens(text)
+
+
+def test_pack_skips_covered_chunks_and_truncates_oversized():
+    big = hit(0.9, 0, "word " * 50)
+    inside = hit(0.5, 10, big["text"][10:30])
+    context, spans, tokens = pack([big, inside], budget=8)
+    assert tokens == 8
+    assert len(spans) == 1
+    assert context == "word " * 8
+
+
+def test_late_passage_is_packed():
+    text = "Filler about the weather. " * 2000 + "The escape hatch code is 4471. " + "More filler. " * 200
+    index = VectorIndex.build(text)
+    context, spans, tokens = pack(index.search("escape hatch code", k=8), budget=1000)
+    assert "escape hatch code is 4471" in context
+    assert tokens <= 1000
+
+
+@pytest.mark.asyncio
+async def test_encoding_load_gives_up_and_approximates(monkeypatch):
+    tiktoken = MagicMock()
+    tiktoken.get_encoding.side_effect = lambda name: time.sleep(0.5)  # a download that hangs
+    monkeypatch.setitem(sys.modules, "tiktoken", tiktoken)
+    monkeypatch.setattr(context_pack.settings, "LLM_TOKENIZER", "cl100k_base")
+    monkeypatch.setattr(context_pack.settings, "TOKENIZER_LOAD_TIMEOUT", 0.05)
+
+    started = time.perf_counter()
+    assert await context_pack.load_encoding() is None
+    assert time.perf_counter() - started < 0.4
+    assert count_tokens("three plain words") == 3
+    await asyncio.sleep(0.5)  # let the abandoned thread finish before the patch is undone
@@ -0,0 +1,100 @@
+import asyncio
+import shutil
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from httpx import AsyncClient
+
+import doc_cache
+import routers.files
+import whisper_model
+from main import app
+
+
+def test_lru_bounded_by_bytes():
+    cache = doc_cache.DocCache(max_bytes=1000, max_entries=10)
+    cache.put("vectors", "a", np.zeros(400, dtype=np.uint8), "v1")
+    cache.put("vectors", "b", np.zeros(400, dtype=np.uint8), "v1")
+    assert cache.get("vectors", "a", "v1") is not None  # now most recently used
+    cache.put("pages", "c", np.zeros(400, dtype=np.uint8), "v1")
+
+    assert cache.get("vectors", "b", "v1") is None
+    assert cache.get("vectors", "a", "v1") is not None and cache.get("pages", "c", "v1") is not None
+    assert cache.bytes == 800
+    # Other content under the same key is a different entry.
+    assert cache.get("vectors", "a", "v2") is None
+
+    cache.put("pages", "a", np.zeros(10, dtype=np.uint8), "v1")
+    cache.drop("a")
+    assert list(cache.entries) == [("pages", "c", "v1")]
+
+    # An entry over the whole budget still fits, alone.
+    cache.put("vectors", "big", np.zeros(5000, dtype=np.uint8))
+    assert list(cache.entries) == [("vectors", "big", "")]
+
+
+def test_lru_bounded_by_entries():
+    cache = doc_cache.DocCache(max_bytes=1 << 30, max_entries=2)
+    for key in "abc":
+        cache.put("segments", key, [1, 2, 3])
+    assert [entry[1] for entry in cache.entries] == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_repeat_questions_need_only_file_metadata(client: AsyncClient, mock_db, override_auth, index_dir):
+    pages = []
+    for text in ["Introduction to the manual. ", "Safety notes for operators. ", "The fuse is rated for ten amps. "]:
+        page = MagicMock()
+        page.extract_text.return_value = text * 40
+        pages.append(page)
+    model = MagicMock()
+    model.transcribe.return_value = {"segments": [
+        {"start": 0.0, "end": 5.0, "text": " Welcome to the show."},
+        {"start": 65.0, "end": 70.0, "text": " The budget review starts now."},
+    ]}
+    with patch("pdf_extract.PdfReader") as MockPdfReader, patch.object(whisper_model.manager, "model", model):
+        MockPdfReader.return_value.pages = pages
+        manual = (await client.post("/files/upload", files={"file": ("manual.pdf", b"%PDF-1.4 manual", "application/pdf")})).json()
+        show = (await client.post("/files/upload", files={"file": ("show.mp3", b"audio bytes", "audio/mpeg")})).json()
+        await routers.files.transcription_queue.join()
+
+    app.redis = None  # no answer cache: every question goes through retrieval
+    questions = [
+        {"question": "fuse rated amps", "file_id": manual["file_id"]},
+        {"question": "budget review", "file_id": show["file_id"]},
+    ]
+    first = [(await client.post("/chat/", json=q)).json()["answer"] for q in questions]
+    assert first[0].endswith("(page 3)") and first[1].endswith("[01:05]")
+
+    # Everything but the file documents is gone; cached state still answers.
+    for name in ("file_chunks", "segment_maps", "pdf_pages"):
+        await mock_db[name].drop()
+    shutil.rmtree(index_dir)
+    assert [(await client.post("/chat/", json=q)).json()["answer"] for q in questions] == first
+
+
+@pytest.mark.asyncio
+async def test_invalidation_reaches_every_worker():
+    if not app.redis:
+        pytest.skip("Redis is not available")
+    doc_cache.cache.put("pages", "f1", np.zeros(4), "v1")
+    doc_cache.cache.put("pages", "f2", np.zeros(4), "v1")
+    listener = asyncio.create_task(doc_cache.listen(app.redis))
+    try:
+        for _ in range(100):
+            if (await app.redis.pubsub_numsub(doc_cache.CHANNEL))[0][1]:
+                break
+            await asyncio.sleep(0.01)
+
+        # As published by another worker.
+        await app.redis.publish(doc_cache.CHANNEL, "f1")
+        for _ in range(100):
+            if doc_cache.cache.get("pages", "f1", "v1") is None:
+                break
+            await asyncio.sleep(0.01)
+        assert doc_cache.cache.get("pages", "f1", "v1") is None
+        assert doc_cache.cache.get("pages", "f2", "v1") is not None
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
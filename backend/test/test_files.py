@@ -1,39 +1,88 @@
+import asyncio
+import os
+
 import pytest
 from httpx import AsyncClient
 from unittest.mock import patch, MagicMock
+import ingest
 import routers.files
+import whisper_model
+from jobs import JobQueue, QueueFull
 
 # Mock Whisper Model
-# We patch the 'model' variable in routers.files directly
+# We patch the resident model held by the whisper_model manager
 @pytest.fixture
 def mock_whisper():
     mock = MagicMock()
     mock.transcribe.return_value = {
         "text": "This is a mocked transcription.", 
-        "segments": [{"start": 0.0, "end": 1.0, "text": "This is"}]
+        "segments": [
+            {"start": 0.0, "end": 1.0, "text": " This is"},
+            {"start": 1.0, "end": 2.5, "text": " a mocked transcription."},
+        ]
     }
-    with patch.object(routers.files, "model", mock):
+    with patch.object(whisper_model.manager, "model", mock):
         yield mock
 
 @pytest.mark.asyncio
-async def test_upload_audio(client: AsyncClient, mock_whisper, override_auth):
+async def test_upload_audio(client: AsyncClient, mock_db, mock_whisper, override_auth):
     
     files = {"file": ("test_audio.mp3", b"fake audio content", "audio/mpeg")}
     
     response = await client.post("/files/upload", files=files)
     
-    assert response.status_code == 200
+    assert response.status_code == 202
     data = response.json()
     assert data["filename"] == "test_audio.mp3"
-    assert "transcription" in data
-    assert data["transcription"] == "This is a mocked transcription."
+    assert data["status"] == "queued"
+    assert data["job_id"] == data["file_id"]
+
+    await routers.files.transcription_queue.join()
+
+    response = await client.get(f"/files/{data['file_id']}/status")
+    assert response.status_code == 200
+    status = response.json()
+    assert status["status"] == "done"
+    assert "This is a mocked transcription." in status["summary"]
     
     mock_whisper.transcribe.assert_called_once()
 
+    chunks = [c async for c in mock_db["file_chunks"].find({})]
+    assert [c["text"] for c in chunks] == ["This is a mocked transcription."]
+    bounds, starts, _ = ingest.unpack_segments(chunks[0]["segments"])
+    assert bounds.tolist() == [0, len("This is"), len("This is a mocked transcription.")]
+    assert starts.tolist() == [0.0, 1.0]
+
+@pytest.mark.asyncio
+async def test_upload_audio_failure_reported(client: AsyncClient, mock_whisper, override_auth):
+    mock_whisper.transcribe.side_effect = RuntimeError("ffmpeg not found")
+
+    response = await client.post("/files/upload", files={"file": ("bad.wav", b"xx", "audio/wav")})
+    assert response.status_code == 202
+    await routers.files.transcription_queue.join()
+
+    status = (await client.get(f"/files/{response.json()['file_id']}/status")).json()
+    assert status["status"] == "failed"
+    assert "ffmpeg not found" in status["error"]
+
+@pytest.mark.asyncio
+async def test_upload_audio_queue_full(client: AsyncClient, mock_db, override_auth):
+    with patch.object(routers.files.transcription_queue, "submit", side_effect=QueueFull("full")):
+        response = await client.post("/files/upload", files={"file": ("a.mp3", b"xx", "audio/mpeg")})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert await mock_db["files"].count_documents({}) == 0
+
+@pytest.mark.asyncio
+async def test_status_unknown_file(client: AsyncClient, override_auth):
+    assert (await client.get("/files/not-an-id/status")).status_code == 404
+    assert (await client.get("/files/0123456789abcdef01234567/status")).status_code == 404
+
 @pytest.mark.asyncio
 async def test_upload_pdf(client: AsyncClient, override_auth):
     
-    with patch("routers.files.PdfReader") as MockPdfReader:
+    with patch("pdf_extract.PdfReader") as MockPdfReader:
         mock_reader = MockPdfReader.return_value
         mock_page = MagicMock()
         mock_page.extract_text.return_value = "Mocked PDF content."
@@ -44,4 +93,73 @@ async def test_upload_pdf(client: AsyncClient, override_auth):
         
         assert response.status_code == 200
         data = response.json()
-        assert "Mocked PDF content" in data["transcription"]
+        assert "Mocked PDF content" in data["summary"]
+        assert "transcription" not in data
+
+@pytest.mark.asyncio
+async def test_files_are_scoped_to_owner(client: AsyncClient, mock_db, override_auth):
+    with patch("pdf_extract.PdfReader") as MockPdfReader:
+        page = MagicMock()
+        page.extract_text.return_value = "Owned content."
+        MockPdfReader.return_value.pages = [page]
+        first = (await client.post("/files/upload", files={"file": ("a.pdf", b"%PDF a", "application/pdf")})).json()
+        second = (await client.post("/files/upload", files={"file": ("b.pdf", b"%PDF b", "application/pdf")})).json()
+    other = await mock_db["files"].insert_one({"owner": "other@example.com", "filename": "c.pdf", "status": "done"})
+
+    assert (await mock_db["files"].find_one({"filename": "a.pdf"}))["owner"] == "test@example.com"
+    listed = (await client.get("/files/")).json()
+    assert [f["filename"] for f in listed] == ["b.pdf", "a.pdf"]
+    page = (await client.get("/files/", params={"before": second["file_id"]})).json()
+    assert [f["file_id"] for f in page] == [first["file_id"]]
+    assert (await client.get(f"/files/{other.inserted_id}/status")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_job_queue_bounded():
+    queue = JobQueue("test", handler=None, concurrency=0, maxsize=1)
+    with pytest.raises(RuntimeError):
+        queue.submit({})
+
+    await queue.start()  # no workers, so nothing drains
+    queue.submit({"n": 1})
+    with pytest.raises(QueueFull):
+        queue.submit({"n": 2})
+    assert queue.depth == 1
+
+
+@pytest.mark.asyncio
+async def test_shutdown_fails_running_and_queued_jobs(client: AsyncClient, mock_db, override_auth, monkeypatch):
+    import admission
+    from main import app
+    paths = []
+    started = asyncio.Event()
+
+    async def never_finishes(path, db, file_id, sha256):
+        paths.append(path)
+        started.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(routers.files, "transcribe_file", never_finishes)
+    await routers.files.transcription_queue.stop()
+    monkeypatch.setattr(routers.files.transcription_queue, "concurrency", 1)
+    await routers.files.transcription_queue.start(executor=None)
+
+    ids = []
+    for name in ("running.mp3", "queued.mp3"):
+        response = await client.post("/files/upload", files={"file": (name, name.encode(), "audio/mpeg")})
+        assert response.status_code == 202
+        ids.append(response.json()["file_id"])
+    await started.wait()
+    paths.extend(job["path"] for job in routers.files.transcription_queue.queue._queue)
+
+    await routers.files.transcription_queue.stop()
+
+    for file_id in ids:
+        status = (await client.get(f"/files/{file_id}/status")).json()
+        assert status["status"] == "failed"
+        assert status["error"] == routers.files.INTERRUPTED
+    assert len(paths) == 2 and not any(os.path.exists(path) for path in paths)
+    assert not any(admission.local_slots.leases.values())
+    if app.redis:
+        assert await app.redis.zcard("admission:slots:transcription") == 0
+    await routers.files.transcription_queue.start(executor=None)
@@ -0,0 +1,64 @@
+import hashlib
+import io
+
+import pytest
+from starlette.datastructures import UploadFile
+
+import ingest
+
+
+@pytest.mark.asyncio
+async def test_spool_upload_hashes_in_chunks(monkeypatch):
+    monkeypatch.setattr(ingest.settings, "SPOOL_CHUNK_SIZE", 7)
+    payload = b"0123456789" * 10
+    path, digest, size = await ingest.spool_upload(UploadFile(io.BytesIO(payload), filename="x.bin"), ".bin")
+    try:
+        assert size == len(payload)
+        assert digest == hashlib.sha256(payload).hexdigest()
+        with open(path, "rb") as f:
+            assert f.read() == payload
+    finally:
+        import os
+        os.remove(path)
+
+
+@pytest.mark.asyncio
+async def test_chunk_writer_blocks_and_marks(mock_db):
+    writer = ingest.ChunkWriter(mock_db, "f1", block_chars=10, batch_size=2)
+    await writer.write("page one text\n", page=1)
+    await writer.write("page two\n", page=2)
+    await writer.close()
+
+    chunks = [c async for c in mock_db["file_chunks"].find({"file_id": "f1"}).sort("seq", 1)]
+    assert [c["seq"] for c in chunks] == [0, 1, 2]
+    assert "".join(c["text"] for c in chunks) == "page one text\npage two\n"
+    assert all(len(c["text"]) <= 10 for c in chunks)
+    assert chunks[0]["pages"] == [{"page": 1, "offset": 0}]
+    assert chunks[1]["pages"] == [{"page": 2, "offset": 14}]
+    assert writer.char_count == 23
+    assert writer.preview == "page one text\npage two\n"
+
+
+@pytest.mark.asyncio
+async def test_load_text_and_segments(mock_db):
+    writer = ingest.ChunkWriter(mock_db, "f2", block_chars=12)
+    segments = [
+        {"start": 0.0, "end": 2.0, "text": " Hello there."},
+        {"start": 2.0, "end": 4.0, "text": " General Kenobi."},
+    ]
+    for text, marks in ingest.iter_segments(segments):
+        await writer.write(text, **marks)
+    await writer.close()
+
+    file_doc = {"_id": "f2", "chunk_count": writer.chunk_count}
+    assert await ingest.load_text(mock_db, file_doc) == "Hello there. General Kenobi."
+    assert await ingest.load_text(mock_db, file_doc, limit=5) == "Hello"
+    bounds, starts, stops = await ingest.load_segments(mock_db, file_doc, 14, 20)
+    assert starts.tolist() == [2.0] and stops.tolist() == [4.0]
+    bounds, starts, _ = await ingest.load_segments(mock_db, file_doc)
+    assert bounds.tolist() == [0, 12, 28] and starts.tolist() == [0.0, 2.0]
+
+    # Pre-chunking documents keep text/segments on the file itself.
+    await mock_db["files"].insert_one({"_id": "old", "text": "legacy", "segments": segments})
+    assert await ingest.load_text(mock_db, {"_id": "old"}) == "legacy"
+    assert (await ingest.load_segments(mock_db, {"_id": "old"}))[0].tolist() == [0, 12, 28]
@@ -0,0 +1,56 @@
+import doc_cache
+import keyword_index
+from keyword_index import KeywordIndex, SentenceSplitter, tokenize
+
+TEXT = (
+    "The pump was serviced in March. "
+    "A valve leaked during the night shift? "
+    "Operators replaced the valve gasket and restarted the pump. "
+    "Nothing else happened. "
+) * 5
+
+
+def test_tokenize_drops_stopwords_and_matches_words():
+    assert tokenize("What is a Valve, and the PUMP?") == ["valve", "pump"]
+
+
+def test_splitter_offsets_across_pieces():
+    splitter = SentenceSplitter()
+    sentences = []
+    for i in range(0, len(TEXT), 7):
+        sentences.extend(splitter.feed(TEXT[i:i + 7]))
+    sentences.extend(splitter.flush())
+    assert len(sentences) == 20
+    for start, end, text in sentences:
+        assert TEXT[start:end] == text
+
+
+def test_search_ranks_whole_word_matches():
+    index = KeywordIndex.build(TEXT)
+    best = index.search("valve gasket", k=3)
+    assert best[0]["text"] == "Operators replaced the valve gasket and restarted the pump."
+    assert TEXT[best[0]["start"]:best[0]["end"]] == best[0]["text"]
+    # ties go to the earliest sentence
+    assert index.search("leaked")[0]["start"] == TEXT.index("A valve leaked")
+    # "a" is a stopword, "pu" is not a word in the text
+    assert index.search("a") == []
+    assert index.search("pu") == []
+
+
+def test_file_index_persisted_and_loaded_lazily(index_dir):
+    keyword_index.build_file_index("doc1", [TEXT[:50], TEXT[50:]])
+    assert (index_dir / "doc1.bm25.npz").exists()
+    assert (index_dir / "doc1.bm25.txt").exists()
+
+    doc_cache.cache.clear()
+    assert keyword_index.load_file_index("missing") is None
+    index = keyword_index.load_file_index("doc1")
+    assert len(index) == 20
+    assert index.search("night shift")[0]["text"] == "A valve leaked during the night shift?"
+
+
+def test_long_unpunctuated_text_is_split():
+    text = "word " * 1000
+    index = KeywordIndex.build(text)
+    assert len(index) > 1
+    assert all(len(index.sentence(i)) <= keyword_index.MAX_SENTENCE_CHARS for i in range(len(index)))
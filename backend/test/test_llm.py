@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import llm
+from llm import LLMClient, StubChain
+from utils import Settings
+
+
+class SlowChain:
+    def __init__(self, delay):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, inputs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return llm.StubMessage("ok")
+
+    async def astream(self, inputs):
+        yield llm.StubMessage("first")
+        await asyncio.sleep(self.delay)
+        yield llm.StubMessage("late")
+
+
+@pytest.mark.asyncio
+async def test_semaphore_caps_concurrency():
+    chain = SlowChain(0.01)
+    client = LLMClient(chain, concurrency=2, timeout=5)
+    results = await asyncio.gather(*(client.ainvoke("ctx", "q") for _ in range(6)))
+    assert results == ["ok"] * 6
+    assert chain.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_timeouts():
+    client = LLMClient(SlowChain(0.5), concurrency=1, timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        await client.ainvoke("ctx", "q")
+
+    tokens = []
+    with pytest.raises(asyncio.TimeoutError):
+        async for token in client.astream("ctx", "q"):
+            tokens.append(token)
+    assert tokens == ["first"]
+
+
+@pytest.mark.asyncio
+async def test_stub_stream_matches_invoke():
+    client = LLMClient(StubChain(latency_ms=1), concurrency=1, timeout=5)
+    full = await client.ainvoke("Pumps move water. Valves stop it.", "q")
+    streamed = "".join([t async for t in client.astream("Pumps move water. Valves stop it.", "q")])
+    assert full == streamed == "According to the file, Pumps move water."
+
+
+def test_create_client_provider_selection():
+    config = Settings()
+    config.LLM_PROVIDER = "stub"
+    assert isinstance(llm.create_client(config).chain, StubChain)
+
+    config.LLM_PROVIDER = "none"
+    assert llm.create_client(config) is None
+
+    config.LLM_PROVIDER = ""
+    config.GROQ_API_KEY = ""
+    assert llm.create_client(config) is None
@@ -0,0 +1,56 @@
+import pytest
+from httpx import AsyncClient
+
+import metrics
+from main import app
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1))
+    metrics._registry.remove(hist)
+    hist.observe(0.05, "a")
+    hist.observe(0.5, "a")
+    hist.observe(5, "a")
+    lines = list(hist.render())
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="a"} 5.55' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+
+
+def test_timer_records_on_error():
+    before = metrics.STAGES.count("test_failing_stage")
+    with pytest.raises(ValueError):
+        with metrics.timer("test_failing_stage"):
+            raise ValueError
+    assert metrics.STAGES.count("test_failing_stage") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient, override_auth):
+    inserted = await app.database["files"].insert_one(
+        {"owner": "test@example.com", "filename": "notes.pdf", "type": "pdf", "status": "done", "text": "The budget review starts in March."}
+    )
+    file_id = str(inserted.inserted_id)
+    fallbacks = metrics.FALLBACKS.values.get(("no_llm",), 0)
+    scorings = metrics.STAGES.count("offline_scoring")
+    retrievals = metrics.STAGES.count("retrieval")
+
+    response = await client.post("/chat/", json={"question": "When does the budget review start?", "file_id": file_id})
+    assert response.status_code == 200
+    await client.get(f"/files/{file_id}/status")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    # Routes are labelled by template, not by the id in the path.
+    assert 'http_request_duration_seconds_count{method="POST",route="/chat/",status="200"}' in body
+    assert 'route="/files/{file_id}/status",status="200"' in body
+    assert file_id not in body
+    assert metrics.FALLBACKS.values[("no_llm",)] == fallbacks + 1
+    # Offline mode: the keyword index answers, no retrieval for a prompt.
+    assert metrics.STAGES.count("offline_scoring") == scorings + 1
+    assert metrics.STAGES.count("retrieval") == retrievals
+    assert 'documind_stage_duration_seconds_count{stage="offline_scoring"}' in body
@@ -0,0 +1,50 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+import pdf_extract
+
+
+def fake_reader(texts):
+    pages = []
+    for text in texts:
+        page = MagicMock()
+        page.extract_text.return_value = text
+        pages.append(page)
+    reader = MagicMock()
+    reader.pages = pages
+    return reader
+
+
+async def collect(db, sha256):
+    return [item async for item in pdf_extract.iter_pages(db, "doc.pdf", sha256)]
+
+
+@pytest.mark.asyncio
+async def test_pages_in_order_across_ranges(mock_db, monkeypatch):
+    monkeypatch.setattr(pdf_extract.settings, "PDF_PAGES_PER_TASK", 3)
+    texts = [f"page {i}" for i in range(1, 11)]
+    texts[4] = ""  # blank page is skipped but keeps numbering
+
+    with patch("pdf_extract.PdfReader", return_value=fake_reader(texts)):
+        pages = await collect(mock_db, "abc")
+
+    assert [marks["page"] for _, marks in pages] == [1, 2, 3, 4, 6, 7, 8, 9, 10]
+    assert pages[0] == ("page 1\n", {"page": 1})
+    assert await mock_db["pdf_pages"].count_documents({"sha256": "abc"}) == 10
+
+
+@pytest.mark.asyncio
+async def test_cached_pages_skip_extraction(mock_db, monkeypatch):
+    monkeypatch.setattr(pdf_extract.settings, "PDF_PAGES_PER_TASK", 2)
+    texts = ["one", "two", "three"]
+
+    with patch("pdf_extract.PdfReader", return_value=fake_reader(texts)):
+        first = await collect(mock_db, "same")
+
+    reader = fake_reader(texts)
+    with patch("pdf_extract.PdfReader", return_value=reader):
+        second = await collect(mock_db, "same")
+
+    assert first == second
+    for page in reader.pages:
+        page.extract_text.assert_not_called()
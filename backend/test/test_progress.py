@@ -0,0 +1,123 @@
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from httpx import AsyncClient
+
+import ingest
+import pdf_extract
+import progress
+import routers.files
+import vad
+import whisper_model
+from test.test_pdf_extract import fake_reader
+from test.test_vad import RATE, silence, speech, write_wav
+
+
+@pytest.fixture
+def long_recording(tmp_path, monkeypatch):
+    path = tmp_path / "talk.wav"
+    write_wav(path, np.concatenate([speech(4), silence(1), speech(4), silence(1), speech(4)]))
+    monkeypatch.setattr(vad.settings, "TRANSCRIBE_CHUNK_SECONDS", 4)
+    monkeypatch.setattr(routers.files.settings, "TRANSCRIBE_CHUNK_SECONDS", 4)
+    return path.read_bytes()
+
+
+def chunk_model(fail_first: bool = False):
+    model = MagicMock()
+    lock = threading.Lock()
+    calls = []
+
+    def transcribe(audio, fp16=False):
+        with lock:
+            calls.append(len(audio))
+            failing = fail_first and len(calls) == 1
+        if failing:
+            raise RuntimeError("worker died")
+        return {"segments": [{"start": 0.0, "end": len(audio) / RATE, "text": " Part."}]}
+
+    model.transcribe.side_effect = transcribe
+    return model, calls
+
+
+async def upload(client, data: bytes):
+    response = await client.post("/files/upload", files={"file": ("talk.wav", data, "audio/wav")})
+    await routers.files.transcription_queue.join()
+    return (await client.get(f"/files/{response.json()['file_id']}/status")).json()
+
+
+@pytest.mark.asyncio
+async def test_failed_transcription_resumes_from_checkpoints(client: AsyncClient, mock_db, override_auth, long_recording):
+    model, calls = chunk_model(fail_first=True)
+    with patch.object(whisper_model.manager, "model", model):
+        status = await upload(client, long_recording)
+    assert status["status"] == "failed"
+    assert "worker died" in status["error"]
+    # The other chunks finished and were kept; nothing half-written stays behind.
+    assert status["progress"] == {"stage": "transcribing", "done": 2, "total": 3}
+    assert await mock_db["audio_chunks"].count_documents({}) == 2
+    assert await mock_db["file_chunks"].count_documents({}) == 0
+
+    model, calls = chunk_model()
+    with patch.object(whisper_model.manager, "model", model):
+        status = await upload(client, long_recording)
+    assert status["status"] == "done"
+    assert len(calls) == 1  # only the chunk that failed
+    _, starts, _ = await ingest.load_segments(mock_db, await mock_db["files"].find_one({"status": "done"}))
+    assert starts.tolist() == [0.0, pytest.approx(4.5, abs=0.05), pytest.approx(9.5, abs=0.05)]
+    assert await mock_db["audio_chunks"].count_documents({}) == 0
+
+
+@pytest.mark.asyncio
+async def test_pdf_progress_and_stream(client: AsyncClient, mock_db, override_auth, monkeypatch):
+    import pdf_extract
+    monkeypatch.setattr(pdf_extract.settings, "PDF_PAGES_PER_TASK", 2)
+    with patch("pdf_extract.PdfReader", return_value=fake_reader(["One.", "Two.", "Three."])):
+        response = await client.post("/files/upload", files={"file": ("doc.pdf", b"%PDF-1.4", "application/pdf")})
+    file_id = response.json()["file_id"]
+
+    status = (await client.get(f"/files/{file_id}/status")).json()
+    assert status["progress"] == {"stage": "extracting", "done": 3, "total": 3}
+
+    response = await client.get(f"/files/{file_id}/progress")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+    assert events == ["event: progress", "event: done"]
+    assert '"total": 3' in response.text
+
+    other = await mock_db["files"].insert_one({"owner": "someone@example.com", "filename": "x.pdf", "status": "done"})
+    assert (await client.get(f"/files/{other.inserted_id}/progress")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_stream_ends_when_job_stalls(client: AsyncClient, mock_db, override_auth, monkeypatch):
+    import progress
+    monkeypatch.setattr(progress.settings, "PROGRESS_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(progress.settings, "PROGRESS_IDLE_SECONDS", 0.05)
+    # Orphaned by a worker that died mid-job.
+    stuck = await mock_db["files"].insert_one({
+        "owner": "test@example.com", "filename": "a.mp3", "status": "processing",
+        "progress": {"stage": "transcribing", "done": 1, "total": 4},
+    })
+
+    response = await client.get(f"/files/{stuck.inserted_id}/progress")
+    events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+    assert events == ["event: progress", "event: error"]
+    assert "No progress" in response.text
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_are_dated_for_expiry(mock_db):
+    # The TTL index on `created_at` drops checkpoints of uploads never retried.
+    await progress.save_chunk(mock_db, "s1", {"start": 0.0, "end": 4.0}, [])
+    first = (await mock_db["audio_chunks"].find_one({"sha256": "s1"}))["created_at"]
+    await progress.save_chunk(mock_db, "s1", {"start": 0.0, "end": 4.0}, [{"start": 0.0, "end": 1.0, "text": " Hi."}])
+    assert isinstance(first, datetime)
+    assert (await mock_db["audio_chunks"].find_one({"sha256": "s1"}))["created_at"] == first
+
+    await pdf_extract._store(mock_db, "s2", 0, ["Page one.", "Page two."])
+    async for page in mock_db["pdf_pages"].find({"sha256": "s2"}):
+        assert isinstance(page["created_at"], datetime)
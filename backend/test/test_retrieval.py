@@ -0,0 +1,148 @@
+import os
+import tracemalloc
+
+import pytest
+
+import doc_cache
+import keyword_index
+import retrieval
+import routers.chat
+from retrieval import VectorIndex, iter_chunks, build_file_index, load_file_index
+
+TEXT = (
+    "The quarterly report covers revenue growth in Europe. "
+    "Shipping delays affected the Asian market in March. "
+    "Our pipeline UI tool allows users to drag nodes between stages. "
+) * 20
+
+
+def test_chunks_cover_text_with_offsets():
+    chunks = list(iter_chunks(TEXT, size=200, overlap=50))
+    assert len(chunks) > 1
+    for start, end, text in chunks:
+        assert TEXT[start:end] == text
+        assert len(text) <= 200
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(TEXT)
+    # consecutive chunks overlap or touch, so no text is lost
+    for (_, prev_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert start <= prev_end
+
+
+def test_chunks_from_pieces_match_single_string():
+    pieces = [TEXT[i:i + 37] for i in range(0, len(TEXT), 37)]
+    assert list(iter_chunks(pieces, size=200, overlap=50)) == list(iter_chunks(TEXT, size=200, overlap=50))
+
+
+def test_search_returns_relevant_chunk():
+    docs = "Cats purr when happy. " * 30 + "The reactor coolant pump failed at noon. " + "Dogs bark at strangers. " * 30
+    index = VectorIndex.build(docs)
+    hits = index.search("why did the coolant pump fail", k=2)
+    assert hits
+    assert "coolant pump" in hits[0]["text"]
+    assert index.search("zebra xylophone") == []
+
+
+def test_file_index_persisted_and_loaded(index_dir):
+    build_file_index("abc123", TEXT)
+    assert (index_dir / "abc123.faiss").exists()
+    assert (index_dir / "abc123.chunks").exists()
+
+    doc_cache.cache.clear()
+    index = load_file_index("abc123")
+    assert index is not None
+    assert "pipeline UI" in index.search("pipeline UI tool")[0]["text"]
+    assert load_file_index("missing") is None
+
+
+def test_index_builder_matches_batch_build(index_dir):
+    prefix = str(index_dir / "streamed")
+    builder = retrieval.IndexBuilder(prefix, batch_size=3)
+    for i in range(0, len(TEXT), 100):
+        builder.feed(TEXT[i:i + 100])
+    builder.finish()
+
+    streamed = VectorIndex.load(prefix)
+    built = VectorIndex.build(TEXT)
+    assert list(streamed.chunks) == built.chunks
+    assert streamed.search("shipping delays")[0]["text"] == built.search("shipping delays")[0]["text"]
+
+
+FILLER = [
+    "What the team was doing for the year is what it was meant to do, and that is the plan.",
+    "It was the case that the total of the work for the year was what they had in mind.",
+    "The meeting was about what is next for the group, and it is what the board asked for.",
+    "There is a view that the year was good for the staff and that it was the right time.",
+    "What is the goal of the quarter is a question that was raised by the managers again.",
+]
+
+
+def test_stopwords_do_not_decide_retrieval(index_dir):
+    paragraphs = [" ".join(FILLER[(i + j) % len(FILLER)] for j in range(3)) for i in range(400)]
+    paragraphs.insert(200, "Revenue reached 5 million dollars.")
+    text = "\n".join(paragraphs)
+
+    index = VectorIndex.build(text)
+    sentences = keyword_index.KeywordIndex.build(text, str(index_dir / "filler"))
+    assert len(index) > 24
+    for question in ["What was the revenue?", "What is the total revenue for the year?"]:
+        assert "Revenue reached" in index.search(question, k=4)[0]["text"]
+        fused = retrieval.fuse(index.search(question, k=24), sentences.search(question, k=24))
+        assert any("Revenue reached" in hit["text"] for hit in fused[:2])
+
+
+def test_fuse_boosts_chunks_holding_keyword_hits():
+    chunks = [{"score": 0.9, "start": 0, "end": 100, "text": "a"}, {"score": 0.8, "start": 100, "end": 200, "text": "b"}]
+    sentences = [{"score": 7.0, "start": 120, "end": 140, "text": "b1"}, {"score": 3.0, "start": 300, "end": 320, "text": "c1"}]
+    fused = retrieval.fuse(chunks, sentences, k=60)
+    assert [hit["text"] for hit in fused] == ["b", "a", "c1"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+
+
+@pytest.mark.asyncio
+async def test_index_from_older_embedding_is_rebuilt(index_dir, mock_db):
+    doc = {"_id": "stale", "filename": "report.pdf", "text": TEXT}
+    await mock_db["files"].insert_one(doc)
+    build_file_index("stale", TEXT)
+    chunks = index_dir / "stale.chunks"
+    lines = chunks.read_text().splitlines(keepends=True)
+    chunks.write_text('{"dim": %d}\n' % retrieval.settings.EMBED_DIM + "".join(lines[1:]))
+    doc_cache.cache.clear()
+    assert load_file_index("stale") is None
+
+    # The first chat about it rebuilds the index and writes it back, for every worker.
+    index = await routers.chat.chunk_index(mock_db, doc)
+    assert "pipeline UI" in index.search("pipeline UI tool")[0]["text"]
+    doc_cache.cache.clear()
+    assert load_file_index("stale").mapped
+
+
+def test_index_builder_memory_stays_flat(index_dir):
+    prefix = str(index_dir / "large")
+    piece = TEXT[:1000]
+    size = 2 * 1024 * 1024
+    tracemalloc.start()
+    try:
+        builder = retrieval.IndexBuilder(prefix, batch_size=64)
+        for _ in range(size // len(piece)):
+            builder.feed(piece)
+        builder.finish()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    vectors = os.path.getsize(prefix + ".faiss")
+    assert vectors > 4 * size  # 4 KB of float32 per ~1 KB chunk...
+    assert peak < size / 2  # ...only one batch of which is ever in memory
+
+    # Loaded, neither the vectors nor the chunk text are held in memory.
+    tracemalloc.start()
+    try:
+        index = VectorIndex.load(prefix)
+        assert "pipeline UI" in index.search("pipeline UI tool")[0]["text"]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert index.mapped and index.index.ntotal == len(index.chunks)
+    assert index.nbytes < size / 50
+    assert peak < size / 4
@@ -0,0 +1,19 @@
+import import_profile
+
+
+def test_app_import_within_budget():
+    result = import_profile.profile("main")
+    assert result["eager"] == [], import_profile.report(result)
+    assert result["seconds"] <= import_profile.settings.IMPORT_TIME_BUDGET_SECONDS, import_profile.report(result)
+
+
+def test_parse_importtime_rows():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   numpy.core\n"
+        "import time:       300 |        420 | numpy\n"
+    )
+    assert import_profile.parse(output) == [
+        {"module": "numpy.core", "self_us": 120, "cumulative_us": 120, "depth": 1},
+        {"module": "numpy", "self_us": 300, "cumulative_us": 420, "depth": 0},
+    ]
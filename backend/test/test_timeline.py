@@ -0,0 +1,69 @@
+import bson
+import pytest
+
+import doc_cache
+import ingest
+import timeline
+from timeline import SegmentMap
+
+SEGMENTS = [
+    {"start": 0.0, "end": 4.0, "text": " Welcome back."},
+    {"start": 4.0, "end": 9.5, "text": " Today we review the"},
+    {"start": 9.5, "end": 12.0, "text": " quarterly budget."},
+    {"start": 75.0, "end": 80.0, "text": " Thanks for listening."},
+]
+TRANSCRIPT = "".join(text for text, _ in ingest.iter_segments(SEGMENTS))
+
+
+def test_lookup_returns_every_overlapping_segment():
+    segmap = SegmentMap.from_pieces(ingest.iter_segments(SEGMENTS))
+    start = TRANSCRIPT.index("Today")
+    end = TRANSCRIPT.index("budget.") + len("budget.")
+    assert segmap.lookup(start, end) == [(4.0, 9.5), (9.5, 12.0)]
+    assert segmap.span(start, end) == (4.0, 12.0)
+    assert segmap.lookup(TRANSCRIPT.index("Thanks")) == [(75.0, 80.0)]
+    assert segmap.lookup(0) == [(0.0, 4.0)]
+    assert segmap.span(len(TRANSCRIPT) + 10) is None
+
+
+def test_columnar_round_trip():
+    segmap = SegmentMap.from_pieces(ingest.iter_segments(SEGMENTS))
+    doc = segmap.to_doc()
+    assert all(isinstance(column, bytes) for column in doc.values())
+    assert len(doc["bounds"]) == 8 * 5 and len(doc["starts"]) == len(doc["stops"]) == 4 * 4
+
+    loaded = SegmentMap.from_doc(doc)
+    assert not loaded.bounds.flags.owndata  # a view of the stored bytes
+    assert loaded.lookup(0, len(TRANSCRIPT)) == segmap.lookup(0, len(TRANSCRIPT))
+    assert len(SegmentMap.from_doc(SegmentMap().to_doc())) == 0
+
+
+def test_reads_list_maps():
+    segmap = SegmentMap.from_pieces(ingest.iter_segments(SEGMENTS))
+    bounds = segmap.bounds.tolist()
+    legacy = {"offsets": bounds[:-1], "ends": bounds[1:], "starts": [s["start"] for s in SEGMENTS], "stops": [s["end"] for s in SEGMENTS]}
+    assert SegmentMap.from_doc(legacy).to_doc() == segmap.to_doc()
+
+
+def test_columns_much_smaller_than_segment_dicts():
+    segments = [
+        {"start": i * 4.2, "end": i * 4.2 + 4.2, "text": " A sentence of about average length.",
+         "tokens": list(range(12)), "avg_logprob": -0.2, "compression_ratio": 1.4, "no_speech_prob": 0.01}
+        for i in range(3000)
+    ]
+    as_dicts = len(bson.encode({"segments": segments}))
+    columnar = len(bson.encode(SegmentMap.from_pieces(ingest.iter_segments(segments)).to_doc()))
+    assert columnar * 10 < as_dicts
+
+
+@pytest.mark.asyncio
+async def test_load_backfills_legacy_file(mock_db):
+    result = await mock_db["files"].insert_one({"filename": "old.mp3", "type": "audio", "text": TRANSCRIPT, "segments": SEGMENTS})
+    doc = await mock_db["files"].find_one({"_id": result.inserted_id})
+
+    segmap = await timeline.load(mock_db, doc)
+    assert segmap.span(TRANSCRIPT.index("Thanks")) == (75.0, 80.0)
+    assert await mock_db[timeline.MAPS].find_one({"_id": result.inserted_id})
+
+    doc_cache.cache.clear()
+    assert (await timeline.load(mock_db, doc)).to_doc() == segmap.to_doc()
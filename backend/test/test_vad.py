@@ -0,0 +1,121 @@
+import wave
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from httpx import AsyncClient
+
+import ingest
+import routers.files
+import vad
+import whisper_model
+
+RATE = vad.SAMPLE_RATE
+
+
+def speech(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return 0.3 * np.sin(2 * np.pi * 220 * t)
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.random.default_rng(0).normal(0, 0.001, int(seconds * RATE))
+
+
+def to_int16(signal: np.ndarray) -> np.ndarray:
+    return (signal * 32767).astype(np.int16)
+
+
+def write_wav(path, signal: np.ndarray):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(to_int16(signal).tobytes())
+
+
+def test_silences_found_between_speech():
+    signal = np.concatenate([speech(2), silence(1), speech(2), silence(0.1), speech(1)])
+    # Uneven blocks: frames straddle block boundaries.
+    pcm = to_int16(signal)
+    levels = vad.frame_levels(np.array_split(pcm, 7))
+    assert len(levels) == pytest.approx(len(pcm) / vad.FRAME, abs=1)
+
+    pauses = vad.silences(levels, min_silence=0.3)
+    assert len(pauses) == 1  # the 0.1 s gap is too short
+    start, end = pauses[0]
+    assert start == pytest.approx(2.0, abs=0.05)
+    assert end == pytest.approx(3.0, abs=0.05)
+
+
+def test_plan_cuts_in_pause_nearest_target():
+    chunks = vad.plan_chunks(100, [(20.0, 21.0), (34.0, 35.0), (52.0, 53.0)], chunk_seconds=30, overlap=1)
+    assert chunks[0] == {"start": 0.0, "end": 34.5, "keep_start": 0.0, "keep_end": 34.5}
+    assert chunks[1]["start"] == chunks[1]["keep_start"] == 34.5
+    assert chunks[-1]["end"] == chunks[-1]["keep_end"] == 100
+
+
+def test_plan_hard_cut_overlaps():
+    chunks = vad.plan_chunks(70, [], chunk_seconds=30, overlap=1)
+    assert chunks == [
+        {"start": 0.0, "end": 31.0, "keep_start": 0.0, "keep_end": 30.0},
+        {"start": 29.0, "end": 70, "keep_start": 30.0, "keep_end": 70},
+    ]
+
+
+def test_merge_shifts_and_dedups_overlap():
+    chunks = vad.plan_chunks(70, [], chunk_seconds=30, overlap=1)
+    results = [
+        [{"start": 0.0, "end": 28.5, "text": " one"}, {"start": 28.5, "end": 31.0, "text": " two"}],
+        # The second chunk starts at 29 s and hears "two" again.
+        [{"start": 0.0, "end": 1.5, "text": " two"}, {"start": 2.0, "end": 41.0, "text": " three"}],
+    ]
+    merged = vad.merge(chunks, results)
+    assert [seg["text"] for seg in merged] == [" one", " two", " three"]
+    assert merged[-1] == {"start": 31.0, "end": 70.0, "text": " three"}
+
+
+def test_decode_wav_range(tmp_path):
+    path = tmp_path / "a.wav"
+    write_wav(path, np.concatenate([speech(1), silence(1)]))
+    assert len(vad.decode(str(path))) == 2 * RATE
+    part = vad.decode(str(path), 0.5, 1.5)
+    assert len(part) == RATE
+    assert np.abs(part[: RATE // 2]).max() > 0.2 > np.abs(part[RATE // 2:]).max()
+
+
+def test_plan_file_skips_short_recordings(tmp_path, monkeypatch):
+    path = tmp_path / "a.wav"
+    write_wav(path, np.concatenate([speech(2), silence(1), speech(2)]))
+    monkeypatch.setattr(vad.settings, "TRANSCRIBE_CHUNK_SECONDS", 10)
+    assert vad.plan_file(str(path)) is None
+    monkeypatch.setattr(vad.settings, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    assert [c["end"] for c in vad.plan_file(str(path))][0] == pytest.approx(2.5, abs=0.05)
+
+
+@pytest.mark.asyncio
+async def test_long_upload_transcribed_in_chunks(client: AsyncClient, mock_db, override_auth, tmp_path, monkeypatch):
+    path = tmp_path / "talk.wav"
+    write_wav(path, np.concatenate([speech(4), silence(1), speech(4), silence(1), speech(4)]))
+    monkeypatch.setattr(vad.settings, "TRANSCRIBE_CHUNK_SECONDS", 4)
+    monkeypatch.setattr(routers.files.settings, "TRANSCRIBE_CHUNK_SECONDS", 4)
+
+    model = MagicMock()
+
+    def transcribe(audio, fp16=False):
+        # Every chunk is decoded in the worker and sees its own clock.
+        return {"segments": [{"start": 0.0, "end": len(audio) / RATE, "text": " Part."}]}
+
+    model.transcribe.side_effect = transcribe
+    with patch.object(whisper_model.manager, "model", model):
+        response = await client.post("/files/upload", files={"file": ("talk.wav", path.read_bytes(), "audio/wav")})
+        await routers.files.transcription_queue.join()
+
+    assert model.transcribe.call_count == 3
+    status = (await client.get(f"/files/{response.json()['file_id']}/status")).json()
+    assert status["status"] == "done"
+    bounds, starts, stops = await ingest.load_segments(mock_db, await mock_db["files"].find_one({}))
+    assert bounds.tolist() == [0, len("Part."), len("Part. Part."), len("Part. Part. Part.")]
+    assert starts[0] == 0.0
+    assert starts[1] == pytest.approx(4.5, abs=0.05)
+    assert stops[2] == pytest.approx(14.0, abs=0.05)
@@ -0,0 +1,131 @@
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from httpx import AsyncClient
+
+import vad
+import whisper_model
+from whisper_model import ModelManager
+
+SEGMENTS = {"segments": [{"start": 0.0, "end": 1.5, "text": " Hello there.", "tokens": [1, 2]}]}
+
+
+def test_model_loads_lazily_once(monkeypatch):
+    # Whisper is imported by the first transcription, not by importing the app.
+    whisper = MagicMock()
+    monkeypatch.setitem(sys.modules, "whisper", whisper)
+    manager = ModelManager("tiny", threads=0)
+    assert not manager.loaded
+    assert manager.info()["load_seconds"] is None
+
+    whisper.load_model.return_value.transcribe.return_value = SEGMENTS
+    assert manager.transcribe("a.wav") == [{"start": 0.0, "end": 1.5, "text": " Hello there."}]
+    manager.transcribe("b.wav")
+    whisper.load_model.assert_called_once_with("tiny")
+
+    info = manager.info()
+    assert info["loaded"] and info["model"] == "tiny"
+    assert info["load_seconds"] >= 0
+    assert info["rss_bytes"] > 0
+
+
+def test_rss_without_procfs_or_resource(monkeypatch):
+    # Windows: neither /proc nor the resource module.
+    def no_procfs(*args, **kwargs):
+        raise OSError("no /proc")
+
+    monkeypatch.setattr(whisper_model, "open", no_procfs, raising=False)
+    assert whisper_model.rss_bytes() > 0
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert whisper_model.rss_bytes() == 0
+
+
+def start_server(tmp_path, monkeypatch, workers=1):
+    address = str(tmp_path / "whisper.sock")
+    monkeypatch.setattr(whisper_model.settings, "WHISPER_SERVER", address)
+    monkeypatch.setattr(whisper_model.settings, "WHISPER_SERVER_KEY", "whisper-secret")
+    threading.Thread(target=whisper_model.serve, kwargs={"workers": workers}, daemon=True).start()
+    for _ in range(100):
+        if (tmp_path / "whisper.sock").exists():
+            break
+        time.sleep(0.01)
+
+
+def write_wav(path, seconds):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(vad.SAMPLE_RATE)
+        w.writeframes(np.full(int(seconds * vad.SAMPLE_RATE), 1000, dtype=np.int16).tobytes())
+    return str(path)
+
+
+def test_shared_server_round_trip(tmp_path, monkeypatch):
+    model = MagicMock()
+    model.transcribe.return_value = SEGMENTS
+    monkeypatch.setattr(whisper_model.manager, "model", model)
+    start_server(tmp_path, monkeypatch)
+    clip = write_wav(tmp_path / "clip.wav", 3.0)
+
+    assert whisper_model.transcribe(clip)[0]["text"] == " Hello there."
+    # The server gets the samples, not a path it would have to be able to open.
+    audio = model.transcribe.call_args[0][0]
+    assert isinstance(audio, np.ndarray) and len(audio) == 3 * vad.SAMPLE_RATE
+    assert audio[0] == pytest.approx(1000 / 32768)
+
+    whisper_model.transcribe(clip, 1.0, 2.5)
+    assert len(model.transcribe.call_args[0][0]) == int(1.5 * vad.SAMPLE_RATE)
+    assert whisper_model.info()["loaded"] is True
+    assert whisper_model.warm()["copies"] == 1
+
+    model.transcribe.side_effect = RuntimeError("bad audio")
+    with pytest.raises(RuntimeError, match="bad audio"):
+        whisper_model.transcribe(clip)
+
+
+def test_server_transcribes_concurrently_with_lazy_copies(tmp_path, monkeypatch):
+    # Two transcriptions only get past the barrier if they run at the same time.
+    barrier = threading.Barrier(2, timeout=5)
+
+    def transcribe(audio, fp16=False):
+        barrier.wait()
+        return SEGMENTS
+
+    def load(self):
+        self.model = MagicMock(transcribe=transcribe)
+
+    monkeypatch.setattr(ModelManager, "_load", load)
+    monkeypatch.setattr(whisper_model.manager, "model", None)
+    start_server(tmp_path, monkeypatch, workers=2)
+    clip = write_wav(tmp_path / "clip.wav", 1.0)
+    assert whisper_model.info()["loaded_copies"] == 1
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda _: whisper_model.transcribe(clip), range(2)))
+    assert all(r[0]["text"] == " Hello there." for r in results)
+    info = whisper_model.info()
+    assert info["copies"] == 2 and info["loaded_copies"] == 2 and info["busy"] == 0
+
+
+def test_server_requires_its_own_key(monkeypatch):
+    monkeypatch.setattr(whisper_model.settings, "WHISPER_SERVER", "127.0.0.1:8765")
+    monkeypatch.setattr(whisper_model.settings, "WHISPER_SERVER_KEY", "")
+    with pytest.raises(RuntimeError, match="WHISPER_SERVER_KEY"):
+        whisper_model.check_config()
+    with pytest.raises(SystemExit, match="WHISPER_SERVER_KEY"):
+        whisper_model.serve()
+
+
+@pytest.mark.asyncio
+async def test_transcriber_endpoint(client: AsyncClient, override_auth):
+    with patch.object(whisper_model.manager, "model", MagicMock()):
+        info = (await client.get("/files/transcriber")).json()
+    assert info["loaded"] is True
+    assert info["model"] == whisper_model.settings.WHISPER_MODEL
+    assert info["queue_depth"] == 0
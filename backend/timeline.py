@@ -0,0 +1,102 @@
+import numpy as np
+
+import doc_cache
+import ingest
+from utils import Settings
+
+settings = Settings()
+
+MAPS = "segment_maps"
+
+
+class SegmentMap:
+    """
+    Sorted character intervals of a transcript, one per Whisper segment,
+    with the segment's start/end time. Segments tile the transcript in
+    order, so n segments are n + 1 char bounds, and the segments under any
+    char span are found by binary search. Held as NumPy columns and stored
+    as their raw buffers (`ingest.pack_segments`), so loading one from
+    Mongo parses no per-segment values at all.
+    """
+
+    def __init__(self, bounds=(), starts=(), stops=()):
+        # Arrays already of these dtypes, such as views of stored buffers, are not copied.
+        self.bounds = np.asarray(bounds, dtype="<i8")  # segment i is chars [bounds[i], bounds[i + 1])
+        self.starts = np.asarray(starts, dtype="<f4")  # seconds
+        self.stops = np.asarray(stops, dtype="<f4")    # seconds
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def nbytes(self) -> int:
+        return self.bounds.nbytes + self.starts.nbytes + self.stops.nbytes
+
+    @classmethod
+    def from_pieces(cls, pieces):
+        """Build from `ingest.iter_segments` output, the same text the transcript is made of."""
+        bounds, starts, stops = [0], [], []
+        for text, marks in pieces:
+            seg = marks["segment"]
+            bounds.append(bounds[-1] + len(text))
+            starts.append(seg["start"])
+            stops.append(seg["end"])
+        return cls(bounds if starts else (), starts, stops)
+
+    @classmethod
+    def from_doc(cls, doc):
+        if "bounds" in doc:
+            return cls(*ingest.unpack_segments(doc))
+        # Maps saved before columnar storage: four lists, offsets and ends separate.
+        bounds = doc["offsets"] + doc["ends"][-1:]
+        return cls(bounds, doc["starts"], doc["stops"])
+
+    def lookup(self, start: int, end: int = None):
+        """
+        Every segment overlapping the char span [start, end), as
+        (start, end) times in transcript order. O(log n) to locate.
+        """
+        if not len(self):
+            return []
+        end = start + 1 if end is None else max(end, start + 1)
+        first = max(int(np.searchsorted(self.bounds, start, side="right")) - 1, 0)
+        last = min(int(np.searchsorted(self.bounds, end, side="left")), len(self))
+        return [
+            (float(self.starts[i]), float(self.stops[i]))
+            for i in range(first, last)
+            if self.bounds[i + 1] > start
+        ]
+
+    def span(self, start: int, end: int = None):
+        """(start, end) time covered by a char span, or None outside the transcript."""
+        times = self.lookup(start, end)
+        return (times[0][0], times[-1][1]) if times else None
+
+    def to_doc(self) -> dict:
+        return ingest.pack_segments(self.bounds, self.starts, self.stops)
+
+
+async def save(db, file_id, segmap: SegmentMap, version: str = ""):
+    await db[MAPS].replace_one({"_id": file_id}, segmap.to_doc(), upsert=True)
+    doc_cache.cache.put("segments", file_id, segmap, version)
+
+
+async def load(db, file_doc) -> SegmentMap:
+    """
+    The file's segment map, from the per-worker cache or Mongo. Files
+    transcribed before maps existed get one built from their stored
+    segments and saved, so this happens once per file.
+    """
+    key = ingest.content_key(file_doc)
+    version = doc_cache.version_of(file_doc)
+    segmap = doc_cache.cache.get("segments", key, version)
+    if segmap is not None:
+        return segmap
+
+    doc = await db[MAPS].find_one({"_id": key})
+    if doc:
+        return doc_cache.cache.put("segments", key, SegmentMap.from_doc(doc), version)
+
+    segmap = SegmentMap(*await ingest.load_segments(db, file_doc))
+    await save(db, key, segmap, version)
+    return segmap
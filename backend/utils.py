@@ -4,6 +4,13 @@ from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import asyncio
+import json
+import threading
+import time
+import os
 
 class Settings(BaseSettings):
 
@@ -12,7 +19,113 @@ class Settings(BaseSettings):
     JWT_SECRET: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int 
     GROQ_API_KEY: str 
-    REDIS_URL: str = "redis://redis:6379" 
+    REDIS_URL: str = "redis://redis:6379"
+
+    # Password hashing (Argon2id). Changing these rehashes passwords at next login.
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536   # KiB per hash
+    ARGON2_PARALLELISM: int = 4
+    HASH_WORKERS: int = 4             # concurrent hashes; bounds CPU and memory_cost x workers of RAM
+
+    # Verified JWTs kept per worker until they expire
+    TOKEN_CACHE_SIZE: int = 4096
+
+    # Retrieval index (built at upload time, one per file)
+    INDEX_DIR: str = "indexes"
+    CHUNK_SIZE: int = 1000
+    CHUNK_OVERLAP: int = 200
+    EMBED_DIM: int = 1024
+    RETRIEVAL_TOP_K: int = 4
+    RETRIEVAL_RRF_K: int = 60        # rank fusion constant for vector + BM25 hits
+    INDEX_CACHE_SIZE: int = 64                    # prepared states per worker; a file has up to four
+    DOC_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # their estimated total size
+    DOC_CACHE_RESUBSCRIBE_SECONDS: float = 1.0    # wait before re-joining the invalidation feed
+
+    # Whisper model
+    WHISPER_MODEL: str = "base"      # or "stub" for an offline fake (see WHISPER_STUB_RTF)
+    WHISPER_THREADS: int = 0         # torch intra-op threads; 0 = torch default
+    WHISPER_WARMUP: bool = True      # load in the background at startup, not on the first upload
+    WHISPER_SERVER: str = ""         # host:port or socket path of a shared `python -m whisper_model serve`
+    WHISPER_SERVER_KEY: str = ""     # connection auth key; required with WHISPER_SERVER, never JWT_SECRET
+    WHISPER_SERVER_WORKERS: int = 1  # model copies the server transcribes with concurrently
+    WHISPER_STUB_RTF: float = 0.05   # CPU seconds per audio second for the stub model
+    FFMPEG_DIR: str = ""             # directory holding ffmpeg when it is not on PATH
+
+    # Background transcription
+    TRANSCRIBE_EXECUTOR: str = "process"  # "process" or "thread"
+    TRANSCRIBE_WORKERS: int = 2
+    TRANSCRIBE_QUEUE_SIZE: int = 16
+    TRANSCRIBE_CHUNK_SECONDS: float = 120.0  # long audio is split near this length; 0 = never split
+    TRANSCRIBE_MIN_SILENCE: float = 0.3      # shortest pause worth cutting at
+    TRANSCRIBE_OVERLAP_SECONDS: float = 1.0  # overlap around cuts made without a pause
+
+    # Streaming ingestion
+    SPOOL_CHUNK_SIZE: int = 1024 * 1024
+    STORE_BLOCK_CHARS: int = 256 * 1024
+    STORE_BATCH_SIZE: int = 16
+    PREVIEW_CHARS: int = 300
+
+    # PDF extraction
+    PDF_WORKERS: int = os.cpu_count() or 1
+    PDF_PAGES_PER_TASK: int = 25
+
+    # Batch uploads (POST /files/batch)
+    BATCH_MAX_FILES: int = 5000
+    BATCH_MAX_BYTES: int = 2 * 1024 ** 3   # after unpacking archives
+    BATCH_PDF_CONCURRENCY: int = 4         # PDFs extracted and indexed at once; audio uses TRANSCRIBE_WORKERS
+
+    # Content-addressed upload cache (0 = unlimited)
+    CONTENT_CACHE_MAX_ENTRIES: int = 0
+    CONTENT_CACHE_MAX_BYTES: int = 0
+    CONTENT_CACHE_MAX_AGE_DAYS: int = 30
+    CHECKPOINT_MAX_AGE_DAYS: int = 7   # PDF page and audio chunk checkpoints of uploads never finished
+
+    # Chat answer cache (Redis)
+    ANSWER_CACHE_TTL: int = 3600
+    ANSWER_CACHE_SEMANTIC: bool = False
+    ANSWER_CACHE_SIMILARITY: float = 0.9
+    ANSWER_CACHE_EMBED_DIM: int = 256
+    ANSWER_CACHE_MAX_QUESTIONS: int = 100
+
+    # LLM client
+    LLM_PROVIDER: str = ""  # "groq", "stub" or "none"; empty = groq if GROQ_API_KEY is set
+    LLM_MODEL: str = "llama-3.3-70b-versatile"
+    LLM_TIMEOUT: float = 30.0
+    LLM_CONCURRENCY: int = 8
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_STUB_LATENCY_MS: int = 200
+
+    # Prompt context: best-ranked chunks packed into a token budget
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_CANDIDATES: int = 24
+    LLM_TOKENIZER: str = "cl100k_base"  # tiktoken encoding; "" = approximate counts
+    TOKENIZER_LOAD_TIMEOUT: float = 10.0  # seconds to wait at startup for its download
+
+    # Chat scope
+    CHAT_MAX_FILES: int = 20
+
+    # Admission control: per-user token buckets and global slots, shared in
+    # Redis (enforced per worker while Redis is down)
+    ADMISSION_CONTROL: bool = True
+    CHAT_BUCKET_SIZE: float = 5                 # questions in a burst
+    CHAT_REFILL_PER_SECOND: float = 5 / 60
+    UPLOAD_BUCKET_SIZE: float = 2048            # cost units: a MiB of PDF, or see below per audio minute
+    UPLOAD_REFILL_PER_SECOND: float = 2.0
+    UPLOAD_AUDIO_COST_PER_MINUTE: float = 10.0
+    LLM_GLOBAL_SLOTS: int = 32                  # LLM calls in flight across all workers
+    TRANSCRIBE_GLOBAL_SLOTS: int = 64           # audio files queued or transcribing across all workers
+    SLOT_POLL_SECONDS: float = 1.0              # how often batch jobs retry for a free slot
+
+    # Audio answers: timestamps for up to this many occurrences of the answer sentence
+    TIMESTAMP_MAX_MATCHES: int = 5
+
+    # How often GET /files/{id}/progress checks on a running job
+    PROGRESS_POLL_SECONDS: float = 0.5
+    PROGRESS_IDLE_SECONDS: float = 900      # end the stream when status and progress stand still this long
+    PROGRESS_MAX_SECONDS: float = 4 * 3600  # and after this long in any case
+
+    # Startup: `import main` must finish within this (see `python -m import_profile`)
+    IMPORT_TIME_BUDGET_SECONDS: float = 3.0
 
     class Config:
         env_file = ".env"
@@ -20,20 +133,89 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated ="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated ="auto",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl = "/auth/token")
 
+# Argon2 is deliberately slow and releases the GIL: run it on a few
+# dedicated threads so logins neither block the event loop nor take over
+# the default pool that file and index work shares.
+hash_executor = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix="argon2")
+
 def get_password_hash(password:str) ->str:
     return pwd_context.hash(password)
 
 def verify_password(plain_pwd:str, hashed_pwd:str)->bool:
     return pwd_context.verify(plain_pwd,hashed_pwd)
 
+async def hash_password(password: str) -> str:
+    """`get_password_hash` on the hashing pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, pwd_context.hash, password)
+
+async def check_password(plain_pwd: str, hashed_pwd: str):
+    """
+    Verify on the hashing pool. Returns (valid, new_hash); new_hash is set
+    when the stored hash uses outdated Argon2 parameters and should be replaced.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, pwd_context.verify_and_update, plain_pwd, hashed_pwd)
+
+
+class TokenCache:
+    """
+    LRU of verified tokens -> subject, each entry dropped once its `exp`
+    passes, so a hot token skips signature checks and JSON decoding
+    without ever outliving its validity.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            email, exp = entry
+            if exp <= time.time():
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+            return email
+
+    def put(self, token: str, email: str, exp: float):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self.entries[token] = (email, exp)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
+
 async def get_current_user(token:str = Depends(oauth2_scheme)):
     """
       Dependency to extract and verify JWT, returning user info.
     """
 
+    email = token_cache.get(token)
+    if email is not None:
+        return {"email": email}
+
     credentials_exception = HTTPException(
         status_code = 401,
         detail = "Could not validate credentials",
@@ -46,8 +228,14 @@ async def get_current_user(token:str = Depends(oauth2_scheme)):
             raise JWTError()
     except JWTError:
             raise credentials_exception
+    if "exp" in payload:
+        token_cache.put(token, email, payload["exp"])
     return {"email":email}
 
+def sse(event: str, data) -> str:
+    """One Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 def create_access_token(data: dict, expires_delta: int = None):
     """
     Create JWT token for given data payload (sub, exp).
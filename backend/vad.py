@@ -0,0 +1,192 @@
+"""
+Silence-based splitting of long recordings for parallel transcription.
+
+A cheap energy VAD finds pauses; the recording is cut in the pause nearest
+every TRANSCRIBE_CHUNK_SECONDS, or hard-cut with a small overlap when
+there is none. Each chunk is transcribed on its own and `merge` puts the
+segments back on the recording's timeline.
+"""
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+from utils import Settings
+
+settings = Settings()
+
+SAMPLE_RATE = 16000                 # what Whisper resamples everything to
+FRAME = 480                         # 30 ms analysis frames
+FRAME_SECONDS = FRAME / SAMPLE_RATE
+READ_BYTES = 1 << 20
+
+
+def _is_native_wav(path: str) -> bool:
+    # 16 kHz mono 16-bit WAV can be read directly, without an ffmpeg process.
+    try:
+        with wave.open(path, "rb") as w:
+            return (w.getframerate(), w.getnchannels(), w.getsampwidth()) == (SAMPLE_RATE, 1, 2)
+    except (wave.Error, EOFError, OSError):
+        return False
+
+
+def _ffmpeg(path: str, start: float = None, end: float = None):
+    binary = os.path.join(settings.FFMPEG_DIR, "ffmpeg") if settings.FFMPEG_DIR else "ffmpeg"
+    cmd = [binary, "-nostdin", "-loglevel", "error"]
+    if start:
+        cmd += ["-ss", f"{start:.3f}"]
+    cmd += ["-i", path]
+    if end is not None:
+        cmd += ["-t", f"{end - (start or 0):.3f}"]
+    return cmd + ["-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-"]
+
+
+def iter_pcm(path: str, start: float = None, end: float = None):
+    """
+    Yield the recording, or its [start, end) range in seconds, as 16 kHz
+    mono int16 blocks, never all at once.
+    """
+    if _is_native_wav(path):
+        with wave.open(path, "rb") as w:
+            first = min(int((start or 0) * SAMPLE_RATE), w.getnframes())
+            remaining = w.getnframes() - first if end is None else int((end - (start or 0)) * SAMPLE_RATE)
+            w.setpos(first)
+            while remaining > 0:
+                block = w.readframes(min(READ_BYTES // 2, remaining))
+                if not block:
+                    return
+                remaining -= len(block) // 2
+                yield np.frombuffer(block, dtype=np.int16)
+        return
+
+    proc = subprocess.Popen(_ffmpeg(path, start, end), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        leftover = b""
+        while True:
+            block = proc.stdout.read(READ_BYTES)
+            if not block:
+                break
+            block = leftover + block
+            cut = len(block) - len(block) % 2
+            leftover = block[cut:]
+            yield np.frombuffer(block[:cut], dtype=np.int16)
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode(errors="replace")
+        proc.stderr.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.strip()}")
+
+
+def decode(path: str, start: float = None, end: float = None) -> np.ndarray:
+    """[start, end) of the recording, in seconds, as float32 samples in [-1, 1]."""
+    if _is_native_wav(path):
+        with wave.open(path, "rb") as w:
+            first = int((start or 0) * SAMPLE_RATE)
+            count = w.getnframes() - first if end is None else int((end - (start or 0)) * SAMPLE_RATE)
+            w.setpos(min(first, w.getnframes()))
+            samples = np.frombuffer(w.readframes(count), dtype=np.int16)
+    else:
+        out = subprocess.run(_ffmpeg(path, start, end), capture_output=True, check=True).stdout
+        samples = np.frombuffer(out, dtype=np.int16)
+    return samples.astype(np.float32) / 32768.0
+
+
+def frame_levels(blocks) -> np.ndarray:
+    """Loudness of every 30 ms frame in dBFS, from int16 (or float) sample blocks."""
+    levels = []
+    carry = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        samples = block.astype(np.float32)
+        if block.dtype == np.int16:
+            samples /= 32768.0
+        samples = np.concatenate([carry, samples])
+        usable = len(samples) - len(samples) % FRAME
+        frames = samples[:usable].reshape(-1, FRAME)
+        levels.append(10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10))
+        carry = samples[usable:]
+    if len(carry):
+        levels.append(10 * np.log10(np.array([np.mean(carry * carry)]) + 1e-10))
+    return np.concatenate(levels) if levels else np.zeros(0)
+
+
+def silences(levels: np.ndarray, min_silence: float) -> list:
+    """
+    (start, end) seconds of pauses at least `min_silence` long. Silence is
+    10 dB above the recording's noise floor, and never louder than -30 dBFS.
+    """
+    if not len(levels):
+        return []
+    threshold = min(float(np.percentile(levels, 10)) + 10.0, -30.0)
+    quiet = np.concatenate([[False], levels < threshold, [False]])
+    edges = np.flatnonzero(np.diff(quiet.astype(np.int8)))
+    min_frames = max(int(min_silence / FRAME_SECONDS), 1)
+    return [
+        (float(start * FRAME_SECONDS), float(end * FRAME_SECONDS))
+        for start, end in zip(edges[::2], edges[1::2])
+        if end - start >= min_frames
+    ]
+
+
+def plan_chunks(duration: float, pauses: list, chunk_seconds: float, overlap: float) -> list:
+    """
+    Split [0, duration) into chunks of roughly `chunk_seconds`, cutting in
+    the middle of the pause nearest the target, looking between 0.5x and
+    1.5x of it. With
+    no pause in range the cut is hard and both sides overlap it by
+    `overlap` seconds. Each chunk is a dict with the audio range to
+    transcribe (`start`, `end`) and the range whose segments it owns
+    (`keep_start`, `keep_end`).
+    """
+    chunks = []
+    pos = 0.0
+    audio_start = 0.0
+    while duration - pos > chunk_seconds * 1.5:
+        low, high = pos + chunk_seconds * 0.5, pos + chunk_seconds * 1.5
+        inside = [(s, e) for s, e in pauses if s >= low and e <= high]
+        if inside:
+            s, e = min(inside, key=lambda p: (abs((p[0] + p[1]) / 2 - pos - chunk_seconds), p[0] - p[1]))
+            cut = (s + e) / 2
+            chunks.append({"start": audio_start, "end": cut, "keep_start": pos, "keep_end": cut})
+            audio_start = cut
+        else:
+            cut = pos + chunk_seconds
+            chunks.append({"start": audio_start, "end": min(cut + overlap, duration), "keep_start": pos, "keep_end": cut})
+            audio_start = cut - overlap
+        pos = cut
+    chunks.append({"start": audio_start, "end": duration, "keep_start": pos, "keep_end": duration})
+    return chunks
+
+
+def plan_file(path: str):
+    """
+    Chunk plan for a recording, or None when it is short enough (or cannot
+    be decoded here) and should be transcribed in one call.
+    Blocking: run it off the event loop.
+    """
+    levels = frame_levels(iter_pcm(path))
+    duration = len(levels) * FRAME_SECONDS
+    chunk_seconds = settings.TRANSCRIBE_CHUNK_SECONDS
+    if duration <= chunk_seconds * 1.5:
+        return None
+    pauses = silences(levels, settings.TRANSCRIBE_MIN_SILENCE)
+    return plan_chunks(duration, pauses, chunk_seconds, settings.TRANSCRIBE_OVERLAP_SECONDS)
+
+
+def merge(chunks: list, results: list) -> list:
+    """
+    Shift each chunk's segments onto the recording's timeline and keep a
+    segment only in the chunk that owns its midpoint, so speech in an
+    overlap is not transcribed twice.
+    """
+    merged = []
+    for chunk, segments in zip(chunks, results):
+        for seg in segments:
+            start = round(seg["start"] + chunk["start"], 3)
+            end = round(seg["end"] + chunk["start"], 3)
+            if chunk["keep_start"] <= (start + end) / 2 < chunk["keep_end"] or (
+                chunk is chunks[-1] and (start + end) / 2 >= chunk["keep_end"]
+            ):
+                merged.append({"start": start, "end": end, "text": seg["text"]})
+    return merged
@@ -0,0 +1,305 @@
+"""
+Whisper model lifecycle.
+
+The model is loaded lazily, once per process, by `manager`. In the app it
+lives in the transcription executor's worker process(es), warmed up from
+the lifespan hook, so web workers never hold a copy. With WHISPER_SERVER
+set, every web worker talks to a single shared inference process instead:
+
+    python -m whisper_model serve          # listens on WHISPER_SERVER
+
+Web workers then load no model at all. They decode the audio themselves
+and stream it to the server as 16 kHz PCM, so the server needs neither
+the uploads' files nor ffmpeg, and may run on another host. The server
+keeps WHISPER_SERVER_WORKERS model copies and runs that many
+transcriptions at once.
+"""
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import vad
+from utils import Settings
+
+settings = Settings()
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        # Unix only; the API itself must still import on Windows.
+        import resource
+    except ImportError:
+        return 0
+    # No procfs (macOS): peak RSS is the closest we get; reported in bytes there.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ModelManager:
+    """
+    Owns this process's Whisper model: loads it on first use (or on an
+    explicit warm-up), applies the configured size and thread count, and
+    records how long the load took and how much memory it added.
+    Inference is serialised: one resident model, one transcription at a time.
+    """
+
+    def __init__(self, size: str = None, threads: int = None):
+        self.size = size or settings.WHISPER_MODEL
+        self.threads = settings.WHISPER_THREADS if threads is None else threads
+        self.model = None
+        self.load_seconds = None
+        self.load_rss_bytes = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def get(self):
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    self._load()
+        return self.model
+
+    def _load(self):
+        if self.size == "stub":
+            self.model = StubWhisper(settings.WHISPER_STUB_RTF)
+            self.load_seconds = 0.0
+            self.load_rss_bytes = 0
+            return
+
+        if settings.FFMPEG_DIR:
+            # Whisper decodes audio by running `ffmpeg` from PATH.
+            os.environ["PATH"] = settings.FFMPEG_DIR + os.pathsep + os.environ.get("PATH", "")
+        import whisper
+
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+
+        before = rss_bytes()
+        start = time.perf_counter()
+        model = whisper.load_model(self.size)
+        self.load_seconds = round(time.perf_counter() - start, 3)
+        self.load_rss_bytes = max(rss_bytes() - before, 0)
+        self.model = model
+        print(f"Whisper model '{self.size}' loaded in {self.load_seconds}s (+{self.load_rss_bytes >> 20} MiB RSS, pid {os.getpid()})")
+
+    def transcribe(self, path: str, start: float = None, end: float = None) -> list:
+        """
+        Segments of the recording, or of its [start, end) range in seconds;
+        a range's timestamps are relative to `start`.
+        """
+        audio = path if start is None and end is None else vad.decode(path, start, end)
+        return self.transcribe_audio(audio)
+
+    def transcribe_audio(self, audio) -> list:
+        """Segments of a file path or of float32 16 kHz samples."""
+        model = self.get()
+        with self._lock:
+            result = model.transcribe(audio, fp16=False)
+        # Only the segment fields we use leave the inference process.
+        return [
+            {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+            for seg in result.get("segments", [])
+        ]
+
+    def info(self) -> dict:
+        return {
+            "model": self.size,
+            "threads": self.threads or None,
+            "loaded": self.loaded,
+            "load_seconds": self.load_seconds,
+            "load_rss_bytes": self.load_rss_bytes,
+            "rss_bytes": rss_bytes(),
+            "pid": os.getpid(),
+        }
+
+
+class StubWhisper:
+    """
+    Offline stand-in for a Whisper model (WHISPER_MODEL=stub): burns
+    `rtf` seconds of CPU per second of audio and emits a segment every
+    five seconds, so the pipeline can be exercised and timed without
+    torch or model weights.
+    """
+
+    def __init__(self, rtf: float):
+        self.rtf = rtf
+
+    def transcribe(self, audio, fp16: bool = False):
+        if isinstance(audio, str):
+            audio = vad.decode(audio)
+        duration = len(audio) / vad.SAMPLE_RATE
+        deadline = time.process_time() + duration * self.rtf
+        while time.process_time() < deadline:
+            pass
+        segments = []
+        for i, start in enumerate(range(0, int(duration) + 1, 5)):
+            end = min(start + 5, duration)
+            if end > start:
+                segments.append({"start": float(start), "end": float(end), "text": f" Stub segment {i}."})
+        return {"segments": segments}
+
+
+manager = ModelManager()
+
+
+class ModelPool:
+    """
+    The inference server's model copies, `manager` first. A transcription
+    borrows a free copy for its duration, so up to `size` run at once and
+    the rest wait. The copy returned last is lent first, so extra copies
+    are only loaded once requests actually overlap.
+    """
+
+    def __init__(self, size: int):
+        self.copies = [manager] + [ModelManager() for _ in range(max(size, 1) - 1)]
+        self._free = queue.LifoQueue()
+        for copy in reversed(self.copies):
+            self._free.put(copy)
+
+    @contextmanager
+    def borrow(self):
+        copy = self._free.get()
+        try:
+            yield copy
+        finally:
+            self._free.put(copy)
+
+    def info(self) -> dict:
+        return {
+            **manager.info(),
+            "copies": len(self.copies),
+            "loaded_copies": sum(copy.loaded for copy in self.copies),
+            "busy": len(self.copies) - self._free.qsize(),
+        }
+
+
+# Module-level entry points: these are what executors pickle and call in
+# their worker process, where they use that process's `manager`.
+
+def warm() -> dict:
+    if settings.WHISPER_SERVER:
+        # The server holds the models; a web worker never loads one.
+        return _call({"op": "info"})
+    manager.get()
+    return manager.info()
+
+
+def info() -> dict:
+    if settings.WHISPER_SERVER:
+        return _call({"op": "info"})
+    return manager.info()
+
+
+def transcribe(path: str, start: float = None, end: float = None) -> list:
+    if settings.WHISPER_SERVER:
+        return _call({"op": "transcribe"}, vad.iter_pcm(path, start, end))
+    return manager.transcribe(path, start, end)
+
+
+def _address(value: str):
+    # "host:port" for TCP, anything else is a Unix socket path.
+    host, sep, port = value.rpartition(":")
+    return (host or "127.0.0.1", int(port)) if sep and port.isdigit() else value
+
+
+def _authkey() -> bytes:
+    # A secret of its own: the server may run on another host, and one
+    # holding JWT_SECRET could sign tokens for any user.
+    if not settings.WHISPER_SERVER_KEY:
+        raise RuntimeError("WHISPER_SERVER_KEY must be set to use a Whisper server")
+    return settings.WHISPER_SERVER_KEY.encode("utf-8")
+
+
+def check_config():
+    """Fail fast, at startup, on a Whisper server configured without its key."""
+    if settings.WHISPER_SERVER:
+        _authkey()
+
+
+def _call(request: dict, blocks=None):
+    """
+    One blocking round trip to the shared inference server. `blocks`, if
+    given, are int16 PCM blocks streamed after the request and ended by
+    an empty message.
+    """
+    with Client(_address(settings.WHISPER_SERVER), authkey=_authkey()) as conn:
+        conn.send(request)
+        if blocks is not None:
+            for block in blocks:
+                if len(block):
+                    conn.send_bytes(block)
+            conn.send_bytes(b"")
+        reply = conn.recv()
+    if not reply["ok"]:
+        raise RuntimeError(f"Whisper server: {reply['error']}")
+    return reply["result"]
+
+
+def _receive_audio(conn) -> np.ndarray:
+    pcm = bytearray()
+    while block := conn.recv_bytes():
+        pcm += block
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _handle(conn, pool: ModelPool):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+                audio = _receive_audio(conn) if request.get("op") == "transcribe" else None
+            except EOFError:
+                return
+            try:
+                if request["op"] == "transcribe":
+                    with pool.borrow() as copy:
+                        result = copy.transcribe_audio(audio)
+                elif request["op"] == "info":
+                    result = pool.info()
+                else:
+                    raise ValueError(f"unknown op {request['op']!r}")
+                conn.send({"ok": True, "result": result})
+            except Exception as e:
+                conn.send({"ok": False, "error": repr(e)})
+
+
+def serve(address: str = None, workers: int = None):
+    """
+    Answer transcription requests from all web workers with `workers`
+    model copies (WHISPER_SERVER_WORKERS). The first copy is loaded up
+    front, the others when concurrent requests first need them.
+    """
+    address = address or settings.WHISPER_SERVER
+    if not address:
+        raise SystemExit("Set WHISPER_SERVER (host:port or socket path) to serve.")
+    if not settings.WHISPER_SERVER_KEY:
+        raise SystemExit("Set WHISPER_SERVER_KEY, the secret web workers connect with, to serve.")
+    pool = ModelPool(workers or settings.WHISPER_SERVER_WORKERS)
+    manager.get()
+    with Listener(_address(address), authkey=_authkey()) as listener:
+        print(f"Whisper server listening on {address} ({len(pool.copies)} model copies)")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_handle, args=(conn, pool), daemon=True).start()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["serve"]:
+        raise SystemExit("usage: python -m whisper_model serve [address]")
+    serve(sys.argv[2] if len(sys.argv) > 2 else None)
@@ -19,6 +19,7 @@ function App() {
 
   const handleUploadSuccess = (data) => {
     setCurrentFile({
+      fileId: data.fileId || null,
       url: data.url || null,
       summary: data.summary || "Summary will appear here after backend implementation.",
       type: data.type || 'unknown'
@@ -97,7 +98,7 @@ function App() {
             </div>
             <div className="lg:col-span-4">
               <div className="sticky top-24">
-                <Chatbot key={currentFile?.url} token={token} onTimestampClick={handleTimestampClick} />
+                <Chatbot key={currentFile?.url} token={token} fileId={currentFile?.fileId} onTimestampClick={handleTimestampClick} />
               </div>
             </div>
           </div>
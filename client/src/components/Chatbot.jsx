@@ -1,8 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
-import axios from 'axios';
 import { Send, Loader2, Play, Bot, User } from 'lucide-react';
 
-function Chatbot({ token, onTimestampClick }) {
+function Chatbot({ token, fileId, onTimestampClick }) {
     const [question, setQuestion] = useState('');
     const [messages, setMessages] = useState([]);
     const [loading, setLoading] = useState(false);
@@ -25,13 +24,41 @@ function Chatbot({ token, onTimestampClick }) {
         setLoading(true);
 
         try {
-            const response = await axios.post(
-                'http://localhost:8000/chat/',
-                { question: userMsg.text },
-                { headers: { Authorization: token } }
-            );
-            const botMsg = { type: 'bot', text: response.data.answer };
-            setMessages(prev => [...prev, botMsg]);
+            // Stream the answer (SSE over POST) so text shows up as it is generated.
+            const response = await fetch('http://localhost:8000/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', Authorization: token },
+                body: JSON.stringify(fileId ? { question: userMsg.text, file_id: fileId } : { question: userMsg.text }),
+            });
+            if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+            setMessages(prev => [...prev, { type: 'bot', text: '' }]);
+            setLoading(false);
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const lines = Object.fromEntries(raw.split('\n').map(line => {
+                        const i = line.indexOf(': ');
+                        return [line.slice(0, i), line.slice(i + 2)];
+                    }));
+                    const data = JSON.parse(lines.data);
+                    setMessages(prev => {
+                        const last = prev[prev.length - 1];
+                        const text = lines.event === 'token' ? last.text + data
+                            : lines.event === 'done' ? data.answer
+                            : last.text;
+                        return [...prev.slice(0, -1), { ...last, text }];
+                    });
+                }
+            }
         } catch (err) {
             console.error(err);
             setMessages(prev => [...prev, { type: 'bot', text: 'Sorry, I encountered an error. Is the backend running?' }]);
@@ -2,6 +2,11 @@ import React, { useState } from 'react';
 import axios from 'axios';
 import { UploadCloud, CheckCircle, AlertCircle, File as FileIcon, Loader2 } from 'lucide-react';
 
+const API_URL = 'http://localhost:8000';
+const POLL_INTERVAL_MS = 2000;
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
 function FileUploader({ token, onUploadSuccess }) {
     const [file, setFile] = useState(null);
     const [status, setStatus] = useState({ type: '', msg: '' });
@@ -44,21 +49,39 @@ function FileUploader({ token, onUploadSuccess }) {
         formData.append('file', file);
 
         try {
-            const response = await axios.post('http://localhost:8000/files/upload', formData, {
+            const response = await axios.post(`${API_URL}/files/upload`, formData, {
                 headers: {
                     'Content-Type': 'multipart/form-data',
                     Authorization: token
                 }
             });
 
+            // Audio/video is transcribed in the background: poll until the job finishes.
+            let result = response.data;
+            while (result.status === 'queued' || result.status === 'processing') {
+                const progress = result.progress;
+                const done = progress && progress.total > 1 ? ` (${progress.done}/${progress.total} chunks)` : '';
+                setStatus({ type: '', msg: result.status === 'queued' ? 'Queued for transcription...' : `Transcribing...${done}` });
+                await sleep(POLL_INTERVAL_MS);
+                const poll = await axios.get(`${API_URL}/files/${result.file_id}/status`, {
+                    headers: { Authorization: token }
+                });
+                result = poll.data;
+            }
+            if (result.status === 'failed') {
+                setStatus({ type: 'error', msg: `Processing failed: ${result.error}. Upload it again to resume.` });
+                return;
+            }
+
             setStatus({ type: 'success', msg: 'Ready to chat!' });
 
             if (onUploadSuccess) {
                 onUploadSuccess({
+                    fileId: result.file_id,
                     filename: file.name,
                     type: file.name.split('.').pop().toLowerCase(),
                     url: URL.createObjectURL(file),
-                    summary: response.data.summary,
+                    summary: result.summary,
                 });
             }
 
@@ -139,9 +162,9 @@ function FileUploader({ token, onUploadSuccess }) {
                 </div>
 
                 {status.msg && (
-                    <div className={`mt-4 flex items-center text-sm font-medium animate-in fade-in slide-in-from-top-2 ${status.type === 'success' ? 'text-green-400' : 'text-red-400'
+                    <div className={`mt-4 flex items-center text-sm font-medium animate-in fade-in slide-in-from-top-2 ${status.type === 'success' ? 'text-green-400' : status.type === 'error' ? 'text-red-400' : 'text-slate-400'
                         }`}>
-                        {status.type === 'success' ? <CheckCircle size={16} className="mr-2" /> : <AlertCircle size={16} className="mr-2" />}
+                        {status.type === 'success' ? <CheckCircle size={16} className="mr-2" /> : status.type === 'error' ? <AlertCircle size={16} className="mr-2" /> : <Loader2 size={16} className="animate-spin mr-2" />}
                         {status.msg}
                     </div>
                 )}